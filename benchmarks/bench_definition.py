@@ -0,0 +1,99 @@
+"""Benchmark parsing a large serverless definition.
+
+Compares ``yaml.safe_load`` with ``parse_definition`` on a generated
+definition with many functions and CloudFormation resources, reading only
+the sections the helper needs.
+
+Run from the repository root:
+    python -m benchmarks.bench_definition [number_of_resources]
+"""
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+import yaml
+
+from eb7_sls_helper.src.utils.definition import parse_definition
+
+HEADER = """service: bench
+provider:
+  name: aws
+  runtime: python3.8
+  stage: dev
+  region: eu-central-1
+custom:
+  newmanCollection: collection
+  newmanEnvironment:
+    dev: environment
+functions:
+"""
+
+FUNCTION = """  fn{0}:
+    handler: handler.fn{0}
+    events:
+      - http:
+          path: items/{0}
+          method: get
+"""
+
+RESOURCE = """    Table{0}:
+      Type: AWS::DynamoDB::Table
+      Properties:
+        TableName: bench-table-{0}
+        BillingMode: PAY_PER_REQUEST
+        AttributeDefinitions:
+          - AttributeName: id
+            AttributeType: S
+        KeySchema:
+          - AttributeName: id
+            KeyType: HASH
+        Tags:
+          - Key: owner
+            Value: bench
+"""
+
+
+def write_fixture(path: Path, size: int) -> None:
+    """Writes a definition with size functions and resources."""
+    parts = [HEADER]
+    parts.extend(FUNCTION.format(i) for i in range(size))
+    parts.append("resources:\n  Resources:\n")
+    parts.extend(RESOURCE.format(i) for i in range(size))
+    path.write_text("".join(parts))
+
+
+def read_safe_load(path: Path) -> None:
+    """Reads the needed sections via yaml.safe_load."""
+    with open(path) as file:
+        document = yaml.safe_load(file)
+    document["service"]
+    document["provider"]["name"]
+    document["custom"]["newmanEnvironment"]
+
+
+def read_parse_definition(path: Path) -> None:
+    """Reads the needed sections via parse_definition."""
+    document = parse_definition(path)
+    document["service"]
+    document["provider"]["name"]
+    document["custom"]["newmanEnvironment"]
+
+
+def main(size: int) -> None:
+    """Runs the benchmark."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, "serverless.yml")
+        write_fixture(path, size)
+        print(f"fixture: {size} functions/resources, {path.stat().st_size} bytes")
+        print(f"libyaml: {yaml.__with_libyaml__}")
+        for name, func in (
+            ("yaml.safe_load", read_safe_load),
+            ("parse_definition", read_parse_definition),
+        ):
+            best = min(timeit.repeat(lambda: func(path), number=1, repeat=5))
+            print(f"{name:>18}: {best * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
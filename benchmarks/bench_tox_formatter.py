@@ -0,0 +1,133 @@
+"""Benchmark formatting a large tox log.
+
+Compares the previous multi-pass formatter (regex splitting over the whole
+log, lowercasing each line per keyword group) with the single-pass
+``format_logs`` on a generated log with many installation and test lines.
+The legacy regexes backtrack over the whole log, so its time grows much
+faster than linearly; keep the size moderate.
+
+Afterwards, ``format_logs`` alone is timed on logs of one and several
+environments at one and four times the size, which should take about four
+times as long, and on a log made only of near-miss section markers.
+
+Run from the repository root:
+    python -m benchmarks.bench_tox_formatter [number_of_tests]
+"""
+import re
+import sys
+import timeit
+from typing import Callable, List, Tuple
+
+from eb7_sls_helper.src.utils.tox_formatter import format_logs
+
+INSTALL = (
+    "Collecting package-{0}==1.0.{0}\n"
+    "  Downloading package-{0}-1.0.{0}-py3-none-any.whl (128 kB)\n"
+    "Requirement already satisfied: six in ./.tox/py38/lib/python3.8\n"
+)
+TEST = "test/test_module.py::TestCase::test_case_{0} {1} [ 50%]\n"
+COVERAGE = "function/src/module_{0}.py 21 7 67% 40-62\n"
+
+
+def make_env_log(size: int, env: str) -> List[str]:
+    """Generates the part of a tox log of one environment."""
+    parts = [f"{env} create: /github/workspace/.tox/{env}\n"]
+    parts.extend(INSTALL.format(i) for i in range(size))
+    parts.append("=" * 29 + " test session starts " + "=" * 30 + "\n")
+    parts.extend(
+        TEST.format(i, "FAILED" if i % 50 == 0 else "PASSED")
+        for i in range(size)
+    )
+    parts.append("-" * 11 + " coverage: platform linux " + "-" * 11 + "\n")
+    parts.extend(COVERAGE.format(i) for i in range(size))
+    parts.append("=" * 30 + f" {size} passed in 3.61s " + "=" * 30 + "\n")
+    return parts
+
+
+def make_log(size: int, envs: Tuple[str, ...] = ("py38",)) -> str:
+    """Generates a tox log with size packages, tests and modules per env."""
+    parts = []
+    for env in envs:
+        parts.extend(make_env_log(size, env))
+    parts.append("_" * 25 + " summary " + "_" * 36 + "\n")
+    parts.extend(f" {env}: commands succeeded\n" for env in envs)
+    parts.append(" congratulations :)\n")
+    return "".join(parts)
+
+
+def best_of(func: Callable[[str], str], text: str) -> float:
+    """Best time of five runs in seconds."""
+    return min(timeit.repeat(lambda: func(text), number=1, repeat=5))
+
+
+def legacy_format_logs(output_logs: str) -> str:  # noqa: C901 # verbatim copy
+    """The multi-pass formatter replaced by format_logs."""
+    output_logs = re.sub(
+        re.compile(r"https:\/\/([a-z0-9]+)@github.com"),
+        "sanitized_url :)",
+        output_logs,
+    )
+    flags = re.DOTALL | re.MULTILINE
+    parts = {
+        "general": output_logs.split("============================= test", 1)[0],
+        "tests": re.findall(
+            "((^=.*test ).*)^.*-- coverage", output_logs, flags
+        )[0][0],
+        "coverage": re.findall(
+            "((^--.*coverage).*?^(_.*summary.*_$))", output_logs, flags
+        )[0][0],
+        "final": output_logs.split(
+            "summary ____________________________________", 1
+        )[1],
+    }
+    for key, value in parts.items():
+        if key == "coverage":
+            continue
+        lines = value.splitlines()
+        for idx, line in enumerate(lines):
+            if any(
+                x in line.lower()
+                for x in ["success", "succeed", "congratulations", "passed"]
+            ):
+                line = "+ " + line
+            elif any(x in line.lower() for x in ["warning:"]):
+                line = "! " + line
+            elif any(x in line.lower() for x in ["error", "fail"]):
+                line = "- " + line
+            lines[idx] = line
+        parts[key] = "\n".join(lines)
+    return "\n".join(parts.values())
+
+
+def main(size: int) -> None:
+    """Runs the benchmark."""
+    text = make_log(size)
+    print(f"log: {text.count(chr(10))} lines, {len(text)} bytes")
+    for name, func in (
+        ("legacy", legacy_format_logs),
+        ("format_logs", format_logs),
+    ):
+        print(f"{name:>12}: {best_of(func, text) * 1000:8.1f} ms")
+
+    # format_logs must stay linear, also for odd logs the legacy one rejects
+    print("format_logs scaling:")
+    cases = (
+        ("1 env", ("py38",)),
+        ("3 envs", ("py38", "py39", "lint")),
+    )
+    for name, envs in cases:
+        for factor in (1, 4):
+            text = make_log(size * factor, envs)
+            seconds = best_of(format_logs, text)
+            rate = len(text) / seconds / 1024 / 1024
+            print(
+                f"{name:>7} x{factor}: {seconds * 1000:8.1f} ms, "
+                f"{rate:6.1f} MB/s"
+            )
+    text = "\n".join(["=" * 80, "-" * 80, "_ summary"] * size * 10)
+    seconds = best_of(format_logs, text)
+    print(f"markers only: {seconds * 1000:8.1f} ms for {len(text)} bytes")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
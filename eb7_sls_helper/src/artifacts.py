@@ -0,0 +1,189 @@
+"""Keeps serverless packages to deploy them again without rebuilding.
+
+``sls package`` output is stored under a key made of the deploy
+fingerprint (see fingerprint), which covers the service's files, its shared
+dependencies, the definition, stage, region and tool versions, and the AWS
+profile and account it is built for. A deploy with the same key uses the
+stored package through
+``sls deploy --package`` instead of installing requirements and zipping
+again, e.g. when a failed deploy is retried or a run is repeated.
+
+An index file maps keys to packages with the service and target they were
+built for and when they were last used. Only the most recently used
+packages are kept; packages an ArtifactCache returned are never removed by
+it, as another thread may still deploy them, so a run with more targets
+than max_packages only evicts them in a later run.
+
+Values serverless resolves from outside the repository while packaging
+(``${ssm:...}``, ``${cf:...}``, ``${s3:...}``) are baked into the package
+but not covered by the fingerprint. Packages of definitions using them are
+only reused for a limited time.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+Index_Entry = Dict[str, Any]  # type: ignore[type-arg, misc]
+
+INDEX_FILE = "index.json"
+MAX_PACKAGES = 64
+# Seconds a package with values resolved from AWS is reused; 0 disables it
+REMOTE_VALUES_TTL = 3600.0
+REMOTE_VARIABLE_REGEX = re.compile(r"\$\{(?:ssm|cf|s3|secretsmanager)[:(]")
+
+
+def uses_remote_values(text: str) -> bool:
+    """Whether a definition resolves values from AWS while packaging.
+
+    Args:
+        text (str): Text of the serverless definition
+
+    Returns:
+        bool: Whether it has ssm, cf, s3 or secretsmanager variables
+    """
+    return REMOTE_VARIABLE_REGEX.search(text) is not None
+
+
+class ArtifactCache(object):
+    """Content-addressed store of serverless packages."""
+
+    def __init__(
+        self,
+        directory: Path,
+        max_packages: int = MAX_PACKAGES,
+        remote_ttl: float = REMOTE_VALUES_TTL,
+    ) -> None:
+        """Constructor of ArtifactCache.
+
+        Args:
+            directory (Path): Directory holding the packages and the index
+            max_packages (int): Number of packages kept; the least recently
+                used ones not returned by this instance are removed.
+                Defaults to MAX_PACKAGES.
+            remote_ttl (float): Seconds a package with values resolved from
+                AWS is reused, 0 to never reuse it. Defaults to
+                REMOTE_VALUES_TTL.
+        """
+        self._directory = Path(directory)
+        self._max_packages = max_packages
+        self._remote_ttl = remote_ttl
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        # Keys of packages returned by this instance, i.e. of the run
+        self._in_use: Set[str] = set()
+
+    def get(self, key: str) -> Optional[Path]:
+        """Looks up the package of a key.
+
+        Args:
+            key (str): Package key, see package
+
+        Returns:
+            Optional[Path]: Package directory, if stored and not expired
+        """
+        entry = self._read_index().get(key)
+        if entry is None:
+            return None
+        if entry.get("remote_values"):
+            age = time.time() - float(entry.get("created", 0))
+            if age >= self._remote_ttl:
+                return None
+        path = self._directory / entry["path"]
+        return path if path.is_dir() else None
+
+    def package(
+        self,
+        key: str,
+        build: Callable[[Path], None],
+        service: str = "",
+        target: str = "",
+        remote_values: bool = False,
+    ) -> Path:
+        """Returns the package of a key, building it if missing.
+
+        Concurrent calls for the same key build it once.
+
+        Args:
+            key (str): Deploy fingerprint combined with the AWS profile and
+                account the package is built with
+            build (Callable[[Path], None]): Writes the package into the
+                given, not yet existing directory
+            service (str): Service name kept in the index. Defaults to "".
+            target (str): Stage and region kept in the index.
+                Defaults to "".
+            remote_values (bool): Whether the package contains values
+                resolved from AWS, see uses_remote_values. Defaults to
+                False.
+
+        Returns:
+            Path: Package directory
+        """
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            path = self.get(key)
+            if path is not None:
+                self._update_index(key, used=time.time())
+                return path
+            path = self._directory / "packages" / key[:32]
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                build(tmp_path)
+                shutil.rmtree(path, ignore_errors=True)
+                tmp_path.replace(path)
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            now = time.time()
+            self._update_index(
+                key,
+                path=path.relative_to(self._directory).as_posix(),
+                created=now,
+                used=now,
+                service=service,
+                target=target,
+                remote_values=remote_values,
+            )
+            return path
+
+    def _read_index(self) -> Dict[str, Index_Entry]:
+        """Reads the index, empty if missing or unreadable."""
+        try:
+            with open(self._directory / INDEX_FILE) as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def _update_index(self, key: str, **fields: object) -> None:
+        """Adds or updates an entry and evicts the least recently used."""
+        with self._lock:
+            self._in_use.add(key)
+            index = self._read_index()
+            index.setdefault(key, {}).update(fields)
+            for evicted in self._evicted(index):
+                entry = index.pop(evicted)
+                shutil.rmtree(self._directory / entry["path"], True)
+            self._directory.mkdir(parents=True, exist_ok=True)
+            path = self._directory / INDEX_FILE
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w") as file:
+                json.dump(index, file, indent=2, sort_keys=True)
+            tmp_path.replace(path)
+
+    def _evicted(self, index: Dict[str, Index_Entry]) -> List[str]:
+        """Keys of the entries beyond max_packages, least recently used.
+
+        Packages of the current run are kept even beyond max_packages.
+        """
+        by_use = sorted(
+            (x for x in index if x not in self._in_use),
+            key=lambda x: index[x].get("used", 0),
+        )
+        return by_use[: max(0, len(index) - self._max_packages)]
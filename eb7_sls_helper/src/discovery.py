@@ -0,0 +1,164 @@
+"""Maps changed files to the serverless definitions they belong to."""
+import os
+from pathlib import PurePosixPath
+from typing import Dict, Iterable, List, Optional, Set
+
+from eb7_sls_helper.src.utils.runner import run_command
+
+# Directories never searched when scanning the tree without git
+SKIPPED_DIRS = frozenset((".git", ".serverless", ".tox", "node_modules"))
+
+
+class DefinitionIndex(object):
+    """Index of all directories containing a serverless definition.
+
+    The index is built once, from ``git ls-files`` or a single tree scan.
+    Lookups walk up the ancestors of a changed path and memoize the result
+    for every directory they pass, so mapping N changed files costs roughly
+    one dictionary lookup per path component overall.
+    """
+
+    def __init__(self, definitions: Iterable[str], fname: str) -> None:
+        """Constructor of DefinitionIndex.
+
+        Args:
+            definitions (Iterable[str]): Paths of all definitions, relative
+                to the repository root
+            fname (str): Filename of the definitions
+        """
+        self._fname = fname
+        self._dirs: Set[str] = {
+            _normalize(str(PurePosixPath(x).parent)) for x in definitions
+        }
+        self._memo: Dict[str, Optional[str]] = {}
+
+    def __len__(self) -> int:
+        """Number of indexed definitions."""
+        return len(self._dirs)
+
+    @property
+    def definitions(self) -> List[str]:
+        """Definitions getter.
+
+        Returns:
+            List[str]: Sorted paths of all indexed definitions
+        """
+        return sorted(self._definition(x) for x in self._dirs)
+
+    @classmethod
+    def build(cls, fname: str, root: str = ".") -> "DefinitionIndex":
+        """Indexes all definitions below root.
+
+        Args:
+            fname (str): Filename of the definitions
+            root (str): Repository root. Defaults to the current directory.
+
+        Returns:
+            DefinitionIndex: The index
+        """
+        definitions = _git_ls_files(fname, root)
+        if definitions is None:
+            definitions = _scan_tree(fname, root)
+        return cls(definitions, fname)
+
+    def find(self, changed_file: str) -> Optional[str]:
+        """Finds the definition closest above a changed file.
+
+        Args:
+            changed_file (str): Path relative to the repository root
+
+        Returns:
+            Optional[str]: Path of the definition, if any
+        """
+        directory = _normalize(str(PurePosixPath(changed_file).parent))
+        visited: List[str] = []
+        found: Optional[str] = None
+        while True:
+            if directory in self._memo:
+                found = self._memo[directory]
+                break
+            visited.append(directory)
+            if directory in self._dirs:
+                found = self._definition(directory)
+                break
+            if directory == "":
+                break
+            directory = _parent(directory)
+        for x in visited:
+            self._memo[x] = found
+        return found
+
+    def discover(self, paths: Iterable[str]) -> List[str]:
+        """Maps changed files to definitions.
+
+        Args:
+            paths (Iterable[str]): Changed files
+
+        Returns:
+            List[str]: Sorted, unique paths of the affected definitions
+        """
+        found = {self.find(x) for x in paths}
+        return sorted(x for x in found if x is not None)
+
+    def _definition(self, directory: str) -> str:
+        return f"{directory}/{self._fname}" if directory else self._fname
+
+
+def _normalize(directory: str) -> str:
+    """Normalizes a relative directory; the root becomes an empty string."""
+    directory = directory.strip("/")
+    while directory.startswith("./"):
+        directory = directory[2:]
+    return "" if directory == "." else directory
+
+
+def _parent(directory: str) -> str:
+    """Parent of a normalized directory."""
+    return directory.rpartition("/")[0]
+
+
+def _git_ls_files(fname: str, root: str) -> Optional[List[str]]:
+    """Lists tracked and untracked, not ignored definitions via git.
+
+    Args:
+        fname (str): Filename of the definitions
+        root (str): Repository root
+
+    Returns:
+        Optional[List[str]]: Definition paths, None if git is unavailable
+    """
+    argv = [
+        "git",
+        "ls-files",
+        "-z",
+        "--cached",
+        "--others",
+        "--exclude-standard",
+    ]
+    try:
+        result = run_command(argv, cwd=root)
+    except OSError:
+        return None
+    if result.return_code:
+        return None
+    files = result.output.decode("utf-8").split("\0")
+    return [x for x in files if PurePosixPath(x).name == fname]
+
+
+def _scan_tree(fname: str, root: str) -> List[str]:
+    """Lists definitions by scanning the tree once.
+
+    Args:
+        fname (str): Filename of the definitions
+        root (str): Repository root
+
+    Returns:
+        List[str]: Definition paths relative to root
+    """
+    definitions = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [x for x in dirnames if x not in SKIPPED_DIRS]
+        if fname in filenames:
+            relative = os.path.relpath(os.path.join(dirpath, fname), root)
+            definitions.append(relative.replace(os.sep, "/"))
+    return definitions
@@ -0,0 +1,285 @@
+"""Detects deployments that would not change anything.
+
+A deploy fingerprint hashes everything that ends up in a deployment: the
+service's files and the shared files it depends on (see impact), the parsed
+definition with the environment variables it references, stage, region and
+the versions of serverless and its plugins. The fingerprint and manifest of
+the last successful deploy are kept in a state store; if the fingerprint
+still matches, the deploy can be skipped. Values resolved from AWS, e.g.
+``${ssm:...}``, are not covered, so definitions using them are deployed
+again once their state is older than REMOTE_VALUES_TTL (see artifacts).
+"""
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from eb7_sls_helper.src.impact import ImpactGraph
+from eb7_sls_helper.src.utils.cache import cache_dir
+from eb7_sls_helper.src.utils.clients import get_client
+from eb7_sls_helper.src.utils.definition import load_definition
+
+State = Dict[str, Any]  # type: ignore[type-arg, misc]
+
+FINGERPRINT_VERSION = "1"
+ENV_VARIABLE_REGEX = re.compile(r"\$\{env:([A-Za-z0-9_]+)")
+# Build, install and test by-products that never end up in a deployment
+SKIPPED_PATTERNS = (
+    ".git",
+    ".serverless",
+    ".tox",
+    "__pycache__",
+    "node_modules",
+    ".requirements*",
+    ".pytest_cache",
+    ".coverage",
+    ".coverage.*",
+    "htmlcov",
+    "reports",
+)
+GLOBAL_NODE_MODULES = ("/usr/lib/node_modules", "/usr/local/lib/node_modules")
+
+
+def deploy_fingerprint(
+    definition: str, stage: str, region: str, root: str = "."
+) -> str:
+    """Computes the fingerprint of deploying a definition.
+
+    Args:
+        definition (str): Path to the serverless definition, relative to root
+        stage (str): Stage of the deployment
+        region (str): Region of the deployment
+        root (str): Repository root. Defaults to the current directory.
+
+    Returns:
+        str: Hex digest of the deployment's inputs
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{FINGERPRINT_VERSION}\0{stage}\0{region}\0".encode())
+    text = (Path(root) / definition).read_text()
+    document = load_definition(Path(root) / definition)
+    rendered = json.dumps(dict(document), sort_keys=True, default=str)
+    digest.update(rendered.encode())
+    for name in sorted(set(ENV_VARIABLE_REGEX.findall(text))):
+        digest.update(f"{name}={os.environ.get(name, '')}\0".encode())
+    plugins = document.get("plugins") or []
+    if isinstance(plugins, dict):  # {"modules": [...], "localPath": ...}
+        plugins = plugins.get("modules") or []
+    service_dir = Path(root, definition).parent
+    for package in ["serverless", *sorted(plugins)]:
+        version = _node_package_version(package, service_dir)
+        digest.update(f"{package}@{version}\0".encode())
+    graph = ImpactGraph.build([definition], root=root)
+    paths = [str(Path(definition).parent), *graph.dependencies[definition]]
+    for path in _expand(paths, root):
+        digest.update(f"{path}\0".encode())
+        content = (Path(root) / path).read_bytes()
+        digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+
+def _expand(patterns: Iterable[str], root: str) -> List[str]:
+    """Lists all files matched by directories, files and glob patterns.
+
+    Args:
+        patterns (Iterable[str]): Root-relative paths or glob patterns
+        root (str): Repository root
+
+    Returns:
+        List[str]: Sorted, root-relative file paths
+    """
+    files = set()
+    for pattern in patterns:
+        matches = glob.glob(os.path.join(root, pattern), recursive=True)
+        for match in matches:
+            if os.path.isdir(match):
+                files.update(_walk(match))
+            elif os.path.isfile(match):
+                files.add(match)
+    return sorted(os.path.relpath(x, root).replace(os.sep, "/") for x in files)
+
+
+def _walk(directory: str) -> List[str]:
+    """Lists the files below a directory, skipping build output."""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [x for x in dirnames if not _skipped(x)]
+        filenames = [x for x in filenames if not _skipped(x)]
+        files += [os.path.join(dirpath, x) for x in filenames]
+    return files
+
+
+def _skipped(name: str) -> bool:
+    """Whether a file or directory name is a by-product."""
+    return any(fnmatch.fnmatchcase(name, x) for x in SKIPPED_PATTERNS)
+
+
+def _node_package_version(package: str, start: Path) -> str:
+    """Finds the installed version of a node package.
+
+    Looks in node_modules of start and its ancestors like node's module
+    resolution, then in the global node_modules.
+
+    Args:
+        package (str): Package name
+        start (Path): Directory to start from
+
+    Returns:
+        str: Version, "unknown" if the package was not found
+    """
+    start = start.resolve()
+    candidates = [x / "node_modules" for x in (start, *start.parents)]
+    node_path = os.environ.get("NODE_PATH", "").split(os.pathsep)
+    candidates += [Path(x) for x in node_path if x]
+    candidates += [Path(x) for x in GLOBAL_NODE_MODULES]
+    for node_modules in candidates:
+        try:
+            with open(node_modules / package / "package.json") as file:
+                return str(json.load(file).get("version", "unknown"))
+        except (OSError, ValueError):
+            continue
+    return "unknown"
+
+
+class LocalStateStore(object):
+    """Keeps deploy state as JSON files in a directory."""
+
+    def __init__(self, directory: Path) -> None:
+        """Constructor of LocalStateStore.
+
+        Args:
+            directory (Path): Directory holding the state files
+        """
+        self._directory = Path(directory)
+
+    def get(self, key: str) -> Optional[State]:
+        """Reads the state of a key.
+
+        Args:
+            key (str): e.g. "service/profile/stage/region"
+
+        Returns:
+            Optional[State]: The state, if stored
+        """
+        try:
+            with open(self._path(key)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, state: State) -> None:
+        """Stores the state of a key.
+
+        Args:
+            key (str): e.g. "service/profile/stage/region"
+            state (State): JSON-serializable state
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(state, file)
+        tmp_path.replace(path)
+
+    def _path(self, key: str) -> Path:
+        return self._directory / f"{key}.json"
+
+
+class S3StateStore(object):
+    """Keeps deploy state as JSON objects in an S3-compatible bucket."""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        client: Optional[object] = None,
+    ) -> None:
+        """Constructor of S3StateStore.
+
+        Args:
+            bucket (str): Bucket name
+            prefix (str): Key prefix of the state objects. Defaults to "".
+            endpoint_url (str, optional): Endpoint of an S3-compatible
+                service, e.g. a local stand-in. Defaults to AWS S3.
+            client (object, optional): boto3 S3 client to use instead of
+                creating one. Defaults to None.
+        """
+        if client is None:
+            client = get_client("s3", endpoint_url=endpoint_url)
+        self._client = client
+        self._bucket = bucket
+        self._prefix = prefix.strip("/")
+
+    def get(self, key: str) -> Optional[State]:
+        """Reads the state of a key.
+
+        Args:
+            key (str): e.g. "service/profile/stage/region"
+
+        Returns:
+            Optional[State]: The state, if stored
+        """
+        try:
+            response = self._client.get_object(  # type: ignore[attr-defined]
+                Bucket=self._bucket, Key=self._key(key)
+            )
+        except Exception as error:  # noqa: B902 # botocore raises many types
+            if _error_code(error) in {"NoSuchKey", "404"}:
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def put(self, key: str, state: State) -> None:
+        """Stores the state of a key.
+
+        Args:
+            key (str): e.g. "service/profile/stage/region"
+            state (State): JSON-serializable state
+        """
+        self._client.put_object(  # type: ignore[attr-defined]
+            Bucket=self._bucket,
+            Key=self._key(key),
+            Body=json.dumps(state).encode(),
+            ContentType="application/json",
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self._prefix}/{key}.json" if self._prefix else f"{key}.json"
+
+
+def _error_code(error: Exception) -> str:
+    """Error code of a botocore ClientError, empty for other errors."""
+    response = getattr(error, "response", None) or {}
+    return str(response.get("Error", {}).get("Code", ""))
+
+
+StateStore = Union[LocalStateStore, S3StateStore]
+
+
+def state_store_from_url(
+    url: str, endpoint_url: Optional[str] = None
+) -> Optional[StateStore]:
+    """Creates the state store configured by the deploy_state input.
+
+    Args:
+        url (str): "" to disable, "s3://bucket/prefix" for S3, or a local
+            directory; "local" uses the helper's cache directory
+        endpoint_url (str, optional): Endpoint of an S3-compatible service.
+            Defaults to None.
+
+    Returns:
+        Optional[StateStore]: The store, None if disabled
+    """
+    if not url:
+        return None
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://") :].partition("/")
+        return S3StateStore(bucket, prefix, endpoint_url)
+    if url == "local":
+        return LocalStateStore(cache_dir("deploy_state"))
+    return LocalStateStore(Path(url))
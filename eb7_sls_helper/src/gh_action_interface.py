@@ -1,18 +1,45 @@
 """Interface for Github Actions pipeline."""
 import os
+import json
 import logging
 import argparse
 import subprocess  # noqa:S404 # Use of sls required
 import sys
-from typing import Tuple, List, Union, Dict, Any
+from typing import Tuple, List, Union, Dict, Any, Optional
 from pathlib import Path
 from collections import defaultdict
+from contextlib import ExitStack
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from eb7_sls_helper.src.artifacts import ArtifactCache
+from eb7_sls_helper.src.discovery import DefinitionIndex
+from eb7_sls_helper.src.fingerprint import StateStore, state_store_from_url
+from eb7_sls_helper.src.impact import ImpactGraph
+from eb7_sls_helper.src.journal import RunJournal
+from eb7_sls_helper.src.newman import NewmanResult, api_key_resolver
+from eb7_sls_helper.src.postman_cache import PostmanCache
+from eb7_sls_helper.src.schedule import DeployGraph
 from eb7_sls_helper.src.sls_function import Lambda
-from eb7_sls_helper.src.utils.tox_formatter import format_tox_output
+from eb7_sls_helper.src.utils.cache import cache_dir
+from eb7_sls_helper.src.utils.clients import close_clients
+from eb7_sls_helper.src.utils.redact import add_secrets
+from eb7_sls_helper.src.utils.runner import (
+    log_sink,
+    run_command,
+    stream_command,
+)
+from eb7_sls_helper.src.utils.tox_env import ToxEnvCache
+from eb7_sls_helper.src.utils.tox_formatter import ToxLogFormatter
+from eb7_sls_helper.src.utils.warm_pool import close_warm_pool, warm_pool
 
 Deployment = Lambda._Deployment
 Endpoints_Dict = Dict[str, List[str]]
 Deployment_Dict = Dict[str, Union[str, Endpoints_Dict]]
+Failures_Dict = Dict[str, str]
+
+DEFAULT_REGION = Deployment.defaults["region"]
+
+log = logging.getLogger()
 
 
 def setup_logging(verbosity: int, base_loglevel: int) -> logging.Logger:
@@ -63,17 +90,40 @@ def get_args() -> Dict[str, Union[str, int]]:
     return {
         "changes": os.environ.get("INPUT_CHANGES", ""),
         "stage": os.environ.get("INPUT_STAGE", ""),
+        "regions": os.environ.get("INPUT_REGIONS", DEFAULT_REGION),
         "profile": os.environ.get("INPUT_PROFILE", ""),
         "validator_path": os.environ.get("INPUT_VALIDATOR_PATH", ""),
         "postman_api_key": os.environ.get("INPUT_POSTMAN_API_KEY", ""),
         "globals_file": os.environ.get("INPUT_GLOBALS_FILE", "globals.json"),
         "log_level": int(os.environ.get("INPUT_LOGLEVEL", 30)),
         "mode": os.environ.get("INPUT_MODE", ""),
-        "aws_key": os.environ.get("INPUT_AWS_ACCESS_KEY_ID", ""),
-        "aws_secret": os.environ.get("INPUT_AWS_SECRET_ACCESS_KEY", ""),
+        "aws_key": os.environ.get("INPUT_AWS_KEY", ""),
+        "aws_secret": os.environ.get("INPUT_AWS_SECRET", ""),
+        "max_parallel": int(os.environ.get("INPUT_MAX_PARALLEL", 1)),
+        "tox_parallel": int(os.environ.get("INPUT_TOX_PARALLEL", 1)),
+        "sls_workers": int(os.environ.get("INPUT_SLS_WORKERS", 0)),
+        "tox_env_cache": os.environ.get("INPUT_TOX_ENV_CACHE", ""),
+        "deploy_state": os.environ.get("INPUT_DEPLOY_STATE", ""),
+        "artifact_cache": os.environ.get("INPUT_ARTIFACT_CACHE", ""),
+        "resume": os.environ.get("INPUT_RESUME", ""),
+        "state_endpoint_url": os.environ.get("INPUT_STATE_ENDPOINT_URL", ""),
+        "postman_cache": os.environ.get("INPUT_POSTMAN_CACHE", ""),
     }
 
 
+def register_secrets(inputs: Dict[str, Union[str, int]]) -> None:
+    """Registers the secret inputs with the redactor of all output.
+
+    Args:
+        inputs (Dict[str, Union[str, int]]): Inputs as read by get_args
+    """
+    add_secrets(
+        str(inputs["postman_api_key"]),
+        str(inputs["aws_key"]),
+        str(inputs["aws_secret"]),
+    )
+
+
 def discover_file(paths: List[str], fname: str) -> List[str]:
     """Searches recursively for specific files in paths provided.
 
@@ -82,17 +132,30 @@ def discover_file(paths: List[str], fname: str) -> List[str]:
         fname (str): Filename to search for
 
     Returns:
-        List[str]: Paths to discovered files
+        List[str]: Sorted paths to discovered files
+    """
+    return DefinitionIndex.build(fname).discover(paths)
+
+
+def select_services(paths: List[str], fname: str) -> List[str]:
+    """Selects the definitions affected by changed files.
+
+    Besides definitions above a changed file, this includes every service
+    whose definition depends on it, e.g. through package patterns, layers
+    or local requirements. See eb7_sls_helper.src.impact.
+
+    Args:
+        paths (List[str]): Changed files
+        fname (str): Filename of the definitions
+
+    Returns:
+        List[str]: Sorted paths to the affected definitions
     """
-    files: List[str] = []
-    for changed_file in paths:
-        filepath = Path(changed_file).parts
-        for i in range(len(filepath)):
-            tmp_path = "/".join(filepath[:-i])
-            if os.path.isfile(f"{tmp_path}/{fname}"):
-                files.append(f"{tmp_path}/{fname}")
-                break
-    return list(set(files))
+    index = DefinitionIndex.build(fname)
+    graph = ImpactGraph.build(
+        index.definitions, cache_dir() / "impact_graph.json"
+    )
+    return graph.affected(paths, index)
 
 
 def set_output(output_name: str, output_value: str) -> None:
@@ -107,11 +170,16 @@ def set_output(output_name: str, output_value: str) -> None:
     print(f"::set-output name={output_name}::{output_value}")
 
 
-def output_endpoints(deployments: List[Deployment_Dict]) -> None:
+def output_endpoints(
+    deployments: List[Deployment_Dict],
+    failures: Optional[Failures_Dict] = None,
+) -> None:
     """Generates human-readible output.
 
     Args:
         deployments (List): Deployed lambda services
+        failures (Dict, optional): Error messages of services that failed
+            to deploy, keyed by definition path. Defaults to None.
     """
     message: str = "The following services were deployed:\n"
     for deployment in deployments:
@@ -130,6 +198,10 @@ def output_endpoints(deployments: List[Deployment_Dict]) -> None:
             + f'--name-query {deployment["stage"]}-{deployment["service"]} '
             + "--include-values`\n\n"
         )
+    if failures:
+        message += "The following services failed to deploy:\n"
+        for service, error in sorted(failures.items()):
+            message += f"`{service}`: {error}\n"
     set_output(f"formatted", message)
 
 
@@ -139,22 +211,22 @@ def set_profile() -> None:
     Raises:
         subprocess.CalledProcessError: Raised if setting up the profile fails. # noqa: DAR402 # false positive
     """
-    cmd = (
-        f"sls config credentials --provider aws"
-        + f" --key {os.environ.get('INPUT_AWS_KEY')}"
-        + f" --secret {os.environ.get('INPUT_AWS_SECRET')}"
-    )
-    process = subprocess.Popen(
-        cmd, stdout=subprocess.PIPE, shell=True  # noqa: S602
-    )  # TODO: Sanitze inputs mark@ebot7.com
-    output, error = process.communicate()
-    return_code = process.wait()
-    if return_code:
-        raise subprocess.CalledProcessError(return_code, cmd)
+    argv = [
+        "sls",
+        "config",
+        "credentials",
+        "--provider",
+        "aws",
+        "--key",
+        str(os.environ.get("INPUT_AWS_KEY")),
+        "--secret",
+        str(os.environ.get("INPUT_AWS_SECRET")),
+    ]
+    run_command(argv, check=True)
     os.environ["AWS_ACCESS_KEY_ID"] = os.environ.get("INPUT_AWS_KEY")
     os.environ["AWS_SECRET_ACCESS_KEY"] = os.environ.get("INPUT_AWS_SECRET")
     os.environ["AWS_SECRET_ACCESS_KEY"] = os.environ.get("INPUT_AWS_SECRET")
-    os.environ["AWS_DEFAULT_REGION"] = "eu-central-1"
+    os.environ["AWS_DEFAULT_REGION"] = DEFAULT_REGION
 
 
 def validate():
@@ -162,42 +234,271 @@ def validate():
     return None
 
 
+def deploy_service(
+    service: str,
+    inputs: Dict[str, Union[str, int]],
+    state: Optional[StateStore] = None,
+    artifacts: Optional[ArtifactCache] = None,
+) -> Deployment_Dict:
+    """Deploys a single sls definition.
+
+    The service is deployed to every region of ``inputs["regions"]`` at
+    the same time.
+
+    Args:
+        service (str): Path to the serverless definition
+        inputs (Dict): Action inputs as returned by get_args
+        state (StateStore, optional): Store of deploy fingerprints used to
+            skip unchanged services. Defaults to None.
+        artifacts (ArtifactCache, optional): Packages reused by services
+            whose deploy fingerprint has not changed. Defaults to None.
+
+    Returns:
+        Deployment_Dict: Service, stage and endpoints deployed in all regions
+    """
+    current_fn = Lambda(service)
+
+    assert isinstance(inputs["stage"], str)
+    assert isinstance(inputs["profile"], str)
+    assert isinstance(inputs["regions"], str)
+    stage = inputs["stage"]
+    log.info(f"Deploying service {service}.")
+    manifest = current_fn.deploy_matrix(
+        [stage],
+        parse_regions(inputs["regions"]),
+        inputs["profile"],
+        state,
+        artifacts=artifacts,
+    )
+    log.info(f"Deployment of {service} successful.")
+    deployment: Deployment_Dict = {}
+    assert current_fn.service
+    deployment["endpoints"] = defaultdict(list)
+    deployment["stage"] = stage
+    deployment["service"] = current_fn.service
+    assert isinstance(deployment["endpoints"], dict)
+    for info in manifest[stage].values():
+        assert info
+        for key, value in info["urls"]["byMethod"].items():
+            deployment["endpoints"][key] += value
+            log.info(f"Endpoint deployed:  {key} {value}")
+    return deployment
+
+
+def parse_regions(regions: str) -> List[str]:
+    """Parses the regions input.
+
+    Args:
+        regions (str): Comma separated regions, e.g. "eu-central-1,us-east-1"
+
+    Returns:
+        List[str]: The regions without duplicates, DEFAULT_REGION if empty
+    """
+    parsed = [x.strip() for x in regions.split(",") if x.strip()]
+    return list(dict.fromkeys(parsed)) or [DEFAULT_REGION]
+
+
 def deploy(
     sls: List[str],
     inputs: Dict[str, Union[str, int]],
     args: Dict[str, Union[bool, str, int]],
-) -> List[Deployment_Dict]:
-    """Deploys the sls definitions."""
+) -> Tuple[List[Deployment_Dict], Failures_Dict]:
+    """Deploys the sls definitions.
+
+    Services are deployed concurrently by a pool of at most
+    ``inputs["max_parallel"]`` workers, each as soon as the services whose
+    stack outputs it uses are deployed (see schedule). A failing service
+    does not cancel the others, only the services depending on it; errors
+    are collected instead. Serverless commands run in
+    ``inputs["sls_workers"]`` pre-started processes, if set. With the
+    artifact_cache input, packages are kept in the cache directory and
+    deployed again while the service's deploy fingerprint is unchanged.
+    With the resume input, finished services are recorded in a journal of
+    the commit, profile, stage and regions, kept in the deploy state store
+    if set; services a previous attempt deployed are not deployed again,
+    but still reported.
+
+    Returns:
+        Tuple[List[Deployment_Dict], Failures_Dict]: Deployments in order
+            of completion and error messages of failed services
+    """
     log.info("Setting up sls profile")
     set_profile()
-    deployments: List[Deployment_Dict] = []
-    for service in sls:
-        current_fn = Lambda(service)
-
+    assert isinstance(inputs["max_parallel"], int)
+    assert isinstance(inputs["deploy_state"], str)
+    assert isinstance(inputs["state_endpoint_url"], str)
+    assert isinstance(inputs["sls_workers"], int)
+    try:
+        state = state_store_from_url(
+            inputs["deploy_state"], inputs["state_endpoint_url"] or None
+        )
+        warm_pool.configure(inputs["sls_workers"])
+        assert isinstance(inputs["artifact_cache"], str)
+        artifacts = artifact_cache_from_input(inputs["artifact_cache"])
+        journal = None
+        if inputs["resume"] == "true":
+            journal = run_journal(inputs, state)
+        deployments, remaining = resume_deployments(sls, journal)
         assert isinstance(inputs["stage"], str)
-        assert isinstance(inputs["profile"], str)
-        current_deployment = current_fn.Deployment(
-            inputs["stage"], "eu-central-1", inputs["profile"]
+        graph = DeployGraph.build(remaining, inputs["stage"])
+        for number, wave in enumerate(graph.waves(), 1):
+            log.info(f"Deploy wave {number}: {' '.join(wave)}")
+        task = partial(
+            deploy_service, inputs=inputs, state=state, artifacts=artifacts
         )
-        log.info(f"Deploying service.")
-        current_deployment.deploy()
-        log.info(f"Deployment successful.")
-        deployment: Deployment_Dict = {}
-        assert current_deployment.stage
-        assert current_fn.service
-        deployment["endpoints"] = defaultdict(list)
-        deployment["stage"] = current_deployment.stage
-        deployment["service"] = current_fn.service
-        stage = current_deployment.stage if current_deployment.stage else ""
-        info = current_deployment.get_info()
-        assert info
-        urls = info[stage]["urls"]["byMethod"]
-        assert isinstance(deployment["endpoints"], dict)
-        for key, value in urls.items():
-            deployment["endpoints"][key] += value
-            log.info(f"Endpoint deployed:  {key} {value}")
-        deployments.append(deployment)
-    return deployments
+        failures: Failures_Dict = {}
+        for service, future in graph.run(task, inputs["max_parallel"]):
+            record_outcome(journal, service, future)
+            error = future.exception()
+            if error is None:
+                deployments.append(future.result())
+            else:
+                log.error(f"Deployment of {service} failed: {error}")
+                failures[service] = str(error)
+    finally:
+        close_warm_pool()
+        close_clients()
+    return deployments, failures
+
+
+def run_journal(
+    inputs: Dict[str, Union[str, int]], state: Optional[StateStore] = None
+) -> Optional[RunJournal]:
+    """Journal of deploying the current commit to the stage and regions.
+
+    Args:
+        inputs (Dict[str, Union[str, int]]): Inputs with profile, stage and
+            regions
+        state (StateStore, optional): Store keeping the journal, so that
+            attempts on other runners can resume. Defaults to None, i.e.
+            the journal is kept in the cache directory.
+
+    Returns:
+        Optional[RunJournal]: The journal, None if the commit is unknown
+    """
+    commit = os.environ.get("GITHUB_SHA")
+    if not commit:
+        try:
+            result = run_command(["git", "rev-parse", "HEAD"])
+        except OSError:
+            result = None
+        if result is None or result.return_code:
+            log.warning("Unknown commit, deploying without a journal")
+            return None
+        commit = result.output.decode().strip()
+    return RunJournal.for_run(
+        cache_dir("journal"),
+        commit,
+        str(inputs["stage"]),
+        parse_regions(str(inputs["regions"])),
+        state,
+        str(inputs["profile"]),
+    )
+
+
+def resume_deployments(
+    sls: List[str], journal: Optional[RunJournal]
+) -> Tuple[List[Deployment_Dict], List[str]]:
+    """Splits the services into those a previous attempt deployed and others.
+
+    Args:
+        sls (List[str]): Paths to the serverless definitions to deploy
+        journal (RunJournal, optional): Journal of previous attempts
+
+    Returns:
+        Tuple[List[Deployment_Dict], List[str]]: Deployments of the services
+            a previous attempt deployed and the services left to deploy
+    """
+    resumed = journal.completed() if journal is not None else {}
+    for service in sls:
+        if service in resumed:
+            log.info(f"{service} was deployed by a previous attempt")
+    deployments = [resumed[x] for x in sls if x in resumed]
+    return deployments, [x for x in sls if x not in resumed]
+
+
+def record_outcome(
+    journal: Optional[RunJournal],
+    service: str,
+    future: "Future[Deployment_Dict]",
+) -> None:
+    """Records the outcome of deploying a service in the journal.
+
+    Args:
+        journal (RunJournal, optional): The journal, None to record nothing
+        service (str): Path to the serverless definition
+        future (Future[Deployment_Dict]): Done deployment of the service
+    """
+    if journal is None:
+        return
+    error = future.exception()
+    if error is None:
+        journal.record(service, future.result())
+    else:
+        journal.record(service, error=str(error))
+
+
+def artifact_cache_from_input(enabled: str) -> Optional[ArtifactCache]:
+    """Creates the cache configured by the artifact_cache input.
+
+    Args:
+        enabled (str): "true" to keep packages in the cache directory
+
+    Returns:
+        Optional[ArtifactCache]: The cache, None if disabled
+    """
+    if enabled != "true":
+        return None
+    return ArtifactCache(cache_dir("artifacts"))
+
+
+def postman_cache_from_input(mode: str) -> Optional[PostmanCache]:
+    """Creates the cache configured by the postman_cache input.
+
+    Args:
+        mode (str): "revalidate" to use cached copies that are still up to
+            date, "offline" to use only cached copies, "" to disable
+
+    Raises:
+        ValueError: Raised for unknown modes.
+
+    Returns:
+        Optional[PostmanCache]: The cache, None if disabled
+    """
+    if not mode:
+        return None
+    if mode not in {"revalidate", "offline"}:
+        raise ValueError(f"Unknown postman_cache mode {mode}")
+    return PostmanCache(cache_dir("postman"), offline=mode == "offline")
+
+
+def test_service(
+    service: str,
+    inputs: Dict[str, Union[str, int]],
+    cache: Optional[PostmanCache] = None,
+) -> NewmanResult:
+    """Runs the newman collection of a single sls definition.
+
+    Args:
+        service (str): Path to the serverless definition
+        inputs (Dict): Action inputs as returned by get_args
+        cache (PostmanCache, optional): Cache of collections and
+            environments. Defaults to None.
+
+    Returns:
+        NewmanResult: The command, stdout, stderr, return code and parsed
+            report of newman
+    """
+    current_fn = Lambda(service)
+    assert isinstance(inputs["stage"], str)
+    assert isinstance(inputs["profile"], str)
+    assert isinstance(inputs["regions"], str)
+    current_deployment = current_fn.Deployment(
+        inputs["stage"], parse_regions(inputs["regions"])[0], inputs["profile"]
+    )
+    log.info(f"Testing service {service}.")
+    assert isinstance(inputs["postman_api_key"], str)
+    return current_deployment.test(inputs["postman_api_key"], cache)
 
 
 def test(
@@ -205,71 +506,203 @@ def test(
     inputs: Dict[str, Union[str, int]],
     args: Dict[str, Union[bool, str, int]],
 ) -> None:
-    """Tests the sls definitions."""
+    """Tests the sls definitions.
+
+    Collections run concurrently on at most ``inputs["max_parallel"]``
+    workers. Results are merged in the order of sls, and the job fails only
+    after every collection has finished. The formatted output holds a
+    summary of each run, the test_results output totals and latency
+    statistics as JSON.
+    """
     log.info("Setting up sls profile")
     logging.getLogger("boto3").setLevel(logging.CRITICAL)
     logging.getLogger("botocore").setLevel(logging.CRITICAL)
     logging.getLogger("apigateway").setLevel(logging.CRITICAL)
-    set_profile()
-    test_failed = False
+    failed: List[str] = []
     message = ""
-    for service in sls:
-        current_fn = Lambda(service)
-        assert isinstance(inputs["stage"], str)
-        assert isinstance(inputs["profile"], str)
-        current_deployment = current_fn.Deployment(
-            inputs["stage"], "eu-central-1", inputs["profile"]
-        )
-        log.info(f"Testing service.")
-        assert isinstance(inputs["postman_api_key"], str)
-        cmd, output, error, return_code = current_deployment.test(
-            inputs["postman_api_key"]
-        )
-        log.info(output)
-        message += output
-        if return_code > 0:
-            test_failed = True
-            log.warning(cmd)
-            log.warning(output)
-            log.warning(error)
-
-    set_output(f"formatted", message)
+    results: Dict[str, Any] = {}  # type: ignore[misc]
+    assert isinstance(inputs["max_parallel"], int)
+    workers = max(1, inputs["max_parallel"])
+    assert isinstance(inputs["postman_cache"], str)
+    try:
+        set_profile()
+        cache = postman_cache_from_input(inputs["postman_cache"])
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                service: pool.submit(test_service, service, inputs, cache)
+                for service in sls
+            }
+            for service in sls:
+                result = newman_result(futures[service])
+                message += f"Service: `{service}`\n{result.summary}\n"
+                if result.report is not None:
+                    results[service] = result.report.to_dict()
+                if result.return_code > 0:
+                    failed.append(service)
+                    log.warning(result.cmd)
+                    log.warning(result.output)
+                    log.warning(result.error)
+    finally:
+        api_key_resolver.clear()
+        close_clients()
+
+    message += failure_summary(failed)
+    set_output("formatted", message)
+    set_output("test_results", json.dumps(results, sort_keys=True))
     print(message)
-    if test_failed:
+    if failed:
         sys.exit(1)
 
 
+def newman_result(future: "Future[NewmanResult]") -> NewmanResult:
+    """Result of a test run, a failed result if the run raised.
+
+    Args:
+        future (Future[NewmanResult]): Done test run of a service
+
+    Returns:
+        NewmanResult: The result
+    """
+    try:
+        return future.result()
+    except Exception as exception:  # noqa: B902 # keep testing
+        return NewmanResult("", str(exception), b"", 1)
+
+
+def failure_summary(failed: List[str]) -> str:
+    """Formatted list of the services that failed their tests.
+
+    Args:
+        failed (List[str]): Paths to the serverless definitions
+
+    Returns:
+        str: The list, empty if nothing failed
+    """
+    if not failed:
+        return ""
+    return "The following services failed their tests:\n" + "".join(
+        f"`{service}`\n" for service in failed
+    )
+
+
+def tox_workers(requested: int, services: int) -> int:
+    """Number of tox runs to start at the same time.
+
+    Args:
+        requested (int): tox_parallel input; 0 or less uses one run per CPU
+        services (int): Number of services to test
+
+    Returns:
+        int: Workers, at most one per CPU and service
+    """
+    cpus = os.cpu_count() or 1
+    workers = cpus if requested <= 0 else min(requested, cpus)
+    return max(1, min(workers, services))
+
+
+def tox_service(
+    service: str, cache: Optional[ToxEnvCache] = None
+) -> Tuple[str, str, bytes, int]:
+    """Runs tox in the directory of a single sls definition.
+
+    Args:
+        service (str): Path to the serverless definition
+        cache (ToxEnvCache, optional): Cache of tox environments shared
+            between services. Defaults to None, i.e. the service's .tox.
+
+    Returns:
+        Tuple[str, str, bytes, int]: The command, formatted report, stderr
+            and return code of tox
+    """
+    parent = Path(service).parent
+    sink = log_sink(log, prefix=f"[{parent}] ")
+    formatter = ToxLogFormatter()
+    with ExitStack() as stack:
+        argv = ["tox"]
+        env = None
+        if cache is not None:
+            workdir = stack.enter_context(cache.workdir(parent))
+            argv += ["--workdir", str(workdir)]
+            env = cache.environment()
+        cmd, _, error, return_code = stream_command(
+            argv,
+            cwd=parent,
+            env=env,
+            sinks=[sink, formatter.feed],
+        )
+    return cmd, formatter.format(), error, return_code
+
+
+def tox_result(
+    future: "Future[Tuple[str, str, bytes, int]]",
+) -> Tuple[str, str, bytes, int]:
+    """Result of a tox run, a failed result if the run raised.
+
+    Args:
+        future (Future[Tuple[str, str, bytes, int]]): Done tox run
+
+    Returns:
+        Tuple[str, str, bytes, int]: The command, formatted report, stderr
+            and return code of tox
+    """
+    try:
+        return future.result()
+    except Exception as exception:  # noqa: B902 # keep testing
+        return "tox", f"{exception}\n", b"", 1
+
+
+def tox_env_cache_from_input(enabled: str) -> Optional[ToxEnvCache]:
+    """Creates the cache configured by the tox_env_cache input.
+
+    Args:
+        enabled (str): "true" to share environments in the cache directory
+
+    Returns:
+        Optional[ToxEnvCache]: The cache, None if disabled
+    """
+    if enabled != "true":
+        return None
+    return ToxEnvCache(cache_dir("tox"))
+
+
 def run_tox(
     sls: List[str],
     inputs: Dict[str, Union[str, int]],
     args: Dict[str, Union[bool, str, int]],
 ) -> None:
-    """Tests the sls definitions."""
-    log.info("Setting up sls profile")
+    """Runs tox for the sls definitions.
+
+    Services are tested concurrently, each tox process in its own service
+    directory. The reports of all services are combined in the order of sls,
+    and the job fails only after every run has finished. With the
+    tox_env_cache input, services with the same tox.ini and requirements
+    reuse one environment from the cache directory.
+    """
+    assert isinstance(inputs["tox_parallel"], int)
+    assert isinstance(inputs["tox_env_cache"], str)
+    cache = tox_env_cache_from_input(inputs["tox_env_cache"])
+    workers = tox_workers(inputs["tox_parallel"], len(sls))
+    log.info(f"Running tox for {len(sls)} services on {workers} workers")
     formatted_output = ""
-    test_failed = False
-    for service in sls:
-        cwd = os.getcwd()
-        parent = Path(service).parent
-        os.chdir(parent)
-        cmd = "tox"
-        process = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, shell=True  # noqa: S602
-        )
-        output, error = process.communicate()
-        return_code = process.wait()
-        os.chdir(cwd)
-        formatted_output = format_tox_output(output)
-        log.info(formatted_output)
-        if return_code > 0:
-            test_failed = True
-            log.warning(cmd)
-            log.warning(formatted_output)
-            log.warning(error)
-
-    set_output(f"formatted", formatted_output)  # noqa: F541
+    failed: List[str] = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            service: pool.submit(tox_service, service, cache)
+            for service in sls
+        }
+        for service in sls:
+            cmd, report, error, return_code = tox_result(futures[service])
+            log.info(report)
+            formatted_output += f"Service: `{service}`\n{report}\n"
+            if return_code > 0:
+                failed.append(service)
+                log.warning(cmd)
+                log.warning(error)
+
+    formatted_output += failure_summary(failed)
+    set_output("formatted", formatted_output)
     print(formatted_output)
-    if test_failed:
+    if failed:
         sys.exit(1)
 
 
@@ -279,6 +712,7 @@ if __name__ == "__main__":  # pragma: no cover
     assert isinstance(args["verbosity"], int)  # noqa: 501 # mypy only
     assert isinstance(inputs["log_level"], int)  # noqa: 501 # mypy only
     log = setup_logging(args["verbosity"], inputs["log_level"])
+    register_secrets(inputs)
     log.info("e-bot7 Serverless Helper")
     log.info("Setup")
     log.info(f"Current CWD: {os.getcwd()}")
@@ -304,16 +738,16 @@ if __name__ == "__main__":  # pragma: no cover
     log.info(f"  VALIDATOR_PATH: {inputs['validator_path']}")
 
     assert isinstance(args["filename"], str)  # noqa: 501 # mypy only
-    sls = discover_file(changes_list, args["filename"])
-    sls = discover_file(changes_list, args["filename"])
+    sls = select_services(changes_list, args["filename"])
     log.info(f"Discovered: {' '.join(sls)}")
 
     if inputs["mode"] == "validate":
         validate()
     elif inputs["mode"] == "deploy":
-        deployments = deploy(sls, inputs, args)
+        deployments, failures = deploy(sls, inputs, args)
         log.info(f"Setting outputs")
-        output_endpoints(deployments)
+        output_endpoints(deployments, failures)
+        sys.exit(1 if failures else 0)
     elif inputs["mode"] == "test":
         test(sls, inputs, args)
     elif inputs["mode"] == "tox":
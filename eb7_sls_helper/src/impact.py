@@ -0,0 +1,337 @@
+"""Finds services affected by changes outside their own directory.
+
+Each definition declares files it depends on beyond its directory: package
+includes and patterns, artifacts, layer paths, handlers in shared folders,
+``${file(...)}`` variables, the pythonRequirements file and local packages
+referenced from requirements files. The ImpactGraph maps those paths back
+to the definitions, so a change to a shared library selects exactly the
+services using it.
+
+Extracted dependencies are cached in a JSON file together with the hashes
+of the files they were read from, so unchanged services are not re-read on
+the next run.
+"""
+import fnmatch
+import hashlib
+import json
+import posixpath
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Set, Tuple
+
+from eb7_sls_helper.src.discovery import DefinitionIndex
+from eb7_sls_helper.src.utils.definition import Document, load_definition
+
+Dependencies = Dict[str, List[str]]
+
+CACHE_VERSION = 1
+FILE_VARIABLE_REGEX = re.compile(r"\$\{file\(([^)]+)\)")
+VARIABLE_REGEX = re.compile(r"\$\{[^}]*\}")
+GLOB_CHARS = re.compile(r"[*?\[]")
+REQUIREMENT_OPTION_REGEX = re.compile(
+    r"^(?:-e|--editable|-r|--requirement|-c|--constraint)[\s=]+(\S+)"
+)
+LOCAL_REQUIREMENT_REGEX = re.compile(
+    r"^(?:\S+\s*@\s*)?(?:file:(?://)?)?(\.{1,2}/\S*)"
+)
+
+
+class ImpactGraph(object):
+    """Maps repository paths to the definitions depending on them."""
+
+    def __init__(self, dependencies: Dependencies) -> None:
+        """Constructor of ImpactGraph.
+
+        Args:
+            dependencies (Dependencies): Root-relative path patterns each
+                definition depends on outside its own directory
+        """
+        self._dependencies = dependencies
+        self._prefixes: Dict[str, Set[str]] = {}
+        self._globs: List[Tuple[Pattern[str], str]] = []
+        for definition, patterns in dependencies.items():
+            for pattern in patterns:
+                prefix = _glob_prefix(pattern)
+                if prefix is None:
+                    regex = re.compile(fnmatch.translate(pattern))
+                    self._globs.append((regex, definition))
+                else:
+                    self._prefixes.setdefault(prefix, set()).add(definition)
+
+    @property
+    def dependencies(self) -> Dependencies:
+        """Dependencies getter.
+
+        Returns:
+            Dependencies: Path patterns by definition
+        """
+        return self._dependencies
+
+    @classmethod
+    def build(
+        cls,
+        definitions: Iterable[str],
+        cache_file: Optional[Path] = None,
+        root: str = ".",
+    ) -> "ImpactGraph":
+        """Extracts the dependencies of all definitions.
+
+        Args:
+            definitions (Iterable[str]): Definition paths relative to root
+            cache_file (Path, optional): JSON file caching the dependencies
+                between runs. Defaults to None, i.e. no caching.
+            root (str): Repository root. Defaults to the current directory.
+
+        Returns:
+            ImpactGraph: The graph
+        """
+        cached = _read_cache(cache_file)
+        entries: Dict[str, Dict[str, Any]] = {}  # type: ignore[misc]
+        for definition in definitions:
+            entry = cached.get(definition)
+            if entry is None or not _inputs_unchanged(entry["inputs"], root):
+                extractor = _Extractor(definition, root)
+                entry = {
+                    "dependencies": sorted(extractor.extract()),
+                    "inputs": extractor.inputs,
+                }
+            entries[definition] = entry
+        if cache_file is not None:
+            _write_cache(cache_file, entries)
+        return cls({k: v["dependencies"] for k, v in entries.items()})
+
+    def dependents(self, changed_file: str) -> Set[str]:
+        """Definitions depending on a changed file.
+
+        Args:
+            changed_file (str): Path relative to the repository root
+
+        Returns:
+            Set[str]: Paths of the depending definitions
+        """
+        path = posixpath.normpath(changed_file)
+        found: Set[str] = set()
+        candidate = path
+        while candidate not in {"", "."}:
+            found |= self._prefixes.get(candidate, set())
+            candidate = posixpath.dirname(candidate)
+        for regex, definition in self._globs:
+            if regex.match(path):
+                found.add(definition)
+        return found
+
+    def affected(
+        self, changed_files: Iterable[str], index: DefinitionIndex
+    ) -> List[str]:
+        """Selects the definitions to redeploy for a set of changes.
+
+        Args:
+            changed_files (Iterable[str]): Changed paths
+            index (DefinitionIndex): Index mapping paths to their own
+                definition
+
+        Returns:
+            List[str]: Sorted, unique paths of the affected definitions
+        """
+        changed_files = list(changed_files)
+        selected = set(index.discover(changed_files))
+        for changed_file in changed_files:
+            selected |= self.dependents(changed_file)
+        return sorted(selected)
+
+
+class _Extractor(object):
+    """Reads the out-of-directory dependencies of one definition."""
+
+    def __init__(self, definition: str, root: str) -> None:
+        self._definition = definition
+        self._root = Path(root)
+        self._service_dir = posixpath.dirname(posixpath.normpath(definition))
+        self._seen_packages: Set[str] = set()
+        self.inputs: Dict[str, Optional[str]] = {}
+
+    def extract(self) -> Set[str]:
+        """Returns root-relative path patterns outside the service dir."""
+        text = self._read(self._definition) or ""
+        document = load_definition(self._root / self._definition)
+        found: Set[str] = set()
+        for pattern in self._definition_paths(document):
+            found.add(self._resolve(self._service_dir, pattern))
+        for match in FILE_VARIABLE_REGEX.finditer(text):
+            # ${file(config/${opt:stage}.yml)} depends on every stage's file
+            pattern = VARIABLE_REGEX.sub("*", match.group(1).strip())
+            found.add(self._resolve(self._service_dir, pattern))
+        requirements = ["requirements.txt"]
+        python_requirements = _get(document, "custom", "pythonRequirements")
+        if isinstance(python_requirements, dict):
+            requirements.append(python_requirements.get("fileName") or "")
+        for name in filter(None, requirements):
+            path = self._resolve(self._service_dir, name)
+            if path:
+                found.add(path)
+                found |= self._requirement_paths(path)
+        return {
+            x for x in found if x and not self._inside(x, self._service_dir)
+        }
+
+    def _definition_paths(self, document: Document) -> List[str]:
+        """Collects path patterns declared in the definition."""
+        paths: List[str] = _package_paths(_get(document, "package"))
+        functions = _get(document, "functions")
+        for function in (functions or {}).values():
+            if not isinstance(function, dict):
+                continue
+            paths += _package_paths(function.get("package"))
+            handler = function.get("handler")
+            if isinstance(handler, str) and "/" in handler:
+                paths.append(posixpath.dirname(handler))
+        layers = _get(document, "layers")
+        for layer in (layers or {}).values():
+            paths += _layer_paths(layer)
+        return [x for x in paths if isinstance(x, str) and "${" not in x]
+
+    def _requirement_paths(self, path: str) -> Set[str]:
+        """Collects local packages referenced by a requirements file."""
+        found: Set[str] = set()
+        text = self._read(path)
+        if text is None:
+            return found
+        base = posixpath.dirname(path)
+        for line in text.splitlines():
+            local_path = _local_requirement(line.strip())
+            target = "" if local_path is None else self._resolve(base, local_path)
+            if target:
+                found.add(target)
+                found |= self._nested_requirement_paths(target)
+        return found
+
+    def _nested_requirement_paths(self, target: str) -> Set[str]:
+        """Requirements of a local package or included file, once each."""
+        if target in self._seen_packages:
+            return set()
+        self._seen_packages.add(target)
+        if not target.endswith(".txt"):
+            target = f"{target}/requirements.txt"
+        return self._requirement_paths(target)
+
+    def _read(self, path: str) -> Optional[str]:
+        """Reads a file and records its hash as input of the extraction."""
+        try:
+            content = (self._root / path).read_bytes()
+        except OSError:
+            self.inputs[path] = None
+            return None
+        self.inputs[path] = hashlib.sha1(content).hexdigest()  # noqa: S303
+        return content.decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _resolve(base: str, pattern: str) -> str:
+        """Resolves a pattern relative to base against the root."""
+        pattern = pattern.lstrip("!")
+        resolved = posixpath.normpath(posixpath.join(base, pattern))
+        if resolved == "." or resolved.startswith("../"):
+            return ""  # the root itself or outside the repository
+        return resolved
+
+    @staticmethod
+    def _inside(path: str, directory: str) -> bool:
+        if not directory:
+            return True
+        return path == directory or path.startswith(f"{directory}/")
+
+
+def _get(document: Any, *keys: str) -> Any:  # type: ignore[misc]
+    """Nested lookup returning None for missing keys."""
+    for key in keys:
+        if not hasattr(document, "get"):
+            return None
+        document = document.get(key)
+    return document
+
+
+def _local_requirement(line: str) -> Optional[str]:
+    """Relative path referenced by a requirements line, if any."""
+    match = REQUIREMENT_OPTION_REGEX.match(line)
+    if match is not None:
+        path = match.group(1)
+        if "://" in path or path.startswith(("/", "git+")):
+            return None
+        return path[len("file:") :] if path.startswith("file:") else path
+    match = LOCAL_REQUIREMENT_REGEX.match(line)
+    return match.group(1) if match else None
+
+
+def _package_paths(package: Any) -> List[str]:  # type: ignore[misc]
+    """Include/patterns/artifact paths of a package section.
+
+    Entries that are not strings, e.g. unresolved variables, are ignored.
+    """
+    if not isinstance(package, dict):
+        return []
+    paths: List[str] = []
+    for key in ("include", "patterns"):
+        paths += [
+            x
+            for x in package.get(key) or []
+            if isinstance(x, str) and not x.startswith("!")
+        ]
+    artifact = package.get("artifact")
+    if artifact and isinstance(artifact, str):
+        paths.append(artifact)
+    return paths
+
+
+def _layer_paths(layer: Any) -> List[str]:  # type: ignore[misc]
+    """Path and package paths of a layer."""
+    if not isinstance(layer, dict):
+        return []
+    path = layer.get("path")
+    paths = [path] if isinstance(path, str) else []
+    return paths + _package_paths(layer.get("package"))
+
+
+def _glob_prefix(pattern: str) -> Optional[str]:
+    """Returns the directory prefix a pattern covers, None for real globs."""
+    match = GLOB_CHARS.search(pattern)
+    if match is None:
+        return pattern
+    head = pattern[: match.start()]
+    tail = pattern[match.start() :]
+    if head.endswith("/") and tail in {"**", "**/*", "*"}:
+        return head.rstrip("/")
+    return None
+
+
+def _inputs_unchanged(inputs: Dict[str, Optional[str]], root: str) -> bool:
+    """Checks whether the files an extraction read are unchanged."""
+    for path, digest in inputs.items():
+        try:
+            content = (Path(root) / path).read_bytes()
+        except OSError:
+            if digest is not None:
+                return False
+            continue
+        if hashlib.sha1(content).hexdigest() != digest:  # noqa: S303
+            return False
+    return True
+
+
+def _read_cache(cache_file: Optional[Path]) -> Dict[str, Any]:  # type: ignore[misc]
+    if cache_file is None:
+        return {}
+    try:
+        with open(cache_file) as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if cached.get("version") != CACHE_VERSION:
+        return {}
+    return cached.get("definitions", {})
+
+
+def _write_cache(cache_file: Path, entries: Dict[str, object]) -> None:
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(".tmp")
+    with open(tmp_file, "w") as file:
+        json.dump({"version": CACHE_VERSION, "definitions": entries}, file)
+    tmp_file.replace(cache_file)
@@ -0,0 +1,181 @@
+"""Records the progress of a deploy run to resume it after a failure.
+
+The RunJournal of a commit, AWS profile, stage and regions has one entry
+per finished service with its outcome and, on success, the deployment
+(service, stage and endpoints). Another attempt for the same commit,
+profile, stage and regions reads it back and only deploys the services that have not succeeded yet.
+
+Without a state store, the journal is an append-only file of JSON lines,
+flushed to disk as soon as a service finishes, so it survives a job that
+is cancelled or crashes. A partially written last line, left by a crash,
+is ignored. The file only helps a later attempt if it runs on the same
+machine or the directory is saved even when the job fails.
+
+With a state store (see fingerprint), e.g. on S3, all entries are written
+to it as one state after every service, so attempts on other machines can
+resume.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from eb7_sls_helper.src.fingerprint import StateStore
+
+Entry = Dict[str, Any]  # type: ignore[type-arg, misc]
+
+JOURNAL_VERSION = 1
+UNSAFE_CHARS_REGEX = re.compile(r"[^\w.-]")
+
+log = logging.getLogger(__name__)
+
+
+class RunJournal(object):
+    """Append-only log of the services a deploy run finished."""
+
+    def __init__(
+        self,
+        path: Path,
+        store: Optional[StateStore] = None,
+        key: str = "",
+    ) -> None:
+        """Constructor of RunJournal.
+
+        Args:
+            path (Path): The journal file; created on the first record.
+                Not used with a store.
+            store (StateStore, optional): Store keeping the journal instead
+                of the file. Defaults to None.
+            key (str): Key of the journal in the store. Defaults to "".
+        """
+        self._path = Path(path)
+        self._store = store
+        self._key = key
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_run(
+        cls,
+        directory: Path,
+        commit: str,
+        stage: str,
+        regions: Iterable[str] = (),
+        store: Optional[StateStore] = None,
+        profile: str = "",
+    ) -> "RunJournal":
+        """Journal of deploying a commit to a stage and regions.
+
+        The profile selects the AWS account, so deploying the same commit
+        to the same stage and regions of another account has its own
+        journal.
+
+        Args:
+            directory (Path): Directory holding the journal files
+            commit (str): Commit SHA being deployed
+            stage (str): Stage being deployed to
+            regions (Iterable[str]): Regions being deployed to.
+                Defaults to ().
+            store (StateStore, optional): Store keeping the journal instead
+                of the directory. Defaults to None.
+            profile (str): AWS profile being deployed with. Defaults to "",
+                i.e. the default profile.
+
+        Returns:
+            RunJournal: The journal
+        """
+        parts = [profile or "default", stage, "+".join(sorted(regions))]
+        parts = [UNSAFE_CHARS_REGEX.sub("_", x) or "_" for x in parts]
+        commit = UNSAFE_CHARS_REGEX.sub("_", commit) or "_"
+        return cls(
+            Path(directory, *parts, f"{commit}.jsonl"),
+            store,
+            "/".join(["journal", *parts, commit]),
+        )
+
+    @property
+    def path(self) -> Path:
+        """Path getter.
+
+        Returns:
+            Path: The journal file
+        """
+        return self._path
+
+    def record(
+        self,
+        service: str,
+        deployment: Optional[Entry] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        """Appends the outcome of a service.
+
+        Args:
+            service (str): Path to the serverless definition
+            deployment (Entry, optional): The deployment, if it succeeded.
+                Defaults to None.
+            error (str, optional): Error message, if it failed.
+                Defaults to None.
+        """
+        entry = {
+            "version": JOURNAL_VERSION,
+            "service": service,
+            "succeeded": error is None,
+            "deployment": deployment,
+            "error": error,
+            "time": time.time(),
+        }
+        with self._lock:
+            if self._store is not None:
+                entries = [*self._entries(), entry]
+                self._store.put(
+                    self._key, {"version": JOURNAL_VERSION, "entries": entries}
+                )
+                return
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self._path, "a") as file:
+                file.write(json.dumps(entry, sort_keys=True) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+    def completed(self) -> Dict[str, Entry]:
+        """Deployments of the services whose last record is a success.
+
+        Returns:
+            Dict[str, Entry]: Deployments by definition path
+        """
+        completed: Dict[str, Entry] = {}
+        for entry in self._entries():
+            if entry.get("succeeded") and entry.get("deployment"):
+                completed[entry["service"]] = entry["deployment"]
+            else:
+                completed.pop(entry["service"], None)
+        return completed
+
+    def _entries(self) -> List[Entry]:
+        """Valid entries in the order they were recorded."""
+        entries: List[object] = []
+        if self._store is None:
+            entries = self._read_file()
+        else:
+            state = self._store.get(self._key) or {}
+            entries = state.get("entries") or []
+        return [x for x in entries if isinstance(x, dict) and "service" in x]
+
+    def _read_file(self) -> List[object]:
+        """Parsed lines of the journal file, skipping damaged ones."""
+        try:
+            with open(self._path) as file:
+                lines = file.readlines()
+        except OSError:
+            return []
+        entries = []
+        for number, line in enumerate(lines, 1):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                log.warning(f"Skipping damaged line {number} of {self._path}")
+        return entries
@@ -1,31 +1,237 @@
 """Integration testing."""
-import boto3
+import asyncio
 import json
-import subprocess  # noqa: S404 # Use of subprocess required
-from typing import Tuple
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from eb7_sls_helper.src.newman_report import NewmanReport, load_report
+from eb7_sls_helper.src.postman_cache import POSTMAN_API, PostmanCache
+from eb7_sls_helper.src.utils.clients import get_client
+from eb7_sls_helper.src.utils.redact import add_secrets
+from eb7_sls_helper.src.utils.runner import (
+    arun_command,
+    log_sink,
+    stream_command,
+)
 
+log = logging.getLogger(__name__)
 
-def get_api_key(name: str, profile: str) -> str:
+
+Key_Index = Dict[str, str]
+
+REPORT_FILE = "newman.json"
+
+
+class NewmanResult(NamedTuple):
+    """Outcome of a newman run.
+
+    The first four fields match the ``(cmd, output, error, return_code)``
+    tuples of the other commands; report holds the parsed JSON report.
+    """
+
+    cmd: str
+    output: str
+    error: bytes
+    return_code: int
+    report: Optional[NewmanReport] = None
+
+    @property
+    def summary(self) -> str:
+        """Compact summary of the run, the CLI output without a report."""
+        if self.report is None:
+            return self.output
+        return self.report.summary()
+
+
+class ApiKeyResolver(object):
+    """Resolves API Gateway keys by exact name from one bulk listing.
+
+    All keys of a profile and region are paged through once and indexed by
+    name; every later lookup is served from memory.
+    """
+
+    def __init__(self) -> None:
+        """Constructor of ApiKeyResolver."""
+        self._indexes: Dict[Tuple[str, Optional[str]], Key_Index] = {}
+        self._lock = threading.Lock()
+
+    def resolve(
+        self, name: str, profile: str, region: Optional[str] = None
+    ) -> str:
+        """Returns the value of the API key with exactly this name.
+
+        If several keys share the name, enabled keys win over disabled ones
+        and newer keys over older ones. The value is registered as a secret,
+        so it is redacted from the output of newman.
+
+        Args:
+            name (str): Key name, e.g. "dev-my-service"
+            profile (str): AWS profile
+            region (str, optional): AWS region. Defaults to the profile's.
+
+        Raises:
+            KeyError: Raised if no key has this name.
+
+        Returns:
+            str: The key value
+        """
+        index = self._index(profile, region)
+        if name not in index:
+            raise KeyError(f"No API key named {name}")
+        add_secrets(index[name])
+        return index[name]
+
+    def clear(self) -> None:
+        """Drops all indexed keys."""
+        with self._lock:
+            self._indexes.clear()
+
+    def _index(self, profile: str, region: Optional[str]) -> Key_Index:
+        with self._lock:
+            if (profile, region) not in self._indexes:
+                self._indexes[(profile, region)] = _list_api_keys(
+                    profile, region
+                )
+            return self._indexes[(profile, region)]
+
+
+def _list_api_keys(profile: str, region: Optional[str]) -> Key_Index:
+    """Pages through all API keys of a profile and region.
+
+    Args:
+        profile (str): AWS profile
+        region (str, optional): AWS region
+
+    Returns:
+        Key_Index: Key values by name
+    """
+    client = get_client("apigateway", profile, region)
+    paginator = client.get_paginator(  # type: ignore[attr-defined]
+        "get_api_keys"
+    )
+    ranked: Dict[str, Tuple[Tuple[bool, str], str]] = {}
+    for page in paginator.paginate(includeValues=True):
+        for item in page.get("items", []):
+            if "name" not in item or "value" not in item:
+                continue
+            updated = item.get("lastUpdatedDate") or item.get("createdDate")
+            rank = (bool(item.get("enabled", True)), str(updated or ""))
+            if item["name"] not in ranked or rank > ranked[item["name"]][0]:
+                ranked[item["name"]] = (rank, item["value"])
+    return {name: value for name, (_, value) in ranked.items()}
+
+
+api_key_resolver = ApiKeyResolver()
+
+
+def get_api_key(name: str, profile: str, region: Optional[str] = None) -> str:
     """Get API Gateway API key"""
-    session = boto3.Session(profile_name=profile)
-    client = session.client("apigateway")
-    response = client.get_api_keys(nameQuery=name, includeValues=True)
-    return response["items"][0]["value"]
+    return api_key_resolver.resolve(name, profile, region)
 
 
 def execute_tests(
-    collection: str, environment, postman_api_key: str, endpoint_key: str
-) -> Tuple[str, str, bytes, int]:
-    """Execute newman test"""
-    cmd = (
-        f"newman run {collection}"
-        + f" --postman-api-key {postman_api_key}"
-        + f" --environment https://api.getpostman.com/environments/{environment}?apikey={postman_api_key}"
-        + f' --global-var "key={endpoint_key}"'
+    collection: str,
+    environment,
+    postman_api_key: str,
+    endpoint_key: str,
+    label: str = "",
+    cache: Optional[PostmanCache] = None,
+) -> NewmanResult:
+    """Execute newman test
+
+    With a cache, newman runs against local copies of the collection and
+    environment instead of downloading them.
+    """
+    prefix = f"[{label}] " if label else ""
+    sources = _sources(collection, environment, postman_api_key, cache)
+    with tempfile.TemporaryDirectory() as report_dir:
+        report_path = Path(report_dir) / REPORT_FILE
+        argv = _newman_argv(*sources, endpoint_key, report_path)
+        cmd, output, error, return_code = stream_command(
+            argv, sinks=[log_sink(log, prefix=prefix)]
+        )
+        report = load_report(report_path)
+    return NewmanResult(
+        cmd, output.decode("utf-8"), error, return_code, report
     )
-    process = subprocess.Popen(
-        cmd, stdout=subprocess.PIPE, shell=True  # noqa: S602
-    )  # TODO: Input santization for sec reasons  mark@e-bot7.com
-    output, error = process.communicate()
-    return_code = process.wait()
-    return cmd, output.decode("utf-8"), error, return_code
+
+
+async def aexecute_tests(
+    collection: str,
+    environment,
+    postman_api_key: str,
+    endpoint_key: str,
+    timeout: Optional[float] = None,
+    cache: Optional[PostmanCache] = None,
+) -> NewmanResult:
+    """Execute newman test as a coroutine"""
+    loop = asyncio.get_running_loop()
+    sources = await loop.run_in_executor(
+        None, _sources, collection, environment, postman_api_key, cache
+    )
+    with tempfile.TemporaryDirectory() as report_dir:
+        report_path = Path(report_dir) / REPORT_FILE
+        argv = _newman_argv(*sources, endpoint_key, report_path)
+        cmd, output, error, return_code = await arun_command(
+            argv, timeout=timeout
+        )
+        report = load_report(report_path)
+    return NewmanResult(
+        cmd, output.decode("utf-8"), error, return_code, report
+    )
+
+
+def _sources(
+    collection: str,
+    environment,
+    postman_api_key: str,
+    cache: Optional[PostmanCache],
+) -> Tuple[str, str, Optional[str]]:
+    """Resolves where newman reads the collection and environment from.
+
+    Returns:
+        Tuple[str, str, Optional[str]]: Collection, environment and the
+            Postman API key newman needs, None for local copies
+    """
+    if cache is None:
+        url = f"{POSTMAN_API}/environments/{environment}"
+        return collection, f"{url}?apikey={postman_api_key}", postman_api_key
+    return (
+        cache.collection(collection, postman_api_key),
+        cache.environment(environment, postman_api_key),
+        None,
+    )
+
+
+def _newman_argv(
+    collection: str,
+    environment: str,
+    postman_api_key: Optional[str],
+    endpoint_key: str,
+    report_path: Optional[Path] = None,
+) -> List[str]:
+    """Build newman command"""
+    api_key: List[str] = []
+    if postman_api_key is not None:
+        api_key = ["--postman-api-key", postman_api_key]
+    reporters: List[str] = []
+    if report_path is not None:
+        reporters = [
+            "--reporters",
+            "cli,json",
+            "--reporter-json-export",
+            str(report_path),
+        ]
+    return [
+        "newman",
+        "run",
+        collection,
+        *api_key,
+        "--environment",
+        environment,
+        "--global-var",
+        f"key={endpoint_key}",
+        *reporters,
+    ]
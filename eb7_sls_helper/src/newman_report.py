@@ -0,0 +1,252 @@
+"""Typed results of a newman run.
+
+newman writes a JSON report of the run with ``--reporters json``. The report
+is parsed into named tuples, which give totals, the failed assertions and
+response time statistics per request without scraping the CLI output.
+"""
+import json
+import math
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+Report_Document = Dict[str, Any]  # type: ignore[type-arg, misc]
+
+
+class AssertionResult(NamedTuple):
+    """Outcome of one test script assertion."""
+
+    name: str
+    passed: bool
+    message: Optional[str] = None
+
+
+class RequestResult(NamedTuple):
+    """Outcome of one executed request."""
+
+    name: str
+    method: str
+    url: str
+    status_code: Optional[int]
+    response_time: Optional[float]
+    assertions: List[AssertionResult]
+    error: Optional[str] = None
+
+    @property
+    def failed(self) -> bool:
+        """Whether the request errored or an assertion failed."""
+        return self.error is not None or any(
+            not x.passed for x in self.assertions
+        )
+
+
+class LatencyStats(NamedTuple):
+    """Response time statistics in milliseconds."""
+
+    samples: int
+    minimum: float
+    mean: float
+    p50: float
+    p95: float
+    maximum: float
+
+    @classmethod
+    def of(cls, samples: Iterable[float]) -> Optional["LatencyStats"]:
+        """Computes the statistics of samples.
+
+        Args:
+            samples (Iterable[float]): Response times
+
+        Returns:
+            Optional[LatencyStats]: The statistics, None without samples
+        """
+        ordered = sorted(samples)
+        if not ordered:
+            return None
+        return cls(
+            samples=len(ordered),
+            minimum=ordered[0],
+            mean=sum(ordered) / len(ordered),
+            p50=_percentile(ordered, 50),
+            p95=_percentile(ordered, 95),
+            maximum=ordered[-1],
+        )
+
+
+class NewmanReport(NamedTuple):
+    """Outcome of a newman run."""
+
+    collection: str
+    requests: List[RequestResult]
+    duration: Optional[float] = None
+
+    @property
+    def failures(self) -> List[RequestResult]:
+        """Requests that errored or failed an assertion."""
+        return [x for x in self.requests if x.failed]
+
+    @property
+    def assertion_count(self) -> int:
+        """Number of executed assertions."""
+        return sum(len(x.assertions) for x in self.requests)
+
+    @property
+    def failed_assertion_count(self) -> int:
+        """Number of failed assertions."""
+        return sum(
+            1 for x in self.requests for y in x.assertions if not y.passed
+        )
+
+    def latency(self) -> Dict[str, LatencyStats]:
+        """Response time statistics by request.
+
+        Requests executed several times, e.g. in several iterations, are
+        combined by method and name.
+
+        Returns:
+            Dict[str, LatencyStats]: Statistics keyed by "METHOD name"
+        """
+        samples: Dict[str, List[float]] = {}
+        for request in self.requests:
+            key = f"{request.method} {request.name}"
+            samples.setdefault(key, [])
+            if request.response_time is not None:
+                samples[key].append(request.response_time)
+        stats = {k: LatencyStats.of(v) for k, v in samples.items()}
+        return {k: v for k, v in stats.items() if v is not None}
+
+    def summary(self) -> str:
+        """Compact, markdown formatted summary of the run.
+
+        Returns:
+            str: Totals, the failed assertions and a latency table
+        """
+        lines = [
+            f"{len(self.requests)} requests, "
+            f"{len(self.failures)} failed; "
+            f"{self.assertion_count} assertions, "
+            f"{self.failed_assertion_count} failed"
+        ]
+        for request in self.failures:
+            lines += _failure_lines(request)
+        lines += _latency_table(self.latency())
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Report_Document:
+        """JSON-serializable totals and latency statistics of the run."""
+        return {
+            "collection": self.collection,
+            "duration": self.duration,
+            "requests": len(self.requests),
+            "failed_requests": len(self.failures),
+            "assertions": self.assertion_count,
+            "failed_assertions": self.failed_assertion_count,
+            "latency": {k: v._asdict() for k, v in self.latency().items()},
+        }
+
+
+def _failure_lines(request: RequestResult) -> List[str]:
+    """Markdown list of why a request failed."""
+    lines = [f"- `{request.method} {request.name}` failed:"]
+    if request.error is not None:
+        lines.append(f"  - {request.error}")
+    for assertion in request.assertions:
+        if not assertion.passed:
+            lines.append(f"  - {assertion.name}: {assertion.message}")
+    return lines
+
+
+def _latency_table(latency: Dict[str, LatencyStats]) -> List[str]:
+    """Markdown table of response time statistics, empty without any."""
+    if not latency:
+        return []
+    lines = [
+        "",
+        "| Request | n | mean ms | p95 ms | max ms |",
+        "| --- | --- | --- | --- | --- |",
+    ]
+    for key, stats in sorted(latency.items()):
+        lines.append(
+            f"| `{key}` | {stats.samples} | {stats.mean:.0f} "
+            f"| {stats.p95:.0f} | {stats.maximum:.0f} |"
+        )
+    return lines
+
+
+def parse_report(document: Report_Document) -> NewmanReport:
+    """Parses the document written by newman's JSON reporter.
+
+    Args:
+        document (Report_Document): The parsed JSON report
+
+    Returns:
+        NewmanReport: The typed results
+    """
+    run = document.get("run") or {}
+    requests = [_parse_execution(x) for x in run.get("executions") or []]
+    timings = run.get("timings") or {}
+    duration = None
+    if "started" in timings and "completed" in timings:
+        duration = float(timings["completed"] - timings["started"])
+    collection = (document.get("collection") or {}).get("info") or {}
+    return NewmanReport(str(collection.get("name", "")), requests, duration)
+
+
+def load_report(path: Path) -> Optional[NewmanReport]:
+    """Reads a JSON report written by newman.
+
+    Args:
+        path (Path): Export path of the JSON reporter
+
+    Returns:
+        Optional[NewmanReport]: The results, None if newman did not write
+            a (valid) report, e.g. because the collection could not be loaded
+    """
+    try:
+        with open(path) as file:
+            return parse_report(json.load(file))
+    except (OSError, ValueError):
+        return None
+
+
+def _parse_execution(execution: Report_Document) -> RequestResult:
+    """Parses one entry of run.executions."""
+    request = execution.get("request") or {}
+    response = execution.get("response") or {}
+    assertions = [
+        AssertionResult(
+            str(x.get("assertion", "")),
+            not x.get("error"),
+            (x.get("error") or {}).get("message"),
+        )
+        for x in execution.get("assertions") or []
+        if not x.get("skipped")
+    ]
+    error = execution.get("requestError")
+    response_time = response.get("responseTime")
+    return RequestResult(
+        name=str((execution.get("item") or {}).get("name", "")),
+        method=str(request.get("method", "GET")),
+        url=_format_url(request.get("url")),
+        status_code=response.get("code"),
+        response_time=None if response_time is None else float(response_time),
+        assertions=assertions,
+        error=None if not error else str(error.get("message", error)),
+    )
+
+
+def _format_url(url: Any) -> str:  # type: ignore[misc]
+    """Renders the URL object of the Postman SDK."""
+    if not isinstance(url, dict):
+        return str(url or "")
+    host = url.get("host") or []
+    host = ".".join(host) if isinstance(host, list) else str(host)
+    path = url.get("path") or []
+    path = "/".join(path) if isinstance(path, list) else str(path)
+    protocol = f"{url['protocol']}://" if url.get("protocol") else ""
+    return f"{protocol}{host}/{path}" if path else f"{protocol}{host}"
+
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted samples."""
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
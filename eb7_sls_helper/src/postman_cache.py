@@ -0,0 +1,283 @@
+"""Local copies of Postman collections and environments.
+
+newman downloads the collection and environment of every service on every
+run, which adds latency and counts against the Postman API rate limit. The
+PostmanCache keeps them as files in the helper's cache directory and points
+newman at those instead.
+
+Cached copies are revalidated before use: documents served by the Postman
+API are compared by the ``updatedAt`` version from one listing per kind and
+run, any other URL with a conditional request (ETag/Last-Modified). If
+revalidation fails, e.g. because of a rate limit, the cached copy is used.
+In offline mode only cached copies are used.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+Headers = Dict[str, str]
+Fetch = Callable[[str, Headers], Tuple[int, bytes, Headers]]
+Versions = Dict[str, str]
+Meta = Dict[str, object]
+
+POSTMAN_API = "https://api.getpostman.com"
+TIMEOUT = 30.0
+
+
+def _urlopen(url: str, headers: Headers) -> Tuple[int, bytes, Headers]:
+    """Fetches a URL.
+
+    Args:
+        url (str): http(s) URL
+        headers (Headers): Request headers
+
+    Returns:
+        Tuple[int, bytes, Headers]: Status code, body and response headers;
+            304 responses are returned, not raised
+    """
+    request = urllib.request.Request(url, headers=headers)  # noqa: S310
+    try:
+        with urllib.request.urlopen(  # noqa: S310 # http(s) only
+            request, timeout=TIMEOUT
+        ) as response:
+            return response.status, response.read(), dict(response.headers)
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            return 304, b"", dict(error.headers)
+        raise
+
+
+class PostmanCache(object):
+    """Caches Postman collections and environments as local files."""
+
+    def __init__(
+        self,
+        directory: Path,
+        offline: bool = False,
+        fetch: Fetch = _urlopen,
+    ) -> None:
+        """Constructor of PostmanCache.
+
+        Args:
+            directory (Path): Directory holding the cached documents
+            offline (bool): Only use cached copies, never the network.
+                Defaults to False.
+            fetch (Fetch): Function fetching a URL. Defaults to urllib.
+        """
+        self._directory = Path(directory)
+        self._offline = offline
+        self._fetch = fetch
+        self._versions: Dict[str, Optional[Versions]] = {}
+        self._lock = threading.Lock()
+
+    def collection(self, ref: str, api_key: str = "") -> str:
+        """Returns a local copy of a collection.
+
+        Args:
+            ref (str): Local file, URL, or ID/UID in the Postman API
+            api_key (str): Postman API key. Defaults to "".
+
+        Returns:
+            str: Path to pass to newman
+        """
+        return self._get("collections", "collection", ref, api_key)
+
+    def environment(self, ref: str, api_key: str = "") -> str:
+        """Returns a local copy of an environment.
+
+        Args:
+            ref (str): Local file, URL, or ID/UID in the Postman API
+            api_key (str): Postman API key. Defaults to "".
+
+        Returns:
+            str: Path to pass to newman
+        """
+        return self._get("environments", "environment", ref, api_key)
+
+    def _get(self, kind: str, model: str, ref: str, api_key: str) -> str:
+        """Resolves a reference to an up-to-date local file.
+
+        Args:
+            kind (str): Postman API resource, e.g. "collections"
+            model (str): Key wrapping the document in API responses
+            ref (str): Local file, URL, or ID/UID in the Postman API
+            api_key (str): Postman API key
+
+        Raises:
+            RuntimeError: Raised in offline mode if nothing is cached.
+
+        Returns:
+            str: Path of the document
+        """
+        if os.path.isfile(ref):
+            return ref
+        from_api = not ref.startswith(("http://", "https://"))
+        url = f"{POSTMAN_API}/{kind}/{ref}" if from_api else ref
+        name = hashlib.sha256(url.encode()).hexdigest()[:32]
+        path = self._directory / kind / f"{name}.json"
+        if self._offline:
+            return _get_offline(url, path)
+        headers = {"X-Api-Key": api_key} if from_api and api_key else {}
+        version = None
+        if from_api:
+            version = (self._list_versions(kind, headers) or {}).get(ref)
+        meta = _read_json(path.with_suffix(".meta")) or {}
+        fresh = version is not None and meta.get("version") == version
+        if fresh and path.is_file():
+            return str(path)
+        return self._revalidate(url, path, model, headers, meta, version)
+
+    def _revalidate(  # noqa: WPS211 # state of one document
+        self,
+        url: str,
+        path: Path,
+        model: str,
+        headers: Headers,
+        meta: Meta,
+        version: Optional[str],
+    ) -> str:
+        """Downloads a document unless the cached copy is still current.
+
+        Args:
+            url (str): URL of the document
+            path (Path): Path of the cached copy
+            model (str): Key wrapping the document in API responses
+            headers (Headers): Request headers with the API key
+            meta (Meta): Metadata of the cached copy
+            version (str, optional): Version listed by the Postman API
+
+        Returns:
+            str: Path of the document
+        """
+        cached = path.is_file()
+        if cached:
+            headers = {**headers, **_conditional_headers(meta)}
+        try:
+            status, body, response_headers = self._fetch(url, headers)
+            if status == 304:
+                return str(path)
+            document = json.loads(body)
+        except (OSError, ValueError) as error:
+            if not cached:
+                raise
+            log.warning(f"Using cached copy of {url}: {error}")
+            return str(path)
+        _write_json(path, _unwrap(document, model))
+        _write_json(path.with_suffix(".meta"), _meta(url, version, response_headers))
+        return str(path)
+
+    def _list_versions(
+        self, kind: str, headers: Headers
+    ) -> Optional[Versions]:
+        """Lists the updatedAt versions of all documents of a kind once.
+
+        Args:
+            kind (str): Postman API resource, e.g. "collections"
+            headers (Headers): Request headers with the API key
+
+        Returns:
+            Optional[Versions]: Versions by ID and UID, None if the listing
+                failed
+        """
+        with self._lock:
+            if kind not in self._versions:
+                self._versions[kind] = self._fetch_versions(kind, headers)
+            return self._versions[kind]
+
+    def _fetch_versions(
+        self, kind: str, headers: Headers
+    ) -> Optional[Versions]:
+        try:
+            _, body, _ = self._fetch(f"{POSTMAN_API}/{kind}", dict(headers))
+            items = json.loads(body).get(kind) or []
+        except (OSError, ValueError, AttributeError) as error:
+            log.warning(f"Cannot list Postman {kind}: {error}")
+            return None
+        return _item_versions(items)
+
+
+def _get_offline(url: str, path: Path) -> str:
+    """Path of the cached copy of a document, for offline mode.
+
+    Args:
+        url (str): URL of the document
+        path (Path): Path of the cached copy
+
+    Raises:
+        RuntimeError: Raised if nothing is cached.
+
+    Returns:
+        str: Path of the document
+    """
+    if not path.is_file():
+        raise RuntimeError(f"{url} is not cached; cannot run offline")
+    return str(path)
+
+
+def _conditional_headers(meta: Meta) -> Headers:
+    """Headers revalidating a cached copy with its ETag/Last-Modified."""
+    headers: Headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = str(meta["etag"])
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = str(meta["last_modified"])
+    return headers
+
+
+def _unwrap(document: object, model: str) -> object:
+    """Document without the key wrapping it in API responses."""
+    if isinstance(document, dict) and isinstance(document.get(model), dict):
+        return document[model]
+    return document
+
+
+def _meta(url: str, version: Optional[str], headers: Headers) -> Meta:
+    """Metadata of a downloaded document."""
+    headers = {k.lower(): v for k, v in headers.items()}
+    return {
+        "url": url,
+        "version": version,
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+        "fetched": time.time(),
+    }
+
+
+def _item_versions(items: List[Meta]) -> Versions:
+    """updatedAt versions of listed documents by ID and UID."""
+    versions: Versions = {}
+    for item in items:
+        if not item.get("updatedAt"):
+            continue
+        for key in ("id", "uid"):
+            if item.get(key):
+                versions[str(item[key])] = str(item["updatedAt"])
+    return versions
+
+
+def _read_json(path: Path) -> Optional[Any]:  # type: ignore[misc]
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: Path, document: Any) -> None:  # type: ignore[misc]
+    """Writes JSON atomically, so concurrent readers never see partial files."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(
+        f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    with open(tmp_path, "w") as file:
+        json.dump(document, file)
+    tmp_path.replace(path)
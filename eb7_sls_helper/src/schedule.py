@@ -0,0 +1,299 @@
+"""Orders deployments by the CloudFormation outputs services share.
+
+A service using another service's outputs can only be deployed after it.
+The DeployGraph reads those cross-stack references from each definition:
+
+- ``${cf:stack.Output}`` and ``${cf(region):stack.Output}`` refer to the
+  stack of another service, ``<service>-<stage>`` unless it sets
+  ``provider.stackName``
+- ``Fn::ImportValue`` / ``!ImportValue`` refer to an ``Export`` of another
+  service's ``resources.Outputs``
+- ``${output:service.Output}`` refers to another service by name
+
+References are read from the text of the definitions, as CloudFormation
+short-form tags cannot be parsed as plain YAML. Stage variables are
+replaced with the stage being deployed; references that stay ambiguous or
+point outside the deployed services are ignored.
+
+``run`` starts each service as soon as all services it depends on are
+deployed, so independent chains do not wait for each other.
+"""
+import logging
+import re
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Set, Tuple, TypeVar
+
+import yaml
+
+from eb7_sls_helper.src.utils.definition import load_definition
+
+T = TypeVar("T")  # noqa: WPS111 # Result of a scheduled task
+
+STAGE_VARIABLE_REGEX = re.compile(
+    r"\$\{(?:sls:stage|opt:stage[^}]*|self:provider\.stage[^}]*)\}"
+)
+SERVICE_VARIABLE_REGEX = re.compile(r"\$\{self:service\}")
+# Stack names can't contain dots; the name may contain stage variables
+CF_REF_REGEX = re.compile(
+    r"\$\{cf(?:\([^)]*\))?:((?:[^.{}$\s]|\$\{[^}]*\})+)\."
+)
+OUTPUT_REF_REGEX = re.compile(r"\$\{output:(?:[^:}]*:)*([\w-]+)\.")
+# Export names may contain variables, but end at a quote, comma or brace
+EXPORT_NAME_PATTERN = r"[\"']?((?:\$\{[^}]*\}|[^\s\"',{}])+)"
+IMPORT_VALUE_REGEX = re.compile(
+    r"(?:Fn::ImportValue[\"']?:|!ImportValue)[ \t]*" + EXPORT_NAME_PATTERN
+)
+EXPORT_NAME_REGEX = re.compile(
+    r"Export[\"']?:\s*\{?\s*[\"']?Name[\"']?:[ \t]*(?:!Sub[ \t]+)?"
+    + EXPORT_NAME_PATTERN
+)
+
+log = logging.getLogger(__name__)
+
+
+class UpstreamFailed(Exception):
+    """Raised for a service whose dependencies could not be deployed."""
+
+
+class DeployGraph(object):
+    """Dependencies between the services of a deployment."""
+
+    def __init__(self, upstreams: Dict[str, Set[str]]) -> None:
+        """Constructor of DeployGraph.
+
+        Args:
+            upstreams (Dict[str, Set[str]]): Definitions each definition
+                depends on; all of them must be keys
+        """
+        self._upstreams = upstreams
+
+    @property
+    def upstreams(self) -> Dict[str, Set[str]]:
+        """Upstreams getter.
+
+        Returns:
+            Dict[str, Set[str]]: Definitions each definition depends on
+        """
+        return self._upstreams
+
+    @classmethod
+    def build(
+        cls, definitions: List[str], stage: str, root: str = "."
+    ) -> "DeployGraph":
+        """Reads the cross-stack references of the definitions.
+
+        Args:
+            definitions (List[str]): Definition paths relative to root
+            stage (str): Stage being deployed
+            root (str): Repository root. Defaults to the current directory.
+
+        Returns:
+            DeployGraph: The dependencies among the definitions
+        """
+        texts: Dict[str, str] = {}
+        services: Dict[str, str] = {}
+        providers: Dict[str, Dict[str, str]] = {
+            "service": {},
+            "stack": {},
+            "export": {},
+        }
+        for definition in definitions:
+            text, service, stack = _read(Path(root), definition, stage)
+            texts[definition], services[definition] = text, service
+            for kind, name in _provided(text, stage, service, stack):
+                providers[kind][name] = definition
+        upstreams: Dict[str, Set[str]] = {}
+        for definition, text in texts.items():
+            found = {
+                providers[kind].get(name)
+                for kind, name in _references(text, stage, services[definition])
+            }
+            upstreams[definition] = {
+                x for x in found if x is not None and x != definition
+            }
+        return cls(upstreams)
+
+    def waves(self) -> List[List[str]]:
+        """Groups the definitions into waves of independent deployments.
+
+        Every definition comes after all its upstreams. Definitions on a
+        cycle are put together into a last wave.
+
+        Returns:
+            List[List[str]]: Sorted definitions by wave
+        """
+        done: Set[str] = set()
+        waves: List[List[str]] = []
+        pending = set(self._upstreams)
+        while pending:
+            wave = sorted(x for x in pending if self._upstreams[x] <= done)
+            if not wave:
+                wave = sorted(pending)
+            waves.append(wave)
+            done.update(wave)
+            pending.difference_update(wave)
+        return waves
+
+    def run(
+        self, task: Callable[[str], T], max_workers: int
+    ) -> Iterator[Tuple[str, "Future[T]"]]:
+        """Runs a task for every definition in dependency order.
+
+        A definition starts as soon as all its upstreams succeeded. If an
+        upstream fails, the definitions depending on it are not started;
+        their futures hold an UpstreamFailed error. Definitions on a cycle
+        start together once nothing else can run.
+
+        Args:
+            task (Callable[[str], T]): Deploys one definition
+            max_workers (int): Maximum number of tasks running at once
+
+        Yields:
+            Iterator[Tuple[str, Future[T]]]: Definitions with their done
+                futures, in order of completion
+        """
+        pending = set(self._upstreams)
+        succeeded: Set[str] = set()
+        failed: Set[str] = set()
+        running: Dict["Future[T]", str] = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            while pending or running:
+                yield from self._skip_blocked(pending, failed)
+                for definition in self._ready(pending, succeeded, running):
+                    pending.discard(definition)
+                    running[pool.submit(task, definition)] = definition
+                if not running:
+                    continue
+                done, _ = wait_futures(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    definition = running.pop(future)
+                    if future.exception() is None:
+                        succeeded.add(definition)
+                    else:
+                        failed.add(definition)
+                    yield definition, future
+
+    def _skip_blocked(
+        self, pending: Set[str], failed: Set[str]
+    ) -> List[Tuple[str, "Future[T]"]]:
+        """Fails the pending definitions that depend on failed ones.
+
+        Args:
+            pending (Set[str]): Definitions not started yet; updated
+            failed (Set[str]): Definitions that failed or were skipped;
+                updated
+
+        Returns:
+            List[Tuple[str, Future[T]]]: Skipped definitions with futures
+                holding an UpstreamFailed error
+        """
+        skipped: List[Tuple[str, "Future[T]"]] = []
+        changed = True
+        while changed:
+            changed = False
+            for definition in sorted(pending):
+                blocked = self._upstreams[definition] & failed
+                if blocked:
+                    pending.discard(definition)
+                    failed.add(definition)
+                    skipped.append((definition, _failed_future(blocked)))
+                    changed = True
+        return skipped
+
+    def _ready(
+        self,
+        pending: Set[str],
+        succeeded: Set[str],
+        running: Dict["Future[T]", str],
+    ) -> List[str]:
+        """Pending definitions whose upstreams all succeeded.
+
+        If nothing is ready or running, the remaining definitions are on a
+        cycle and all of them are ready.
+
+        Args:
+            pending (Set[str]): Definitions not started yet
+            succeeded (Set[str]): Definitions that succeeded
+            running (Dict[Future[T], str]): Definitions being deployed
+
+        Returns:
+            List[str]: Sorted definitions to start
+        """
+        ready = sorted(x for x in pending if self._upstreams[x] <= succeeded)
+        if not ready and not running and pending:
+            log.warning(f"Cyclic dependencies: {sorted(pending)}")
+            ready = sorted(pending)
+        return ready
+
+
+def _read(root: Path, definition: str, stage: str) -> Tuple[str, str, str]:
+    """Text, service name and stack name of a definition.
+
+    Unreadable definitions have no references; deploying them fails with a
+    better message.
+    """
+    path = root / definition
+    try:
+        text = path.read_text()
+        service, stack = _service_and_stack(path, stage)
+    except (OSError, yaml.YAMLError) as error:
+        log.warning(f"Cannot read references of {definition}: {error}")
+        return "", "", ""
+    return text, service, stack
+
+
+def _provided(
+    text: str, stage: str, service: str, stack: str
+) -> Iterator[Tuple[str, str]]:
+    """Kinds and names a definition can be referenced by."""
+    if service:
+        yield "service", service
+    if stack:
+        yield "stack", stack
+    for match in EXPORT_NAME_REGEX.finditer(text):
+        name = _resolve(match.group(1), stage, service)
+        yield "export", name.replace("${AWS::StackName}", stack)
+
+
+def _references(
+    text: str, stage: str, service: str
+) -> Iterator[Tuple[str, str]]:
+    """Kinds and names of the cross-stack references of a definition."""
+    for match in CF_REF_REGEX.finditer(text):
+        yield "stack", _resolve(match.group(1), stage, service)
+    for match in IMPORT_VALUE_REGEX.finditer(text):
+        yield "export", _resolve(match.group(1), stage, service)
+    for match in OUTPUT_REF_REGEX.finditer(text):
+        yield "service", match.group(1)
+
+
+def _service_and_stack(path: Path, stage: str) -> Tuple[str, str]:
+    """Service name and CloudFormation stack name of a definition."""
+    document = load_definition(path)
+    service = document.get("service") or ""
+    if isinstance(service, dict):  # Old syntax: service: {name: ...}
+        service = service.get("name") or ""
+    if not service:
+        return "", ""
+    provider = document.get("provider") or {}
+    stack = provider.get("stackName") or f"{service}-{stage}"
+    return str(service), _resolve(str(stack), stage, str(service))
+
+
+def _resolve(name: str, stage: str, service: str) -> str:
+    """Replaces stage and service variables in a name."""
+    name = STAGE_VARIABLE_REGEX.sub(stage, name.strip("\"'"))
+    return SERVICE_VARIABLE_REGEX.sub(service, name)
+
+
+def _failed_future(blocked: Set[str]) -> "Future[T]":
+    """Future of a definition whose upstreams failed."""
+    future: "Future[T]" = Future()
+    future.set_exception(
+        UpstreamFailed(
+            f"Not deployed, depends on failed {', '.join(sorted(blocked))}"
+        )
+    )
+    return future
@@ -1,15 +1,53 @@
 """Definition of sls function class"""
 from __future__ import annotations
+import asyncio
+import hashlib
+import logging
 import subprocess  # noqa: S404 # Use of subprocess required
-import os
-import yaml
+import threading
+import time
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from eb7_sls_helper.src import newman
+from eb7_sls_helper.src.artifacts import (
+    REMOTE_VALUES_TTL,
+    ArtifactCache,
+    uses_remote_values,
+)
+from eb7_sls_helper.src.fingerprint import StateStore, deploy_fingerprint
+from eb7_sls_helper.src.postman_cache import PostmanCache
+from eb7_sls_helper.src.utils.clients import get_account_id
+from eb7_sls_helper.src.utils.definition import load_definition
+from eb7_sls_helper.src.utils.runner import (
+    CommandResult,
+    arun_command,
+    log_sink,
+    run_command,
+    stream_command,
+)
+from eb7_sls_helper.src.utils.warm_pool import WarmPoolUnavailable, warm_pool
 from pathlib import Path
 from typing import Optional, List, Dict, Tuple, Union, Any
 
 Manfifest = Dict[str, Any]  # type: ignore[type-arg, misc]
 
+# Default output file of serverless-manifest-plugin, relative to the service
+DEFAULT_MANIFEST_OUTPUT = ".serverless/manifest.json"
+# Packages of deployments to one of several targets, relative to the service
+PACKAGE_DIR = ".serverless/targets"
+
+log = logging.getLogger(__name__)
+
+# Packaging writes to the service directory, one target at a time
+_package_locks: Dict[Path, threading.Lock] = {}
+_package_locks_lock = threading.Lock()
+
+
+def _package_lock(service_dir: Path) -> threading.Lock:
+    """Lock serializing packaging in a service directory."""
+    with _package_locks_lock:
+        return _package_locks.setdefault(service_dir, threading.Lock())
+
 
 class SlsFunction(object):
     """SlsFunction class."""
@@ -26,6 +64,9 @@ class SlsFunction(object):
         self._service: Optional[str] = None
         self._provider_name: Optional[str] = None
         self._runtime: Optional[str] = None
+        self._newman_collection: Optional[str] = None
+        self._newman_environment: Optional[Dict[str, str]] = None
+        self._manifest_output: str = DEFAULT_MANIFEST_OUTPUT
         if self._definition:
             self._parse_definition()
 
@@ -128,6 +169,61 @@ class SlsFunction(object):
         self._deployments.append(deployment)
         return deployment
 
+    def deploy_matrix(
+        self,
+        stages: List[str],
+        regions: List[str],
+        profile: Optional[str] = None,
+        state: Optional[StateStore] = None,
+        max_parallel: Optional[int] = None,
+        artifacts: Optional[ArtifactCache] = None,
+    ) -> Manfifest:
+        """Deploys the function to every combination of stage and region.
+
+        Targets are packaged one after another, as packaging writes to the
+        service directory, and deployed concurrently as soon as their
+        package is ready. A failing target does not cancel the others.
+
+        Args:
+            stages (List[str]): Stages to deploy to
+            regions (List[str]): Regions to deploy to
+            profile (str, optional): AWS profile. Defaults to None.
+            state (StateStore, optional): Store of deploy fingerprints, see
+                _Deployment.deploy. Defaults to None.
+            max_parallel (int, optional): Maximum number of targets deployed
+                at the same time. Defaults to None, i.e. all of them.
+            artifacts (ArtifactCache, optional): Packages to reuse, see
+                _Deployment.deploy. Defaults to None.
+
+        Raises:
+            RuntimeError: Raised after all targets finished if any failed.
+
+        Returns:
+            Manfifest: Manifest entries of the targets by stage and region,
+                e.g. ``{"dev": {"eu-central-1": {"urls": ...}}}``
+        """
+        targets = {
+            (stage, region): self.Deployment(stage, region, profile)
+            for stage in stages
+            for region in regions
+        }
+        if not targets:
+            return {}
+        workers = max(1, max_parallel or len(targets))
+        failures = _deploy_concurrently(
+            list(targets.values()), workers, state, artifacts
+        )
+        if failures:
+            raise RuntimeError(
+                f"Deployment of {self._service} failed for "
+                + ", ".join(sorted(failures))
+            )
+        merged: Manfifest = {}
+        for (stage, region), target in targets.items():
+            manifest = target.get_info() or {}
+            merged.setdefault(stage, {})[region] = manifest.get(stage)
+        return merged
+
     def _parse_definition(self) -> None:
         """Parses the sls definition
 
@@ -136,8 +232,7 @@ class SlsFunction(object):
                 missing in definition file
         """
         assert self._definition is not None
-        with open(self._definition) as file:
-            document = yaml.safe_load(file)
+        document = load_definition(self._definition)
         try:
             # Not-safe key access to check validity
             self._service = document["service"]
@@ -145,15 +240,15 @@ class SlsFunction(object):
             self._runtime = document["provider"]["runtime"]
         except KeyError:
             raise ValueError("Serverless definiton not valid")
-        if "custom" in document:
-            if "newmanCollection" in document.get("custom"):
-                self._newman_collection = document.get("custom").get(
-                    "newmanCollection"
-                )
-            if "newmanEnvironment" in document.get("custom"):
-                self._newman_environment = document.get("custom").get(
-                    "newmanEnvironment"
-                )
+        custom = document.get("custom") or {}
+        if "newmanCollection" in custom:
+            self._newman_collection = custom.get("newmanCollection")
+        if "newmanEnvironment" in custom:
+            self._newman_environment = custom.get("newmanEnvironment")
+        manifest_config = custom.get("manifest") or {}
+        self._manifest_output = str(
+            manifest_config.get("output") or DEFAULT_MANIFEST_OUTPUT
+        )
 
     class _Deployment(object):  # noqa: WPS431 # Google Style allows nesting
         """_Deployment class."""
@@ -242,6 +337,15 @@ class SlsFunction(object):
             """
             return self._profile
 
+        @property
+        def target(self) -> str:
+            """Stage and region, e.g. "dev/eu-central-1".
+
+            Returns:
+                str: Target of the deployment
+            """
+            return f"{self._stage}/{self._region}"
+
         @property
         def newman_collection(self) -> Optional[str]:
             """Newman Collection getter.
@@ -286,21 +390,110 @@ class SlsFunction(object):
             """
             return self._manifest
 
-        def deploy(self) -> None:
-            """Deploys the serverless function."""
-            cmd, output, error, return_code = self._run_sls_command("deploy")
-            self._read_manfifest()  # Update deployment after deploy
+        def deploy(
+            self,
+            state: Optional[StateStore] = None,
+            isolated: bool = False,
+            artifacts: Optional[ArtifactCache] = None,
+        ) -> None:
+            """Deploys the serverless function.
+
+            The manifest is taken from the file serverless-manifest-plugin
+            writes after the deploy. ``sls manifest`` only runs if that file
+            is missing or stale.
+
+            Args:
+                state (StateStore, optional): Store of deploy fingerprints.
+                    If given, the deploy is skipped when nothing changed
+                    since the last deploy recorded there and the stored
+                    manifest is used instead. Defaults to None.
+                isolated (bool): Package into a directory of this target
+                    first, so that other targets of the service can deploy
+                    at the same time. Defaults to False.
+                artifacts (ArtifactCache, optional): Packages by deploy
+                    fingerprint. If given, the package is taken from there
+                    or built into it, see package. Defaults to None.
+            """
+            fingerprint = self._fingerprint(state, artifacts)
+            if self._load_unchanged(state, fingerprint):
+                return
+            started = time.time()
+            if isolated or artifacts is not None:
+                package = self.package(artifacts, fingerprint)
+                self._run_sls_command(
+                    "deploy", "--package", str(package), stream=True
+                )
+            else:
+                self._run_sls_command("deploy", stream=True)
+            # The plugin's manifest file is shared by concurrent targets
+            if isolated or not self._load_manifest_output(started):
+                self._read_manfifest()  # Update deployment after deploy
+            self._save_state(state, fingerprint)
+
+        def package(
+            self,
+            artifacts: Optional[ArtifactCache] = None,
+            fingerprint: Optional[str] = None,
+        ) -> Path:
+            """Packages the function for this stage and region.
+
+            Args:
+                artifacts (ArtifactCache, optional): Packages by deploy
+                    fingerprint. If given, a stored package is reused and a
+                    new one stored. Defaults to None, i.e. the package is
+                    built into the service directory.
+                fingerprint (str, optional): Deploy fingerprint, if already
+                    computed. Defaults to None.
+
+            Returns:
+                Path: Directory of the package, for ``sls deploy --package``
+            """
+            if artifacts is None:
+                service_dir = Path(self._definition).parent.resolve()
+                target = f"{self._stage}-{self._region}"
+                directory = service_dir / PACKAGE_DIR / target
+                self._package_into(directory)
+                return directory
+            if fingerprint is None:
+                fingerprint = self._fingerprint(artifacts)
+            assert fingerprint is not None
+            return artifacts.package(
+                self._artifact_key(fingerprint),
+                self._package_into,
+                service=self._sls_function.service or "",
+                target=self.target,
+                remote_values=self._uses_remote_values(),
+            )
 
         def remove(self) -> None:
             """Removes the serverless function."""
-            cmd, output, error, return_code = self._run_sls_command("remove")
+            cmd, output, error, return_code = self._run_sls_command(
+                "remove", stream=True
+            )
             self._manifest = None
 
-        def test(self, postman_api_key: str) -> Tuple[str, str, bytes, int]:
-            """Runs integration tests for the function."""
+        def test(
+            self,
+            postman_api_key: str,
+            cache: Optional[PostmanCache] = None,
+        ) -> newman.NewmanResult:
+            """Runs integration tests for the function.
+
+            Args:
+                postman_api_key (str): API key of the Postman account
+                cache (PostmanCache, optional): Cache of the collection and
+                    environment. Defaults to None, i.e. newman downloads
+                    them.
+
+            Returns:
+                newman.NewmanResult: The command, stdout, stderr, return
+                    code and parsed report of newman
+            """
             assert self.profile is not None
             key = newman.get_api_key(
-                f"{self.stage}-{self._sls_function._service}", self.profile
+                f"{self.stage}-{self._sls_function._service}",
+                self.profile,
+                self.region,
             )
             assert self.newman_collection is not None
             return newman.execute_tests(
@@ -308,18 +501,208 @@ class SlsFunction(object):
                 self.newman_environment[self.stage],
                 postman_api_key,
                 key,
+                self._sls_function.service or "",
+                cache,
             )
 
         def _read_manfifest(self) -> None:
             """Upldates information on the deployed serverless function."""
             cmd, output, error, return_code = self._run_sls_command(
-                "manifest --json"
+                "manifest", "--json"
+            )
+            self._manifest = json.loads(output)
+
+        def _fingerprint(self, *stores: Optional[object]) -> Optional[str]:
+            """Fingerprint of the deployment, None if no store needs it."""
+            if all(x is None for x in stores):
+                return None
+            return deploy_fingerprint(
+                self._definition, str(self._stage), str(self._region)
+            )
+
+        def _artifact_key(self, fingerprint: str) -> str:
+            """Key of the package in an artifact cache.
+
+            Packages contain the AWS account, e.g. from
+            ``${aws:accountId}`` or ARNs, so the key covers the profile and
+            the account it resolves to.
+            """
+            account = get_account_id(self._profile)
+            text = f"{fingerprint}\0{self._profile}\0{account}"
+            return hashlib.sha256(text.encode()).hexdigest()
+
+        def _package_into(self, directory: Path) -> None:
+            """Runs ``sls package`` into a directory."""
+            service_dir = Path(self._definition).parent.resolve()
+            with _package_lock(service_dir):
+                self._run_sls_command(
+                    "package", "--package", str(directory), stream=True
+                )
+
+        def _state_key(self) -> str:
+            """Key of this deployment in a state store.
+
+            The profile selects the AWS account, so the same service, stage
+            and region of different accounts keep separate state.
+            """
+            service = self._sls_function.service
+            profile = self._profile or "default"
+            return f"{service}/{profile}/{self._stage}/{self._region}"
+
+        def _load_unchanged(
+            self, state: Optional[StateStore], fingerprint: Optional[str]
+        ) -> bool:
+            """Loads the stored manifest if the fingerprint is unchanged.
+
+            Values resolved from AWS (see uses_remote_values) are not
+            covered by the fingerprint, so definitions using them are only
+            skipped for REMOTE_VALUES_TTL seconds after their last deploy.
+
+            Args:
+                state (StateStore, optional): Store of deploy fingerprints
+                fingerprint (str, optional): Current fingerprint
+
+            Returns:
+                bool: Whether the deploy can be skipped
+            """
+            if state is None or fingerprint is None:
+                return False
+            previous = state.get(self._state_key())
+            if not previous or previous.get("fingerprint") != fingerprint:
+                return False
+            if not previous.get("manifest"):
+                return False
+            age = time.time() - float(previous.get("saved_at", 0))
+            if self._uses_remote_values() and age >= REMOTE_VALUES_TTL:
+                return False
+            log.info(f"{self._state_key()} is unchanged, skipping deploy")
+            self._manifest = previous["manifest"]
+            return True
+
+        def _save_state(
+            self, state: Optional[StateStore], fingerprint: Optional[str]
+        ) -> None:
+            """Records a successful deploy in the state store."""
+            if state is None or fingerprint is None:
+                return
+            state.put(
+                self._state_key(),
+                {
+                    "fingerprint": fingerprint,
+                    "manifest": self._manifest,
+                    "saved_at": time.time(),
+                },
+            )
+
+        def _uses_remote_values(self) -> bool:
+            """Whether the definition resolves values from AWS."""
+            return uses_remote_values(Path(self._definition).read_text())
+
+        def _load_manifest_output(self, since: float) -> bool:
+            """Loads the manifest written by the plugin during deploy.
+
+            Args:
+                since (float): Start of the deploy as unix timestamp. Older
+                    files are left over from previous deploys and ignored.
+
+            Returns:
+                bool: Whether a current manifest for the stage was loaded
+            """
+            path = (
+                Path(self._definition).parent
+                / self._sls_function._manifest_output
+            )
+            try:
+                if path.stat().st_mtime < since:
+                    return False
+                with open(path) as file:
+                    manifest = json.load(file)
+            except (OSError, ValueError):
+                return False
+            if not isinstance(manifest, dict) or self._stage not in manifest:
+                return False
+            self._manifest = manifest
+            return True
+
+        async def adeploy(
+            self,
+            timeout: Optional[float] = None,
+            state: Optional[StateStore] = None,
+        ) -> None:
+            """Deploys the serverless function as a coroutine.
+
+            Args:
+                timeout (float, optional): Seconds to wait for each sls
+                    command. Defaults to None, i.e. no timeout.
+                state (StateStore, optional): Store of deploy fingerprints,
+                    see deploy. Defaults to None.
+            """
+            fingerprint = self._fingerprint(state)
+            if self._load_unchanged(state, fingerprint):
+                return
+            started = time.time()
+            await self._arun_sls_command("deploy", timeout=timeout)
+            if not self._load_manifest_output(started):
+                await self._aread_manifest(timeout)
+            self._save_state(state, fingerprint)
+
+        async def aremove(self, timeout: Optional[float] = None) -> None:
+            """Removes the serverless function as a coroutine.
+
+            Args:
+                timeout (float, optional): Seconds to wait for the sls
+                    command. Defaults to None, i.e. no timeout.
+            """
+            await self._arun_sls_command("remove", timeout=timeout)
+            self._manifest = None
+
+        async def atest(
+            self,
+            postman_api_key: str,
+            timeout: Optional[float] = None,
+            cache: Optional[PostmanCache] = None,
+        ) -> newman.NewmanResult:
+            """Runs integration tests for the function as a coroutine.
+
+            Args:
+                postman_api_key (str): API key of the Postman account
+                timeout (float, optional): Seconds to wait for newman.
+                    Defaults to None, i.e. no timeout.
+                cache (PostmanCache, optional): Cache of the collection and
+                    environment. Defaults to None.
+
+            Returns:
+                newman.NewmanResult: The command, stdout, stderr, return
+                    code and parsed report of newman
+            """
+            assert self.profile is not None
+            loop = asyncio.get_running_loop()
+            key = await loop.run_in_executor(
+                None,
+                newman.get_api_key,
+                f"{self.stage}-{self._sls_function._service}",
+                self.profile,
+                self.region,
+            )
+            assert self.newman_collection is not None
+            return await newman.aexecute_tests(
+                self.newman_collection,
+                self.newman_environment[self.stage],
+                postman_api_key,
+                key,
+                timeout,
+                cache,
+            )
+
+        async def _aread_manifest(self, timeout: Optional[float] = None) -> None:
+            """Updates information on the deployed function as a coroutine."""
+            cmd, output, error, return_code = await self._arun_sls_command(
+                "manifest", "--json", timeout=timeout
             )
             self._manifest = json.loads(output)
 
         def _parse_definition(self) -> None:
-            with open(self._definition) as file:
-                document = yaml.safe_load(file)
+            document = load_definition(self._definition)
             keys = ["region", "profile", "stage"]
             for k in keys:
                 if k in document["provider"]:
@@ -332,59 +715,172 @@ class SlsFunction(object):
                     )
             if "custom" in document:
                 print("Custom section found")
-                if "newmanCollection" in document.get("custom"):
-                    self._newman_collection = document.get("custom").get(
-                        "newmanCollection"
-                    )
-                if "newmanEnvironment" in document.get("custom"):
-                    self._newman_environment = (
-                        document.get("custom")
-                        .get("newmanEnvironment")
-                        .get(self._stage)
-                    )
+            custom = document.get("custom") or {}
+            if "newmanCollection" in custom:
+                self._newman_collection = custom.get("newmanCollection")
+            if "newmanEnvironment" in custom:
+                environments = custom.get("newmanEnvironment") or {}
+                self._newman_environment = environments.get(self._stage)
             print(self.newman_collection)
             print(self.newman_environment)
 
         def _run_sls_command(
-            self, operation: str
-        ) -> Tuple[str, bytes, bytes, int]:
+            self, *operation: str, stream: bool = False
+        ) -> CommandResult:
             """Executes sls command in subprocess.
 
+            The command runs in the directory of the definition with the
+            region of this deployment in its environment. Neither is set
+            process-wide, so deployments can run concurrently.
+
             Args:
-                operation (str): The sls command to execute.
+                *operation (str): The sls command and its arguments,
+                    e.g. ``"manifest", "--json"``.
                     See https://serverless.com/framework/docs/providers/aws/
+                stream (bool): Log output line by line while the command
+                    runs and keep only its tail. Such commands run in a warm
+                    process if the warm pool is enabled. Defaults to False.
 
             Raises:
                 RuntimeError: Raised if serverless command execution failed.
 
             Returns:
-                Tuple[str, bytes, bytes, int]: The command, stdout, stderr,
-                    and return code
+                CommandResult: The command, stdout, stderr, and return code
             """
-            cwd = os.getcwd()
-            parent = Path(self._definition).parent
-            filename = Path(self._definition).name
-            os.chdir(parent)
+            argv, cwd, env = self._sls_command(*operation)
             try:
-                cmd = (
-                    f"sls {operation} --config {filename} "
-                    + f"--stage {self._stage} "
-                    + f"--profile {self._profile} --region {self._region}"
+                if stream:
+                    return self._stream_sls_command(argv, cwd, env)
+                return run_command(argv, cwd=cwd, env=env, check=True)
+            except subprocess.CalledProcessError as error:
+                print(error.output)
+                print(error.stderr)
+                raise RuntimeError(f"Execution of {error.cmd} failed")
+
+        def _stream_sls_command(
+            self, argv: List[str], cwd: Path, env: Dict[str, str]
+        ) -> CommandResult:
+            """Runs a command logging its output, in a warm process if any.
+
+            Args:
+                argv (List[str]): The sls command line
+                cwd (Path): Directory of the definition
+                env (Dict[str, str]): Environment overrides
+
+            Returns:
+                CommandResult: The command, output tail, stderr and return
+                    code
+            """
+            sinks = [log_sink(log, prefix=self._log_prefix())]
+            if warm_pool.enabled:
+                try:
+                    return warm_pool.run(
+                        argv, cwd=cwd, env=env, check=True, sinks=sinks
+                    )
+                except WarmPoolUnavailable:
+                    log.debug("Warm pool unavailable, starting sls")
+            return stream_command(
+                argv, cwd=cwd, env=env, check=True, sinks=sinks
+            )
+
+        async def _arun_sls_command(
+            self, *operation: str, timeout: Optional[float] = None
+        ) -> CommandResult:
+            """Executes sls command in subprocess as a coroutine.
+
+            Args:
+                *operation (str): The sls command and its arguments.
+                timeout (float, optional): Seconds to wait for the command.
+                    Defaults to None, i.e. no timeout.
+
+            Raises:
+                RuntimeError: Raised if serverless command execution failed
+                    or timed out.
+
+            Returns:
+                CommandResult: The command, stdout, stderr, and return code
+            """
+            argv, cwd, env = self._sls_command(*operation)
+            try:
+                return await arun_command(
+                    argv, cwd=cwd, env=env, check=True, timeout=timeout
                 )
-                process = subprocess.Popen(
-                    cmd, stdout=subprocess.PIPE, shell=True  # noqa: S602
-                )  # TODO: Input santization for sec reasons  mark@e-bot7.com
-                output, error = process.communicate()
-                return_code = process.wait()
-                if return_code:
-                    raise subprocess.CalledProcessError(return_code, cmd)
-            except subprocess.CalledProcessError:
-                print(output)
-                print(error)
-                raise RuntimeError(f"Execution of {cmd} failed")
-            finally:
-                os.chdir(cwd)
-            return cmd, output, error, return_code
+            except subprocess.CalledProcessError as error:
+                print(error.output)
+                print(error.stderr)
+                raise RuntimeError(f"Execution of {error.cmd} failed")
+            except subprocess.TimeoutExpired as error:
+                raise RuntimeError(
+                    f"Execution of {error.cmd} timed out after {timeout}s"
+                )
+
+        def _log_prefix(self) -> str:
+            """Prefix telling this deployment's output lines apart."""
+            return f"[{self._sls_function.service}] "
+
+        def _sls_command(
+            self, *operation: str
+        ) -> Tuple[List[str], Path, Dict[str, str]]:
+            """Builds argv, working directory and environment of a command.
+
+            Args:
+                *operation (str): The sls command and its arguments.
+
+            Returns:
+                Tuple[List[str], Path, Dict[str, str]]: argv list, directory
+                    of the definition and environment overrides
+            """
+            argv = [
+                "sls",
+                *operation,
+                "--config",
+                Path(self._definition).name,
+                "--stage",
+                str(self._stage),
+                "--profile",
+                str(self._profile),
+                "--region",
+                str(self._region),
+            ]
+            env = {
+                "AWS_REGION": str(self._region),
+                "AWS_DEFAULT_REGION": str(self._region),
+            }
+            return argv, Path(self._definition).parent, env
+
+
+def _deploy_concurrently(
+    targets: List[SlsFunction._Deployment],
+    workers: int,
+    state: Optional[StateStore],
+    artifacts: Optional[ArtifactCache],
+) -> Dict[str, str]:
+    """Deploys targets of a function on a pool of threads.
+
+    Args:
+        targets (List[SlsFunction._Deployment]): Targets to deploy
+        workers (int): Maximum number of targets deployed at the same time
+        state (StateStore, optional): Store of deploy fingerprints
+        artifacts (ArtifactCache, optional): Packages to reuse
+
+    Returns:
+        Dict[str, str]: Error messages of the failed targets by target
+    """
+    isolated = len(targets) > 1
+    failures: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(target.deploy, state, isolated, artifacts): target
+            for target in targets
+        }
+        for future in as_completed(futures):
+            target = futures[future]
+            try:
+                future.result()
+            except Exception as error:  # noqa: B902 # report, don't cancel
+                log.error(f"Deployment to {target.target} failed: {error}")
+                failures[target.target] = str(error)
+    return failures
 
 
 class Lambda(SlsFunction):
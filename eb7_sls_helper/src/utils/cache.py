@@ -0,0 +1,29 @@
+"""Location of files the helper keeps between runs."""
+import os
+from pathlib import Path
+
+
+def cache_dir(name: str = "") -> Path:
+    """Returns (and creates) a directory in the helper's cache.
+
+    The cache lives in ``INPUT_CACHE_DIR`` if set, otherwise in
+    ``$XDG_CACHE_HOME/eb7-sls-helper`` or ``~/.cache/eb7-sls-helper``.
+    Point it at a directory restored by actions/cache to keep it across
+    workflow runs.
+
+    Args:
+        name (str): Subdirectory for one kind of cached data.
+            Defaults to the cache root.
+
+    Returns:
+        Path: The directory
+    """
+    base = os.environ.get("INPUT_CACHE_DIR")
+    if base:
+        root = Path(base)
+    else:
+        xdg = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        root = Path(xdg) / "eb7-sls-helper"
+    directory = root / name if name else root
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
@@ -0,0 +1,137 @@
+"""Process-wide pool of boto3 sessions and clients.
+
+Creating a boto3 client loads botocore's service models and reads the
+credential files, so every (service, profile, region, endpoint) combination
+gets one client that is reused by all services of a run. Clients are
+thread-safe once created; creation itself is serialized because boto3
+sessions are not.
+"""
+import threading
+from typing import Dict, Optional, Tuple
+
+import boto3
+
+Client_Key = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+
+class ClientPool(object):
+    """Cache of boto3 clients keyed by service, profile and region."""
+
+    def __init__(self) -> None:
+        """Constructor of ClientPool."""
+        self._sessions: Dict[Optional[str], boto3.Session] = {}
+        self._clients: Dict[Client_Key, object] = {}
+        self._accounts: Dict[Optional[str], str] = {}
+        # Reentrant, as account_id creates its STS client holding it
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        """Number of cached clients."""
+        return len(self._clients)
+
+    def client(
+        self,
+        service: str,
+        profile: Optional[str] = None,
+        region: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+    ) -> object:
+        """Returns a cached client, creating it on first use.
+
+        Args:
+            service (str): AWS service, e.g. "apigateway"
+            profile (str, optional): AWS profile. Defaults to the default
+                credential chain.
+            region (str, optional): AWS region. Defaults to the session's.
+            endpoint_url (str, optional): Custom endpoint, e.g. of a local
+                stand-in. Defaults to None.
+
+        Returns:
+            object: The boto3 client
+        """
+        key = (service, profile or None, region, endpoint_url)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            if key not in self._clients:
+                session = self._session(profile or None)
+                self._clients[key] = session.client(
+                    service, region_name=region, endpoint_url=endpoint_url
+                )
+            return self._clients[key]
+
+    def account_id(self, profile: Optional[str] = None) -> str:
+        """Returns the AWS account of a profile, asking STS on first use.
+
+        Args:
+            profile (str, optional): AWS profile. Defaults to the default
+                credential chain.
+
+        Returns:
+            str: The account ID
+        """
+        key = profile or None
+        with self._lock:
+            if key not in self._accounts:
+                sts = self.client("sts", key)
+                identity = sts.get_caller_identity()  # type: ignore[attr-defined]
+                self._accounts[key] = str(identity["Account"])
+            return self._accounts[key]
+
+    def close(self) -> None:
+        """Closes all clients and drops sessions."""
+        with self._lock:
+            self._accounts.clear()
+            for client in self._clients.values():
+                close = getattr(client, "close", None)
+                if close is not None:
+                    close()
+            self._clients.clear()
+            self._sessions.clear()
+
+    def _session(self, profile: Optional[str]) -> boto3.Session:
+        """Returns the session of a profile; call with the lock held."""
+        if profile not in self._sessions:
+            self._sessions[profile] = boto3.Session(profile_name=profile)
+        return self._sessions[profile]
+
+
+client_pool = ClientPool()
+
+
+def get_client(
+    service: str,
+    profile: Optional[str] = None,
+    region: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+) -> object:
+    """Returns a client from the process-wide pool.
+
+    Args:
+        service (str): AWS service, e.g. "apigateway"
+        profile (str, optional): AWS profile. Defaults to None.
+        region (str, optional): AWS region. Defaults to None.
+        endpoint_url (str, optional): Custom endpoint. Defaults to None.
+
+    Returns:
+        object: The boto3 client
+    """
+    return client_pool.client(service, profile, region, endpoint_url)
+
+
+def get_account_id(profile: Optional[str] = None) -> str:
+    """Returns the AWS account of a profile from the process-wide pool.
+
+    Args:
+        profile (str, optional): AWS profile. Defaults to None.
+
+    Returns:
+        str: The account ID
+    """
+    return client_pool.account_id(profile)
+
+
+def close_clients() -> None:
+    """Closes all clients of the process-wide pool."""
+    client_pool.close()
@@ -0,0 +1,188 @@
+"""Process-wide cache of parsed serverless definitions.
+
+Every SlsFunction and _Deployment built from the same file shares one parsed
+document. Entries are keyed by the resolved path and invalidated when the
+file's mtime or size changes. The documents are shared, so callers must
+treat them as read-only.
+
+Definitions are parsed with libyaml (``yaml.CSafeLoader``) when PyYAML was
+built with it. Top-level sections are only turned into Python objects when
+they are accessed, so large ``resources`` or ``functions`` trees cost
+nothing unless someone reads them.
+"""
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple, Union
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader  # noqa: N813
+except ImportError:  # pragma: no cover # PyYAML without libyaml
+    from yaml import SafeLoader  # type: ignore[assignment]
+
+Document = Mapping[str, Any]  # type: ignore[type-arg, misc]
+Path_Like = Union[str, Path]
+Stamp = Tuple[int, int]
+Entry = Tuple[Stamp, Document]
+
+CACHE_SIZE = 128
+
+
+class DefinitionCache(object):
+    """LRU cache of parsed definitions."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE) -> None:
+        """Constructor of DefinitionCache.
+
+        Args:
+            maxsize (int): Maximum number of cached definitions.
+                Defaults to CACHE_SIZE.
+        """
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        """Number of cached definitions."""
+        return len(self._entries)
+
+    def load(self, path: Path_Like) -> Document:
+        """Returns the parsed definition, parsing it only if needed.
+
+        Args:
+            path (Path_Like): Path to the serverless definition
+
+        Returns:
+            Document: The parsed definition
+        """
+        key = str(Path(path).resolve())
+        stat = Path(key).stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        document = self._get(key, stamp)
+        if document is None:
+            document = parse_definition(key)
+            self._put(key, stamp, document)
+        return document
+
+    def clear(self) -> None:
+        """Drops all cached definitions."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _get(self, key: str, stamp: Stamp) -> Optional[Document]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _put(self, key: str, stamp: Stamp, document: Document) -> None:
+        with self._lock:
+            self._entries[key] = (stamp, document)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+
+class LazyDocument(Mapping):  # type: ignore[type-arg]
+    """Read-only mapping constructing top-level sections on first access."""
+
+    def __init__(self, loader: SafeLoader, node: yaml.MappingNode) -> None:
+        """Constructor of LazyDocument.
+
+        Args:
+            loader (SafeLoader): Loader that composed the node tree
+            node (yaml.MappingNode): Root node of the document
+        """
+        self._loader = loader
+        self._nodes: Dict[str, yaml.Node] = {}
+        for key_node, value_node in node.value:
+            key = loader.construct_object(key_node, deep=True)
+            self._nodes[key] = value_node
+        self._values: Dict[str, Any] = {}  # type: ignore[misc]
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: str) -> Any:  # type: ignore[misc]
+        """Returns a section, constructing it if needed."""
+        try:
+            return self._values[key]
+        except KeyError:
+            node = self._nodes[key]
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = self._loader.construct_object(
+                    node, deep=True
+                )
+            return self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterates over the section names."""
+        return iter(self._nodes)
+
+    def __len__(self) -> int:
+        """Number of sections."""
+        return len(self._nodes)
+
+    def __contains__(self, key: object) -> bool:
+        """Checks for a section without constructing it."""
+        return key in self._nodes
+
+
+def parse_definition(path: Path_Like) -> Document:
+    """Parses a serverless definition without caching.
+
+    Args:
+        path (Path_Like): Path to the serverless definition
+
+    Returns:
+        Document: The parsed definition
+    """
+    with open(path, "rb") as file:
+        loader = SafeLoader(file)
+        try:
+            node = loader.get_single_node()
+        finally:
+            loader.dispose()
+    if node is None:
+        return {}
+    if not isinstance(node, yaml.MappingNode) or _has_merge_keys(node):
+        return loader.construct_document(node)
+    return LazyDocument(loader, node)
+
+
+def _has_merge_keys(node: yaml.MappingNode) -> bool:
+    """Checks whether a root mapping cannot be split into lazy sections.
+
+    Args:
+        node (yaml.MappingNode): Root node of the document
+
+    Returns:
+        bool: True if a merge key needs the whole document
+    """
+    return any(
+        key_node.tag == "tag:yaml.org,2002:merge" for key_node, _ in node.value
+    )
+
+
+definition_cache = DefinitionCache()
+
+
+def load_definition(path: Path_Like) -> Document:
+    """Returns the parsed definition from the process-wide cache.
+
+    Args:
+        path (Path_Like): Path to the serverless definition
+
+    Returns:
+        Document: The parsed definition; do not modify it
+    """
+    return definition_cache.load(path)
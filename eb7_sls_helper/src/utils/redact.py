@@ -0,0 +1,198 @@
+"""Removes secrets from the output of commands.
+
+The Redactor knows the secrets of a run (AWS keys, the Postman API key,
+API Gateway keys, ...) as literals plus patterns of well-known credentials.
+Literals are replaced with ``bytes.replace`` and patterns only searched in
+data containing one of their fixed parts, which keeps redaction in the
+range of hundreds of MB/s.
+
+StreamRedactor applies it to output arriving in chunks of arbitrary size.
+Secrets never span lines, so complete lines are redacted as a block; of a
+partial line, it holds back just enough that a secret split between two
+chunks is still found.
+"""
+import re
+import threading
+from typing import Iterable, Match, Optional, Pattern, Sequence, Tuple
+
+REPLACEMENT = b"***"
+MIN_SECRET_LENGTH = 4
+# Upper bound of a match of PATTERNS, needed to hold back output
+MAX_PATTERN_LENGTH = 128
+GITHUB_URL_REPLACEMENT = b"https://***@github.com"
+# Patterns with literals every match contains, to skip data without any
+PATTERNS = (
+    # Access tokens in clone URLs
+    (rb"https://(?P<github>[a-z0-9]{1,100})@github\.com", (b"@github.com",)),
+    # AWS access key ids
+    (rb"A[KS]IA[0-9A-Z]{16}(?![0-9A-Z])", (b"AKIA", b"ASIA")),
+)
+_pattern_regexes = [(re.compile(x), anchors) for x, anchors in PATTERNS]
+
+
+class Redactor(object):
+    """Replaces known secrets and credential patterns in output."""
+
+    def __init__(self, secrets: Iterable[str] = ()) -> None:
+        """Constructor of Redactor.
+
+        Args:
+            secrets (Iterable[str]): Literal secrets. Defaults to none.
+        """
+        # Replaced, never changed in place, as redact reads it without lock
+        self._secrets: Tuple[bytes, ...] = ()
+        self._lock = threading.Lock()
+        self._regex: Pattern[bytes] = _compile(self._secrets)
+        self._holdback = MAX_PATTERN_LENGTH - 1
+        self.add(*secrets)
+
+    @property
+    def holdback(self) -> int:
+        """Bytes a stream holds back so that no split match is missed."""
+        return self._holdback
+
+    def add(self, *secrets: Optional[str]) -> None:
+        """Registers literal secrets.
+
+        Empty and very short values are ignored, as redacting them would
+        garble the output without protecting anything.
+
+        Args:
+            secrets (str): The secrets
+        """
+        with self._lock:
+            known = set(self._secrets)
+            for secret in secrets:
+                if not secret or len(secret.strip()) < MIN_SECRET_LENGTH:
+                    continue
+                for line in secret.strip().splitlines():
+                    value = line.encode("utf-8")
+                    if len(value) >= MIN_SECRET_LENGTH:
+                        known.add(value)
+            # Longest first, so a secret containing another is fully removed
+            ordered = tuple(sorted(known, key=len, reverse=True))
+            longest = len(ordered[0]) if ordered else 0
+            self._regex = _compile(ordered)
+            self._holdback = max(longest, MAX_PATTERN_LENGTH) - 1
+            self._secrets = ordered
+
+    def clear(self) -> None:
+        """Forgets all literal secrets."""
+        with self._lock:
+            self._secrets = ()
+            self._regex = _compile(self._secrets)
+            self._holdback = MAX_PATTERN_LENGTH - 1
+
+    @property
+    def regex(self) -> Pattern[bytes]:
+        """Compiled matcher of all secrets and patterns."""
+        return self._regex
+
+    def redact(self, data: bytes) -> bytes:
+        """Redacts complete output.
+
+        Args:
+            data (bytes): The output
+
+        Returns:
+            bytes: The output without secrets
+        """
+        secrets = self._secrets
+        for secret in secrets:
+            if secret in data:
+                data = data.replace(secret, REPLACEMENT)
+        for regex, anchors in _pattern_regexes:
+            if any(x in data for x in anchors):
+                data = regex.sub(_replacement, data)
+        return data
+
+    def redact_str(self, text: str) -> str:
+        """Redacts a string, e.g. a command line.
+
+        Args:
+            text (str): The text
+
+        Returns:
+            str: The text without secrets
+        """
+        redacted = self.redact(text.encode("utf-8"))
+        return redacted.decode("utf-8", errors="replace")
+
+
+class StreamRedactor(object):
+    """Redacts output that arrives in chunks."""
+
+    def __init__(self, redactor: Redactor) -> None:
+        """Constructor of StreamRedactor.
+
+        Args:
+            redactor (Redactor): Secrets and patterns to remove
+        """
+        self._redactor = redactor
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Redacts the part of the output that is known to be complete.
+
+        Everything up to the last line break is passed on; of a long partial
+        line, the last holdback bytes are kept until the next chunk.
+
+        Args:
+            chunk (bytes): Next piece of output
+
+        Returns:
+            bytes: Redacted output, possibly empty
+        """
+        buffer = self._buffer + chunk
+        line_end = buffer.rfind(b"\n") + 1
+        cut = len(buffer) - self._redactor.holdback
+        if line_end >= cut:
+            self._buffer = buffer[line_end:]
+            return self._redactor.redact(buffer[:line_end])
+        # A long partial line: only emit what no match can extend beyond
+        parts = []
+        position = 0
+        for match in self._redactor.regex.finditer(buffer):
+            if match.start() >= cut:
+                break
+            parts.append(buffer[position : match.start()])
+            parts.append(_replacement(match))
+            position = match.end()
+        end = max(cut, position)
+        parts.append(buffer[position:end])
+        self._buffer = buffer[end:]
+        return b"".join(parts)
+
+    def flush(self) -> bytes:
+        """Redacts and returns the held back rest of the output.
+
+        Returns:
+            bytes: Redacted output
+        """
+        rest, self._buffer = self._buffer, b""
+        return self._redactor.redact(rest)
+
+
+def _replacement(match: Match[bytes]) -> bytes:
+    """Replacement of a match, keeping the host of clone URLs readable."""
+    if match.lastgroup == "github":
+        return GITHUB_URL_REPLACEMENT
+    return REPLACEMENT
+
+
+def _compile(secrets: Sequence[bytes]) -> Pattern[bytes]:
+    """Compiles literal secrets and PATTERNS into one regex."""
+    alternatives = [re.escape(x) for x in secrets] + [x for x, _ in PATTERNS]
+    return re.compile(b"|".join(alternatives))
+
+
+redactor = Redactor()
+
+
+def add_secrets(*secrets: Optional[str]) -> None:
+    """Registers secrets with the process-wide redactor.
+
+    Args:
+        secrets (str): The secrets
+    """
+    redactor.add(*secrets)
@@ -0,0 +1,355 @@
+"""Runs external commands (sls, newman, tox) in subprocesses.
+
+Every call gets its own working directory and environment and never touches
+process-wide state such as ``os.chdir`` or ``os.environ``, so commands can be
+run from many threads at the same time. ``arun_command`` is the asyncio
+counterpart for running many commands from a single event loop.
+
+``stream_command`` hands each line of output to a list of sinks while the
+command is running and keeps only a bounded tail for error reporting.
+
+All output and command lines pass through the process-wide redactor, so
+registered secrets never reach logs, sinks or results.
+"""
+import asyncio
+import logging
+import os
+import shlex
+import subprocess  # noqa: S404 # Use of subprocess required
+from collections import deque
+from pathlib import Path
+from typing import (
+    IO,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+from eb7_sls_helper.src.utils.redact import StreamRedactor, redactor
+
+Path_Like = Union[str, Path]
+Line_Sink = Callable[[str], None]
+
+TAIL_LINES = 200
+CHUNK_SIZE = 65536
+
+
+class CommandResult(NamedTuple):
+    """Outcome of a finished command.
+
+    Unpacks like the ``(cmd, output, error, return_code)`` tuples returned
+    by the helpers before.
+    """
+
+    cmd: str
+    output: bytes
+    error: bytes
+    return_code: int
+
+
+def build_env(env: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Builds the environment of a child process.
+
+    Args:
+        env (Dict[str, str], optional): Variables set for this command only,
+            on top of the current process environment. Defaults to None.
+
+    Returns:
+        Dict[str, str]: Complete environment of the child process
+    """
+    child_env = dict(os.environ)
+    if env:
+        child_env.update(env)
+    return child_env
+
+
+def format_cmd(argv: List[str]) -> str:
+    """Formats an argv list as a shell-quoted string for logging.
+
+    Args:
+        argv (List[str]): Program and arguments
+
+    Returns:
+        str: Printable command with secrets redacted
+    """
+    return redactor.redact_str(shlex.join(argv))
+
+
+def run_command(
+    argv: List[str],
+    cwd: Optional[Path_Like] = None,
+    env: Optional[Dict[str, str]] = None,
+    check: bool = False,
+) -> CommandResult:
+    """Runs a command without a shell and waits for it to finish.
+
+    Args:
+        argv (List[str]): Program and arguments
+        cwd (Path_Like, optional): Working directory of the command.
+            Defaults to the current working directory.
+        env (Dict[str, str], optional): Extra environment variables for
+            this command only. Defaults to None.
+        check (bool): Raise if the command exits non-zero. Defaults to False.
+
+    Raises:
+        CalledProcessError: Raised if check is set and the command failed.
+
+    Returns:
+        CommandResult: The command, stdout, stderr and return code
+    """
+    cmd = format_cmd(argv)
+    process = subprocess.Popen(  # noqa: S603 # argv list, no shell
+        argv,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        env=build_env(env),
+    )
+    output, error = process.communicate()
+    return_code = process.wait()
+    output, error = redactor.redact(output), redactor.redact(error)
+    if check and return_code:
+        raise subprocess.CalledProcessError(return_code, cmd, output, error)
+    return CommandResult(cmd, output, error, return_code)
+
+
+def stream_command(
+    argv: List[str],
+    cwd: Optional[Path_Like] = None,
+    env: Optional[Dict[str, str]] = None,
+    check: bool = False,
+    sinks: Optional[List[Line_Sink]] = None,
+    tail_lines: Optional[int] = TAIL_LINES,
+) -> CommandResult:
+    """Runs a command without a shell and streams its output line by line.
+
+    stderr is merged into stdout so lines reach the sinks in order.
+
+    Args:
+        argv (List[str]): Program and arguments
+        cwd (Path_Like, optional): Working directory of the command.
+            Defaults to the current working directory.
+        env (Dict[str, str], optional): Extra environment variables for
+            this command only. Defaults to None.
+        check (bool): Raise if the command exits non-zero. Defaults to False.
+        sinks (List[Line_Sink], optional): Callables receiving every decoded
+            line without its line break. Defaults to None.
+        tail_lines (int, optional): Number of trailing lines kept as output
+            of the result. None keeps everything. Defaults to TAIL_LINES.
+
+    Raises:
+        CalledProcessError: Raised if check is set and the command failed.
+
+    Returns:
+        CommandResult: The command, the tail of stdout, empty stderr and
+            the return code
+    """
+    process = subprocess.Popen(  # noqa: S603 # argv list, no shell
+        argv,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        cwd=cwd,
+        env=build_env(env),
+    )
+    return stream_process(process, format_cmd(argv), check, sinks, tail_lines)
+
+
+def stream_process(
+    process: "subprocess.Popen[bytes]",
+    cmd: str,
+    check: bool = False,
+    sinks: Optional[List[Line_Sink]] = None,
+    tail_lines: Optional[int] = TAIL_LINES,
+) -> CommandResult:
+    """Streams the output of a started process line by line.
+
+    Args:
+        process (Popen): Process with stdout piped, stderr merged into it
+        cmd (str): Printable command, see format_cmd
+        check (bool): Raise if the command exits non-zero. Defaults to False.
+        sinks (List[Line_Sink], optional): Callables receiving every decoded
+            line without its line break. Defaults to None.
+        tail_lines (int, optional): Number of trailing lines kept as output
+            of the result. None keeps everything. Defaults to TAIL_LINES.
+
+    Raises:
+        CalledProcessError: Raised if check is set and the command failed.
+
+    Returns:
+        CommandResult: The command, the tail of stdout, empty stderr and
+            the return code
+    """
+    tail: Deque[bytes] = deque(maxlen=tail_lines)
+    stdout = process.stdout
+    assert stdout is not None  # noqa: S101 # mypy only
+    with stdout:
+        for raw_line in _redacted_lines(stdout):
+            tail.append(raw_line)
+            line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+            for sink in sinks or []:
+                sink(line)
+    return_code = process.wait()
+    output = b"".join(tail)
+    if check and return_code:
+        raise subprocess.CalledProcessError(return_code, cmd, output, b"")
+    return CommandResult(cmd, output, b"", return_code)
+
+
+def _redacted_lines(stream: IO[bytes]) -> Iterator[bytes]:
+    """Reads a stream in chunks and yields its redacted lines.
+
+    Args:
+        stream (IO[bytes]): stdout of a child process
+
+    Yields:
+        Iterator[bytes]: Lines including their line break; the last line
+            may lack it
+    """
+    redacting = StreamRedactor(redactor)
+    partial = b""
+    while True:
+        chunk = stream.read1(CHUNK_SIZE)  # type: ignore[attr-defined]
+        data = redacting.feed(chunk) if chunk else redacting.flush()
+        lines = (partial + data).split(b"\n")
+        partial = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+        if not chunk:
+            break
+    if partial:
+        yield partial
+
+
+def log_sink(
+    logger: logging.Logger, level: int = logging.INFO, prefix: str = ""
+) -> Line_Sink:
+    """Creates a sink writing every line to a logger.
+
+    Args:
+        logger (logging.Logger): Target logger
+        level (int): Log level of the lines. Defaults to logging.INFO.
+        prefix (str): Prepended to every line, e.g. to tell concurrent
+            commands apart. Defaults to "".
+
+    Returns:
+        Line_Sink: The sink
+    """
+    return lambda line: logger.log(level, f"{prefix}{line}")
+
+
+def filtered_sink(
+    sink: Line_Sink, transform: Callable[[str], str]
+) -> Line_Sink:
+    """Creates a sink passing every line through transform first.
+
+    Used to sanitize lines before they reach a log or file.
+
+    Args:
+        sink (Line_Sink): Sink receiving the transformed lines
+        transform (Callable[[str], str]): e.g. a sanitizer
+
+    Returns:
+        Line_Sink: The sink
+    """
+    return lambda line: sink(transform(line))
+
+
+class FileSink(object):
+    """Sink appending every line to a file."""
+
+    def __init__(self, path: Path_Like) -> None:
+        """Opens the file for appending.
+
+        Args:
+            path (Path_Like): File to write to
+        """
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, line: str) -> None:
+        """Writes a line.
+
+        Args:
+            line (str): Line without line break
+        """
+        self._file.write(f"{line}\n")
+
+    def __enter__(self) -> "FileSink":
+        """Enters the context."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Closes the file on exit."""
+        self.close()
+
+    def close(self) -> None:
+        """Closes the file."""
+        self._file.close()
+
+
+async def arun_command(
+    argv: List[str],
+    cwd: Optional[Path_Like] = None,
+    env: Optional[Dict[str, str]] = None,
+    check: bool = False,
+    timeout: Optional[float] = None,
+) -> CommandResult:
+    """Runs a command without a shell as a coroutine.
+
+    The child process is killed if the timeout expires or the awaiting task
+    is cancelled.
+
+    Args:
+        argv (List[str]): Program and arguments
+        cwd (Path_Like, optional): Working directory of the command.
+            Defaults to the current working directory.
+        env (Dict[str, str], optional): Extra environment variables for
+            this command only. Defaults to None.
+        check (bool): Raise if the command exits non-zero. Defaults to False.
+        timeout (float, optional): Seconds to wait for the command.
+            Defaults to None, i.e. no timeout.
+
+    Raises:
+        CalledProcessError: Raised if check is set and the command failed.
+        TimeoutExpired: Raised if the command did not finish in time.
+
+    Returns:
+        CommandResult: The command, stdout, stderr and return code
+    """
+    cmd = format_cmd(argv)
+    process = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=build_env(env),
+    )
+    try:
+        output, error = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        await _kill(process)
+        raise subprocess.TimeoutExpired(cmd, timeout or 0.0)
+    except asyncio.CancelledError:
+        await _kill(process)
+        raise
+    return_code = process.returncode
+    assert return_code is not None  # communicate waits for the exit
+    output, error = redactor.redact(output), redactor.redact(error)
+    if check and return_code:
+        raise subprocess.CalledProcessError(return_code, cmd, output, error)
+    return CommandResult(cmd, output, error, return_code)
+
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    """Kills a child process and reaps it.
+
+    Args:
+        process (Process): The running child process
+    """
+    if process.returncode is None:
+        process.kill()
+    await process.wait()
@@ -0,0 +1,73 @@
+// Warm serverless process for eb7_sls_helper.utils.warm_pool.
+//
+// Loads the serverless framework and its dependencies, prints READY and
+// waits for one command as a JSON line on stdin:
+//   {"argv": ["deploy", "--config", ...], "cwd": "...", "env": {...}}
+// The command then runs in this process exactly like `sls <argv>`, with its
+// output on stdout/stderr and its exit code as the exit code of the process.
+// If the framework cannot be loaded, UNAVAILABLE is printed instead.
+"use strict";
+
+const fs = require("fs");
+const path = require("path");
+
+const READY = "EB7_SLS_READY";
+const UNAVAILABLE = "EB7_SLS_UNAVAILABLE";
+
+function resolveServerless() {
+  const globalModules = path.join(
+    path.dirname(process.execPath),
+    "..",
+    "lib",
+    "node_modules"
+  );
+  const paths = [
+    process.cwd(),
+    ...(process.env.NODE_PATH || "").split(path.delimiter).filter(Boolean),
+    globalModules,
+  ];
+  const manifest = require.resolve("serverless/package.json", { paths });
+  const root = path.dirname(manifest);
+  const bin = JSON.parse(fs.readFileSync(manifest, "utf8")).bin;
+  const script = typeof bin === "string" ? bin : bin.sls || bin.serverless;
+  return { root, bin: path.join(root, script) };
+}
+
+function preload(root) {
+  // The framework's own modules keep state of a run, so only its
+  // dependencies are loaded ahead; they are the bulk of the startup time.
+  const manifest = require(path.join(root, "package.json"));
+  for (const name of Object.keys(manifest.dependencies || {})) {
+    try {
+      require(require.resolve(name, { paths: [root] }));
+    } catch (error) {
+      // Optional or ESM-only dependencies are loaded by the command itself
+    }
+  }
+}
+
+function readJob(callback) {
+  let data = "";
+  process.stdin.setEncoding("utf8");
+  process.stdin.on("data", (chunk) => {
+    data += chunk;
+  });
+  process.stdin.on("end", () => callback(JSON.parse(data)));
+}
+
+let serverless;
+try {
+  serverless = resolveServerless();
+  preload(serverless.root);
+} catch (error) {
+  process.stdout.write(`${UNAVAILABLE} ${error.message}\n`);
+  process.exit(70);
+}
+process.stdout.write(`${READY}\n`);
+
+readJob((job) => {
+  process.chdir(job.cwd);
+  Object.assign(process.env, job.env || {});
+  process.argv = [process.argv[0], serverless.bin, ...job.argv];
+  require(serverless.bin);
+});
@@ -0,0 +1,119 @@
+"""Shares tox environments and downloaded wheels between services.
+
+Services with the same ``tox.ini`` and requirements get the same tox work
+directory in the helper's cache, addressed by a hash of those files. tox
+then finds an environment with the right dependencies already installed and
+only runs the tests. pip and virtualenv share one download and wheel cache.
+
+Runs using the same work directory are serialized, because tox does not
+support concurrent runs in one environment.
+"""
+import hashlib
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Set
+
+ENV_KEY_VERSION = "1"
+REQUIREMENT_FILES = ("requirements*.txt", "*requirements.txt")
+REQUIREMENT_REF_REGEX = re.compile(
+    r"^\s*(?:-r|--requirement|-c|--constraint)[\s=]*(\S+)", re.MULTILINE
+)
+
+
+def env_key(service_dir: Path) -> str:
+    """Hashes the files deciding what tox installs for a service.
+
+    Args:
+        service_dir (Path): Directory containing tox.ini
+
+    Returns:
+        str: Hex digest of tox.ini and the requirement files
+    """
+    digest = hashlib.sha256(f"{ENV_KEY_VERSION}\0".encode())
+    for name, content in sorted(_dependency_files(Path(service_dir)).items()):
+        digest.update(f"{name}\0".encode())
+        digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+
+def _dependency_files(service_dir: Path) -> Dict[str, bytes]:
+    """Reads tox.ini and the requirement files of a service.
+
+    Args:
+        service_dir (Path): Directory containing tox.ini
+
+    Returns:
+        Dict[str, bytes]: File contents by path relative to service_dir
+    """
+    files: Dict[str, bytes] = {}
+    tox_ini = service_dir / "tox.ini"
+    if tox_ini.is_file():
+        files["tox.ini"] = tox_ini.read_bytes()
+    tox_text = files.get("tox.ini", b"").decode("utf-8", errors="replace")
+    for path in sorted(_requirement_files(service_dir, tox_text)):
+        if path.is_file():
+            name = path.relative_to(service_dir).as_posix()
+            files[name] = path.read_bytes()
+    return files
+
+
+def _requirement_files(service_dir: Path, tox_text: str) -> Set[Path]:
+    """Requirement files by name and those tox.ini refers to.
+
+    Args:
+        service_dir (Path): Directory containing tox.ini
+        tox_text (str): Content of tox.ini, empty if missing
+
+    Returns:
+        Set[Path]: Candidate paths, not necessarily existing
+    """
+    candidates: Set[Path] = set()
+    for pattern in REQUIREMENT_FILES:
+        candidates.update(service_dir.glob(pattern))
+    for ref in REQUIREMENT_REF_REGEX.findall(tox_text):
+        ref = ref.replace("{toxinidir}", ".").strip("\"'")
+        candidates.add(service_dir / ref)
+    return candidates
+
+
+class ToxEnvCache(object):
+    """Content-addressed tox work directories with shared pip caches."""
+
+    def __init__(self, directory: Path) -> None:
+        """Constructor of ToxEnvCache.
+
+        Args:
+            directory (Path): Directory holding work dirs and pip caches
+        """
+        self._directory = Path(directory)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def environment(self) -> Dict[str, str]:
+        """Environment variables pointing pip and virtualenv at the caches.
+
+        Returns:
+            Dict[str, str]: Variables for the tox process
+        """
+        return {
+            "PIP_CACHE_DIR": str(self._directory / "pip"),
+            "VIRTUALENV_APP_DATA": str(self._directory / "virtualenv"),
+        }
+
+    @contextmanager
+    def workdir(self, service_dir: Path) -> Iterator[Path]:
+        """Reserves the shared tox work directory of a service.
+
+        Args:
+            service_dir (Path): Directory containing tox.ini
+
+        Yields:
+            Iterator[Path]: Work directory to pass to ``tox --workdir``
+        """
+        key = env_key(service_dir)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            yield self._directory / "envs" / key[:32]
@@ -1,17 +1,54 @@
-"""Formats (and sanitizes) tox output to prevent leaking access tokens."""
+"""Formats (and sanitizes) tox output to prevent leaking access tokens.
+
+The log is processed in a single pass, line by line: every line is
+sanitized, assigned to its section (installation, tests, coverage, final
+summary) and colorized as it arrives, so ToxLogFormatter can also be used as
+a sink of a running tox command.
+"""
 
 import re
+from typing import Dict, List, Tuple
 
 # @ReviewDog - This is a password regex, not an actual password
 URL_WITH_ACCESS_TOKEN_REGEX = r"https:\/\/([a-z0-9]+)@github.com"  # noqa: S105
 
+SECTIONS = ("general", "tests", "coverage", "final")
+TESTS_START_REGEX = re.compile(r"=+ test session starts")
+COVERAGE_START_REGEX = re.compile(r"--.*coverage")
+SUMMARY_REGEX = re.compile(r"_+ summary _+$")
+# tox 4 has no summary banner, its summary lines are indented
+TOX4_SUMMARY_REGEX = re.compile(
+    r"\s+(?:[\w.-]+: (?:OK|FAIL|SKIP) |congratulations :\)|evaluation failed)"
+)
+# Lines tox prints for an environment, e.g. "py38 create: ..." (tox 3) or
+# "py38: commands[0]> pytest" (tox 4)
+ENV_LINE_REGEX = re.compile(
+    r"(?P<env>[\w.-]+):? (?:create|recreate|installdeps|inst-nodeps|inst"
+    r"|installed|develop-inst-nodeps|develop-inst|run-test-pre|run-test"
+    r"|install_deps|install_package_deps|install_package"
+    r"|commands(?:_pre|_post)?\[\d+\])[:>]"
+)
+# One matcher for all keywords; the first group has the highest priority
+KEYWORDS = {
+    "success": "+ ",
+    "succeed": "+ ",
+    "congratulations": "+ ",
+    "passed": "+ ",
+    "warning:": "! ",
+    "error": "- ",
+    "fail": "- ",
+}
+PRIORITIES = {"+ ": 0, "! ": 1, "- ": 2}
+KEYWORD_REGEX = re.compile("|".join(re.escape(x) for x in KEYWORDS))
+
+_access_token_regex = re.compile(URL_WITH_ACCESS_TOKEN_REGEX)
+
 
 def format_tox_output(output: bytes) -> str:
     """Function for formatting tox output.
 
-    Right now, it only sanitizes the access token but
-    but it can be extended in the future to support extra formatting.
-    We have an unreadable format at the moment.
+    Sanitizes access tokens, splits the log into its sections and marks
+    lines by status in markdown diff code blocks.
 
     Arguments:
         output: original output generated by tox
@@ -19,9 +56,7 @@ def format_tox_output(output: bytes) -> str:
     Returns:
         sanitized: tox output sanitized
     """
-    string_output = output.decode("utf8")
-    sanitized_str = sanitize_str(string_output)
-    return format_logs(sanitized_str)
+    return format_logs(output.decode("utf8"))
 
 
 def sanitize_str(text: str) -> str:
@@ -33,8 +68,100 @@ def sanitize_str(text: str) -> str:
     Returns:
         str: sanitized string from  secret keys
     """
-    regex = re.compile(URL_WITH_ACCESS_TOKEN_REGEX)
-    return re.sub(regex, "sanitized_url :)", text)
+    return _access_token_regex.sub("sanitized_url :)", text)
+
+
+def colorize_line(line: str) -> str:
+    """Prefixes a line with its markdown diff status.
+
+    Success wins over warning, warning over error if a line matches several.
+
+    Args:
+        line (str): A log line
+
+    Returns:
+        str: The line, prefixed with "+ ", "! " or "- " if it has a status
+    """
+    matches = KEYWORD_REGEX.findall(line.lower())
+    if not matches:
+        return line
+    prefix = min((KEYWORDS[x] for x in matches), key=PRIORITIES.__getitem__)
+    return prefix + line
+
+
+class ToxLogParser(object):
+    """State machine assigning tox log lines to environments and sections.
+
+    Every line is matched once against anchored patterns, so parsing is
+    linear in the size of the log. Sections may be missing (e.g. no
+    coverage), repeated (e.g. two pytest commands) or interleaved with the
+    setup of further environments; lines before any marker are "general".
+    """
+
+    def __init__(self) -> None:
+        """Constructor of ToxLogParser."""
+        self.env = ""
+        self.section = "general"
+
+    def feed(self, line: str) -> Tuple[str, str]:
+        """Classifies the next line.
+
+        Args:
+            line (str): The line without its line break
+
+        Returns:
+            Tuple[str, str]: Environment ("" if unknown) and section
+        """
+        section = self.section
+        if SUMMARY_REGEX.match(line) or TOX4_SUMMARY_REGEX.match(line):
+            section = "final"
+        elif TESTS_START_REGEX.match(line):
+            section = "tests"
+        elif section == "tests" and COVERAGE_START_REGEX.match(line):
+            section = "coverage"
+        else:
+            match = ENV_LINE_REGEX.match(line)
+            if match is not None and (
+                section != "general" or match.group("env") != self.env
+            ):
+                section = "general"
+                self.env = match.group("env")
+        self.section = section
+        return self.env, section
+
+
+class ToxLogFormatter(object):
+    """Sanitizes, splits and colorizes a tox log in one pass."""
+
+    def __init__(self) -> None:
+        """Constructor of ToxLogFormatter."""
+        self._parser = ToxLogParser()
+        self._blocks: List[Tuple[str, str, List[str]]] = []
+
+    def feed(self, line: str) -> None:
+        """Processes one line of the log.
+
+        Args:
+            line (str): The line without its line break
+        """
+        line = sanitize_str(line)
+        env, section = self._parser.feed(line)
+        if not self._blocks or self._blocks[-1][:2] != (env, section):
+            self._blocks.append((env, section, []))
+        if section != "coverage":
+            line = colorize_line(line)
+        self._blocks[-1][2].append(line)
+
+    def format(self) -> str:
+        """Markdown of the lines fed so far.
+
+        Returns:
+            str: One code block per section, in the order of the log
+        """
+        return "\n".join(
+            _code_block(section, "\n".join(lines), env)
+            for env, section, lines in self._blocks
+        )
 
 
 def add_markdown(log_name: str, log_text: str) -> str:
@@ -47,14 +174,20 @@ def add_markdown(log_name: str, log_text: str) -> str:
     Returns:
         str: markdown diff codeblock formated string
     """
-    header = "```\n"
-    footer = "\n```\n"
     if log_name != "coverage":
-        header = "```diff\n"
         log_text = add_diff_md(log_name, log_text)
-    md_log = header + log_text + footer
+    return _code_block(log_name, log_text)
+
+
+def _code_block(log_name: str, log_text: str, env: str = "") -> str:
+    """Wraps an already colorized section in its code block."""
+    header = "```\n" if log_name == "coverage" else "```diff\n"
+    md_log = header + log_text + "\n```\n"
     if log_name == "general":
-        collapse_header = "<details><summary>Installation packages</summary>\n\n"
+        title = "Installation packages"
+        if env:
+            title += f" ({env})"
+        collapse_header = f"<details><summary>{title}</summary>\n\n"
         collapse_footer = "\n</details>\n"
         md_log = collapse_header + md_log + collapse_footer
     return md_log
@@ -70,41 +203,25 @@ def add_diff_md(log_name: str, log_text: str) -> str:
     Returns:
         str: markdown diff codeblock formated string
     """
-    success_matches = ["success", "succeed", "congratulations", "passed"]
-    warn_matches = ["warning:"]
-    error_matches = ["error", "fail"]
-    line_list = log_text.splitlines()
-    for idx, line in enumerate(line_list):
-        if any(match in line.lower() for match in success_matches):
-            line = "+ " + line
-        elif any(match in line.lower() for match in warn_matches):
-            line = "! " + line
-        elif any(match in line.lower() for match in error_matches):
-            line = "- " + line
-        line_list[idx] = line
-    return "\n".join(line_list)
-
-
-def split_logs(output_logs: str) -> list:
+    return "\n".join(colorize_line(x) for x in log_text.splitlines())
+
+
+def split_logs(output_logs: str) -> Dict[str, str]:
     """Function for splitting respective parts of logs
 
     Args:
         output_logs (str): the full text output
 
     Returns:
-        list: list containing different parts of logs
+        Dict[str, str]: Text of the sections, empty if not found; repeated
+            sections are joined
     """
-    flags = re.DOTALL | re.MULTILINE
-    installtion_logs = output_logs.split("============================= test", 1)[0]
-    tests_logs = re.findall('((^=.*test ).*)^.*-- coverage', output_logs, flags)[0][0]
-    coverage_logs = re.findall('((^--.*coverage).*?^(_.*summary.*_$))', output_logs, flags)[0][0]
-    final_logs = output_logs.split("summary ____________________________________", 1)[1]
-    return {
-        "general": installtion_logs,
-        "tests": tests_logs,
-        "coverage": coverage_logs,
-        "final": final_logs
-    }
+    parser = ToxLogParser()
+    parts: Dict[str, List[str]] = {x: [] for x in SECTIONS}
+    for line in output_logs.splitlines():
+        _, section = parser.feed(line)
+        parts[section].append(line)
+    return {k: "\n".join(v) for k, v in parts.items()}
 
 
 def format_logs(output_logs: str) -> str:
@@ -116,13 +233,7 @@ def format_logs(output_logs: str) -> str:
     Returns:
         str: new formated str
     """
-    log_list = split_logs(output_logs)
-    for key, value in log_list.items():
-        colorized_log = add_markdown(key, value)
-        log_list[key] = colorized_log
-    return (
-        log_list["general"] + "\n" +
-        log_list["tests"] + "\n" +
-        log_list["coverage"] + "\n" +
-        log_list["final"]
-    )
+    formatter = ToxLogFormatter()
+    for line in output_logs.splitlines():
+        formatter.feed(line)
+    return formatter.format()
@@ -0,0 +1,186 @@
+"""Pool of pre-started serverless processes.
+
+Starting ``sls`` loads Node.js, the framework and its dependencies before
+the command even begins, which takes seconds per call. The WarmPool keeps
+``size`` processes that have already done so (see sls_warm.js) waiting for
+a command. Each process runs a single command, since the framework keeps
+state of a run in its modules, and a replacement starts warming up in the
+background as soon as one is taken. Commands therefore start without the
+startup delay as long as they do not arrive faster than processes warm up.
+
+If node or the framework cannot be found, the pool disables itself and
+callers fall back to running ``sls`` as a regular subprocess.
+"""
+import json
+import logging
+import subprocess  # noqa: S404 # Use of subprocess required
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from eb7_sls_helper.src.utils.runner import (
+    TAIL_LINES,
+    CommandResult,
+    Line_Sink,
+    Path_Like,
+    build_env,
+    format_cmd,
+    stream_process,
+)
+
+log = logging.getLogger(__name__)
+
+WARM_SCRIPT = Path(__file__).with_name("sls_warm.js")
+READY = b"EB7_SLS_READY"
+
+
+class WarmPoolUnavailable(Exception):
+    """Raised if a command cannot run in a warm process."""
+
+
+class WarmPool(object):
+    """Keeps serverless processes warm for the next commands."""
+
+    def __init__(
+        self, size: int = 0, node: str = "node", script: Path = WARM_SCRIPT
+    ) -> None:
+        """Constructor of WarmPool.
+
+        Args:
+            size (int): Number of processes kept warm; 0 disables the pool.
+                Defaults to 0.
+            node (str): Node.js executable. Defaults to "node".
+            script (Path): Script of a warm process. Defaults to
+                WARM_SCRIPT.
+        """
+        self._size = size
+        self._node = node
+        self._script = script
+        self._spares: List["subprocess.Popen[bytes]"] = []
+        self._lock = threading.Lock()
+        self._disabled = False
+
+    @property
+    def enabled(self) -> bool:
+        """Whether commands are sent to warm processes."""
+        return self._size > 0 and not self._disabled
+
+    def configure(self, size: int) -> None:
+        """Sets the number of warm processes and starts them.
+
+        Args:
+            size (int): Number of processes kept warm; 0 disables the pool
+        """
+        with self._lock:
+            self._size = max(0, size)
+            self._disabled = False
+            self._fill()
+
+    def run(
+        self,
+        argv: List[str],
+        cwd: Optional[Path_Like] = None,
+        env: Optional[Dict[str, str]] = None,
+        check: bool = False,
+        sinks: Optional[List[Line_Sink]] = None,
+        tail_lines: Optional[int] = TAIL_LINES,
+    ) -> CommandResult:
+        """Runs an sls command in a warm process.
+
+        Behaves like runner.stream_command for the same argv.
+
+        Args:
+            argv (List[str]): ``["sls", ...]``
+            cwd (Path_Like, optional): Working directory of the command.
+                Defaults to the current working directory.
+            env (Dict[str, str], optional): Extra environment variables for
+                this command only. Defaults to None.
+            check (bool): Raise if the command exits non-zero.
+                Defaults to False.
+            sinks (List[Line_Sink], optional): Callables receiving every
+                line of output. Defaults to None.
+            tail_lines (int, optional): Number of trailing lines kept as
+                output of the result. Defaults to TAIL_LINES.
+
+        Raises:
+            WarmPoolUnavailable: Raised if the pool is disabled or no warm
+                process could be started; nothing has been run then.
+
+        Returns:
+            CommandResult: The command, the tail of stdout, empty stderr and
+                the return code
+        """
+        if not self.enabled or not argv or Path(argv[0]).name != "sls":
+            raise WarmPoolUnavailable("No warm process for this command")
+        process = self._take()
+        stdin, stdout = process.stdin, process.stdout
+        assert stdin is not None and stdout is not None  # noqa: S101
+        ready = stdout.readline()
+        if not ready.startswith(READY):
+            self._disable(ready.decode("utf-8", errors="replace").strip())
+            process.kill()
+            process.wait()
+            raise WarmPoolUnavailable("Warm process failed to start")
+        job = {
+            "argv": argv[1:],
+            "cwd": str(Path(cwd or ".").resolve()),
+            "env": env or {},
+        }
+        with stdin:
+            stdin.write(json.dumps(job).encode())
+        cmd = format_cmd(argv)
+        return stream_process(process, cmd, check, sinks, tail_lines)
+
+    def close(self) -> None:
+        """Stops the waiting processes."""
+        with self._lock:
+            spares, self._spares = self._spares, []
+        for process in spares:
+            process.kill()
+            process.wait()
+            for stream in (process.stdin, process.stdout):
+                if stream is not None:
+                    stream.close()
+
+    def _take(self) -> "subprocess.Popen[bytes]":
+        """Takes a warm process and starts warming up its replacement."""
+        with self._lock:
+            process = self._spares.pop(0) if self._spares else self._start()
+            self._fill()
+            return process
+
+    def _fill(self) -> None:
+        """Starts processes up to the pool size; call with the lock held."""
+        try:
+            while self.enabled and len(self._spares) < self._size:
+                self._spares.append(self._start())
+        except WarmPoolUnavailable as error:
+            log.warning(f"Falling back to sls subprocesses: {error}")
+
+    def _start(self) -> "subprocess.Popen[bytes]":
+        """Starts a process; call with the lock held."""
+        try:
+            return subprocess.Popen(  # noqa: S603 # argv list, no shell
+                [self._node, str(self._script)],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env=build_env(),
+            )
+        except OSError as error:
+            self._disabled = True
+            raise WarmPoolUnavailable(f"Cannot start {self._node}: {error}")
+
+    def _disable(self, reason: str) -> None:
+        """Stops using the pool after a failed start."""
+        log.warning(f"Falling back to sls subprocesses: {reason}")
+        self._disabled = True
+        self.close()
+
+
+warm_pool = WarmPool()
+
+
+def close_warm_pool() -> None:
+    """Stops the processes of the process-wide pool."""
+    warm_pool.close()
@@ -0,0 +1,123 @@
+"""Test of the serverless package cache"""
+import json
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+from eb7_sls_helper.src.artifacts import (
+    INDEX_FILE,
+    ArtifactCache,
+    uses_remote_values,
+)
+
+
+class ArtifactCacheTestCase(unittest.TestCase):
+    """Testing ArtifactCache."""
+
+    def setUp(self):
+        """Creates an empty cache."""
+        self.temp = tempfile.TemporaryDirectory()
+        self.cache = ArtifactCache(Path(self.temp.name))
+        self.builds = []
+
+    def tearDown(self):
+        """Removes the cache."""
+        self.temp.cleanup()
+
+    def build(self, directory):
+        """Writes a package like sls package does."""
+        self.builds.append(directory)
+        directory.mkdir()
+        (directory / "service.zip").write_bytes(b"zip")
+
+    def test_package_once(self):
+        """Asserts that a package is built once and then reused."""
+        self.assertIsNone(self.cache.get("abc"))
+        path = self.cache.package("abc", self.build, "svc", "dev/eu-central-1")
+        self.assertEqual((path / "service.zip").read_bytes(), b"zip")
+        self.assertEqual(self.cache.package("abc", self.build), path)
+        self.assertEqual(self.cache.get("abc"), path)
+        self.assertEqual(len(self.builds), 1)
+        index = json.loads(Path(self.temp.name, INDEX_FILE).read_text())
+        self.assertEqual(index["abc"]["service"], "svc")
+        self.assertEqual(index["abc"]["target"], "dev/eu-central-1")
+        self.assertEqual(ArtifactCache(Path(self.temp.name)).get("abc"), path)
+
+    def test_failed_build(self):
+        """Asserts that failed builds leave nothing behind."""
+
+        def build(directory):
+            directory.mkdir()
+            raise RuntimeError("Execution of sls package failed")
+
+        with self.assertRaises(RuntimeError):
+            self.cache.package("abc", build)
+        self.assertIsNone(self.cache.get("abc"))
+        self.assertEqual(list(Path(self.temp.name, "packages").iterdir()), [])
+
+    def test_missing_package(self):
+        """Asserts that indexed but deleted packages are rebuilt."""
+        path = self.cache.package("abc", self.build)
+        (path / "service.zip").unlink()
+        path.rmdir()
+        self.assertIsNone(self.cache.get("abc"))
+        self.assertEqual(self.cache.package("abc", self.build), path)
+        self.assertEqual(len(self.builds), 2)
+
+    def test_concurrent(self):
+        """Asserts that concurrent requests of a package build it once."""
+        started = threading.Barrier(4)
+
+        def package(key):
+            started.wait()
+            return self.cache.package(key, self.build)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            paths = list(pool.map(package, ["a", "a", "b", "b"]))
+        self.assertEqual(len(self.builds), 2)
+        self.assertEqual(paths[0], paths[1])
+        self.assertNotEqual(paths[1], paths[2])
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("b"))
+
+    def test_remote_values_expire(self):
+        """Asserts that packages with values from AWS are reused briefly."""
+        cache = ArtifactCache(Path(self.temp.name), remote_ttl=60)
+        path = cache.package("abc", self.build, remote_values=True)
+        self.assertEqual(cache.get("abc"), path)
+        with patch("time.time", return_value=path.stat().st_mtime + 120):
+            self.assertIsNone(cache.get("abc"))
+        self.assertIsNone(
+            ArtifactCache(Path(self.temp.name), remote_ttl=0).get("abc")
+        )
+        self.assertTrue(uses_remote_values("a: ${ssm:/db/url}"))
+        self.assertTrue(uses_remote_values("a: ${cf(us-east-1):x.Url}"))
+        self.assertFalse(uses_remote_values("a: ${sls:stage}"))
+
+    def test_eviction(self):
+        """Asserts that the least recently used packages are removed."""
+        cache = ArtifactCache(Path(self.temp.name), max_packages=2)
+        first = cache.package("a", self.build)
+        cache.package("b", self.build)
+        cache.package("a", self.build)
+        cache = ArtifactCache(Path(self.temp.name), max_packages=2)
+        cache.package("a", self.build)
+        cache.package("c", self.build)
+        self.assertEqual(cache.get("a"), first)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        packages = list(Path(self.temp.name, "packages").iterdir())
+        self.assertEqual(len(packages), 2)
+
+    def test_eviction_keeps_run(self):
+        """Asserts that packages of the current run are not removed."""
+        cache = ArtifactCache(Path(self.temp.name), max_packages=1)
+        paths = [cache.package(x, self.build) for x in ("a", "b", "c")]
+        self.assertTrue(all(x.is_dir() for x in paths))
+        ArtifactCache(Path(self.temp.name), max_packages=1).package(
+            "d", self.build
+        )
+        self.assertFalse(any(x.is_dir() for x in paths))
@@ -0,0 +1,68 @@
+"""Test of the boto3 client pool"""
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+from eb7_sls_helper.src import newman
+from eb7_sls_helper.src.utils import clients
+from eb7_sls_helper.src.utils.clients import ClientPool
+
+
+class ClientPoolTestCase(unittest.TestCase):
+    """Testing ClientPool."""
+
+    @patch("boto3.Session")
+    def test_reuse(self, session):
+        """Asserts that sessions and clients are created once per key."""
+        pool = ClientPool()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(
+                    lambda _: pool.client("apigateway", "default", "eu-west-1"),
+                    range(32),
+                )
+            )
+        self.assertTrue(all(x is results[0] for x in results))
+        pool.client("apigateway", "default", "us-east-1")
+        pool.client("s3", "other")
+        self.assertEqual(len(pool), 3)
+        self.assertEqual(session.call_count, 2)
+
+    @patch("boto3.Session")
+    def test_close(self, session):
+        """Asserts that teardown closes and drops all clients."""
+        pool = ClientPool()
+        client = pool.client("apigateway", "default")
+        pool.close()
+        client.close.assert_called_once()
+        self.assertEqual(len(pool), 0)
+        self.assertIsNot(pool.client("apigateway", "default"), None)
+
+    @patch("boto3.Session")
+    def test_account_id(self, session):
+        """Asserts that STS is asked once per profile."""
+        sts = session.return_value.client.return_value
+        sts.get_caller_identity.return_value = {"Account": "123456789012"}
+        pool = ClientPool()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            accounts = set(
+                executor.map(lambda _: pool.account_id("default"), range(32))
+            )
+        self.assertEqual(accounts, {"123456789012"})
+        sts.get_caller_identity.assert_called_once()
+        pool.close()
+        pool.account_id("default")
+        self.assertEqual(sts.get_caller_identity.call_count, 2)
+
+    def test_get_api_key(self):
+        """Asserts that get_api_key lists keys once via the pooled client."""
+        client = MagicMock()
+        client.get_paginator.return_value.paginate.return_value = [
+            {"items": [{"name": "dev-a", "value": "a"}]},
+            {"items": [{"name": "dev-b", "value": "b"}]},
+        ]
+        newman.api_key_resolver.clear()
+        self.addCleanup(newman.api_key_resolver.clear)
+        with patch.object(clients.client_pool, "client", return_value=client):
+            self.assertEqual(newman.get_api_key("dev-a", "default"), "a")
+            self.assertEqual(newman.get_api_key("dev-b", "default"), "b")
+        client.get_paginator.assert_called_once_with("get_api_keys")
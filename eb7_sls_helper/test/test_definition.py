@@ -0,0 +1,116 @@
+"""Test of the definition cache"""
+import os
+import shutil
+import tempfile
+import unittest
+import yaml
+from pathlib import Path
+from unittest.mock import patch
+from eb7_sls_helper.src.sls_function import Lambda
+from eb7_sls_helper.src.utils import definition
+from eb7_sls_helper.src.utils.definition import (
+    DefinitionCache,
+    LazyDocument,
+    parse_definition,
+)
+
+
+class DefinitionCacheTestCase(unittest.TestCase):
+    """Testing DefinitionCache."""
+
+    def setUp(self):
+        """Copies a fixture to a temporary directory."""
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = Path(self.tmp, "serverless.yml")
+        shutil.copy("eb7_sls_helper/test/complete.yml", self.path)
+        self.cache = DefinitionCache(maxsize=2)
+
+    def test_parsed_once(self):
+        """Asserts that repeated loads share one parsed document."""
+        first = self.cache.load(self.path)
+        second = self.cache.load(str(self.path))
+        self.assertIs(first, second)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_invalidation(self):
+        """Asserts that changed files are parsed again."""
+        first = self.cache.load(self.path)
+        self.path.write_text(
+            self.path.read_text().replace("eb7-sls-helper", "changed")
+        )
+        stat = self.path.stat()
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        second = self.cache.load(self.path)
+        self.assertEqual(first["service"], "eb7-sls-helper")
+        self.assertEqual(second["service"], "changed")
+        self.assertEqual(len(self.cache), 1)
+
+    def test_lru_eviction(self):
+        """Asserts that the least recently used definition is evicted."""
+        paths = [self.path]
+        for name in ("a.yml", "b.yml"):
+            paths.append(Path(self.tmp, name))
+            shutil.copy(self.path, paths[-1])
+        first = self.cache.load(paths[0])
+        self.cache.load(paths[1])
+        self.cache.load(paths[0])
+        self.cache.load(paths[2])
+        self.assertEqual(len(self.cache), 2)
+        self.assertIs(self.cache.load(paths[0]), first)
+        self.cache.load(paths[1])
+        self.assertEqual(self.cache.misses, 4)
+
+    def test_shared_by_functions_and_deployments(self):
+        """Asserts that SlsFunction and _Deployment share the cache."""
+        with patch.object(
+            definition,
+            "parse_definition",
+            wraps=definition.parse_definition,
+        ) as mock:
+            definition.definition_cache.clear()
+            function = Lambda(str(self.path))
+            function.Deployment().from_definition()
+            function.Deployment().from_definition()
+            Lambda(str(self.path))
+        self.assertEqual(mock.call_count, 1)
+
+
+class ParseDefinitionTestCase(unittest.TestCase):
+    """Testing parse_definition."""
+
+    fixtures = [
+        "eb7_sls_helper/test/serverless.yml",
+        "eb7_sls_helper/test/complete.yml",
+        "eb7_sls_helper/test/incomplete.yml",
+    ]
+
+    def test_equal_to_safe_load(self):
+        """Asserts that lazy documents match yaml.safe_load."""
+        for fixture in self.fixtures:
+            with open(fixture) as file:
+                expected = yaml.safe_load(file)
+            self.assertEqual(dict(parse_definition(fixture)), expected)
+
+    def test_pure_python_fallback(self):
+        """Asserts that parsing works without libyaml."""
+        with patch.object(definition, "SafeLoader", yaml.SafeLoader):
+            document = parse_definition(self.fixtures[0])
+        self.assertEqual(document["provider"]["runtime"], "python3.8")
+
+    def test_sections_constructed_on_access(self):
+        """Asserts that sections are only constructed when accessed."""
+        document = parse_definition(self.fixtures[0])
+        self.assertIsInstance(document, LazyDocument)
+        self.assertIn("functions", document)
+        self.assertEqual(document._values, {})  # noqa: WPS437
+        self.assertEqual(document["service"], "eb7-sls-helper-test")
+        self.assertNotIn("functions", document._values)  # noqa: WPS437
+        self.assertIs(document["functions"], document["functions"])
+
+    def test_merge_keys(self):
+        """Asserts that top-level merge keys are resolved."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "serverless.yml")
+            path.write_text("base: &base\n  service: a\n<<: *base\n")
+            self.assertEqual(parse_definition(path)["service"], "a")
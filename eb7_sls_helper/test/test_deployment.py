@@ -1,7 +1,15 @@
 """Test of the Lambda Class"""
+import asyncio
+import io
+import json
+import tempfile
 import unittest
+from pathlib import Path
+from eb7_sls_helper.src.artifacts import ArtifactCache
+from eb7_sls_helper.src.fingerprint import LocalStateStore
 from eb7_sls_helper.src.sls_function import Lambda  # noqa: E402
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
+from eb7_sls_helper.src.utils.runner import CommandResult
 
 
 def mock_subprocess(*args, **kwargs) -> object:
@@ -11,22 +19,25 @@ def mock_subprocess(*args, **kwargs) -> object:
         """Mock class for Popen"""
 
         def __init__(self, *args, **kwargs):
-            self._output = ""
+            self._output = b""
             valid_cmds = [
                 "sls remove --config complete.yml --stage dev --profile default --region eu-central-1",
                 "sls deploy --config complete.yml --stage dev --profile default --region eu-central-1",
             ]
-            if any(x in valid_cmds for x in args):
+            cmd = " ".join(args[0])
+            if cmd in valid_cmds:
                 self._code = 0
             elif (
-                "sls manifest --json --config complete.yml --stage dev --profile default --region eu-central-1"
-                in args
+                cmd
+                == "sls manifest --json --config complete.yml --stage dev --profile default --region eu-central-1"
             ):
                 self._code = 0
-                with open("manifest_output.json") as file:
+                manifest = Path(__file__).parent / "manifest_output.json"
+                with open(manifest, "rb") as file:
                     self._output = file.read()
             else:
                 self._code = 1
+            self.stdout = io.BytesIO(b"deploying\n")
 
         def communicate(self):
             return (self._output, b"")
@@ -111,11 +122,79 @@ class DeploymentTestCase(unittest.TestCase):
 
     @patch("subprocess.Popen", side_effect=mock_subprocess)
     def test_deploy(self, mock):
-        """Asserts that deployment of service works."""
+        """Asserts that deployment falls back to sls manifest."""
         self.Deployment.deploy()
         self.assertTrue(mock.called)
         self.assertTrue(len(mock.call_args_list) == 2)
 
+    @patch("subprocess.Popen")
+    def test_deploy_reads_manifest_output(self, mock):
+        """Asserts that the plugin's manifest file avoids another sls call."""
+        fixture = Path(__file__).parent / "manifest_output.json"
+        output = Path(__file__).parent / ".serverless" / "manifest.json"
+        self.addCleanup(lambda: output.unlink(missing_ok=True))
+
+        def deploy(*args, **kwargs):
+            output.parent.mkdir(exist_ok=True)
+            output.write_bytes(fixture.read_bytes())
+            return mock_subprocess(*args, **kwargs)
+
+        mock.side_effect = deploy
+        self.Deployment.deploy()
+        self.assertEqual(len(mock.call_args_list), 1)
+        self.assertEqual(
+            self.Deployment.get_info(), json.loads(fixture.read_bytes())
+        )
+
+    @patch("subprocess.Popen", side_effect=mock_subprocess)
+    def test_deploy_unchanged(self, mock):
+        """Asserts that unchanged deployments are skipped."""
+        with tempfile.TemporaryDirectory() as tmp:
+            state = LocalStateStore(Path(tmp))
+            self.Deployment.deploy(state)
+            calls = len(mock.call_args_list)
+            manifest = self.Deployment.get_info()
+            deployment = self.Lambda.Deployment(
+                self.stage, self.region, self.profile
+            )
+            deployment.deploy(state)
+        self.assertEqual(len(mock.call_args_list), calls)
+        self.assertEqual(deployment.get_info(), manifest)
+
+    @patch("subprocess.Popen", side_effect=mock_subprocess)
+    def test_deploy_remote_values(self, mock):
+        """Asserts that values from AWS are deployed again after a while."""
+        text = Path(self.definition).read_text().replace(
+            "  stage: dev\n",
+            "  stage: dev\n  environment:\n    KEY: ${ssm:/app/key}\n",
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            definition = Path(tmp, "service", "complete.yml")
+            definition.parent.mkdir()
+            definition.write_text(text)
+            state = LocalStateStore(Path(tmp, "state"))
+            function = Lambda(str(definition))
+            function.Deployment(self.stage, self.region, self.profile).deploy(
+                state
+            )
+            deployment = function.Deployment(
+                self.stage, self.region, self.profile
+            )
+            deployment.deploy(state)
+            calls = len(mock.call_args_list)
+            key = deployment._state_key()
+            state.put(key, {**state.get(key), "saved_at": 0})
+            deployment.deploy(state)
+        self.assertEqual(calls, 2)
+        self.assertEqual(len(mock.call_args_list), 4)
+
+    def test_state_key(self):
+        """Asserts that profiles keep separate deploy state."""
+        other = self.Lambda.Deployment(self.stage, self.region, "other")
+        self.assertNotEqual(
+            self.Deployment._state_key(), other._state_key()
+        )
+
     @patch("subprocess.Popen", side_effect=mock_subprocess)
     def test_deploy_failing(self, mock):
         """Asserts that misspecified service raises RuntimeError."""
@@ -128,3 +207,104 @@ class DeploymentTestCase(unittest.TestCase):
         self.Deployment.deploy()
         self.Deployment.remove()
         self.assertEqual(None, self.Deployment.get_info())
+
+    @patch("subprocess.Popen")
+    def test_deploy_matrix(self, mock):
+        """Asserts that every target is packaged and deployed on its own."""
+        fixture = Path(__file__).parent / "manifest_output.json"
+        calls = []
+
+        def popen(argv, **kwargs):
+            calls.append(argv)
+            response = mock_subprocess(["true"])
+            response._code = 1 if "foo" in argv else 0
+            if argv[1] == "manifest":
+                response._output = fixture.read_bytes()
+            return response
+
+        mock.side_effect = popen
+        manifest = self.Lambda.deploy_matrix(
+            ["dev"], ["eu-central-1", "us-east-1"], self.profile
+        )
+        regions = ["eu-central-1", "us-east-1"]
+        self.assertEqual(sorted(manifest["dev"]), regions)
+        expected = json.loads(fixture.read_bytes())["dev"]
+        self.assertEqual(manifest["dev"]["us-east-1"], expected)
+        for region in ("eu-central-1", "us-east-1"):
+            target = [x for x in calls if x[-1] == region]
+            commands = [x[1] for x in target]
+            self.assertEqual(commands, ["package", "deploy", "manifest"])
+            package, deploy = target[0], target[1]
+            directory = package[package.index("--package") + 1]
+            self.assertTrue(directory.endswith(f"dev-{region}"))
+            self.assertEqual(deploy[deploy.index("--package") + 1], directory)
+        with self.assertRaises(RuntimeError):
+            self.Lambda.deploy_matrix(["dev"], ["eu-central-1", "foo"])
+
+    @patch(
+        "eb7_sls_helper.src.sls_function.get_account_id",
+        return_value="123456789012",
+    )
+    @patch("subprocess.Popen")
+    def test_deploy_artifacts(self, mock, account_mock):
+        """Asserts that an unchanged service reuses its package."""
+        fixture = Path(__file__).parent / "manifest_output.json"
+        calls = []
+
+        def popen(argv, **kwargs):
+            calls.append(argv[1])
+            if argv[1] == "package":
+                Path(argv[argv.index("--package") + 1]).mkdir()
+            response = mock_subprocess(["true"])
+            response._code = 0
+            response._output = fixture.read_bytes()
+            return response
+
+        mock.side_effect = popen
+        with tempfile.TemporaryDirectory() as tmp:
+            artifacts = ArtifactCache(Path(tmp))
+            self.Deployment.deploy(artifacts=artifacts)
+            deployment = self.Lambda.Deployment(
+                self.stage, self.region, self.profile
+            )
+            deployment.deploy(artifacts=artifacts)
+            account_mock.return_value = "210987654321"
+            calls.append("other account")
+            deployment.package(artifacts)
+        self.assertEqual(
+            calls,
+            [
+                "package",
+                "deploy",
+                "manifest",
+                "deploy",
+                "manifest",
+                "other account",
+                "package",
+            ],
+        )
+        self.assertEqual(
+            deployment.get_info(), json.loads(fixture.read_bytes())
+        )
+
+    @patch("subprocess.Popen", side_effect=mock_subprocess)
+    def test_deploy_matrix_single_target(self, mock):
+        """Asserts that a single target deploys without a package step."""
+        manifest = self.Lambda.deploy_matrix(["dev"], [self.region], "default")
+        self.assertEqual(list(manifest["dev"]), [self.region])
+        self.assertEqual(len(mock.call_args_list), 2)
+
+    @patch("eb7_sls_helper.src.sls_function.arun_command", new_callable=AsyncMock)
+    def test_adeploy(self, mock):
+        """Asserts that the coroutine API deploys and reads the manifest."""
+        manifest = Path(__file__).parent / "manifest_output.json"
+        mock.return_value = CommandResult("sls", manifest.read_bytes(), b"", 0)
+        asyncio.run(self.Deployment.adeploy(timeout=60))
+        self.assertEqual(mock.await_count, 2)
+        self.assertEqual(mock.await_args_list[0][0][0][:2], ["sls", "deploy"])
+        self.assertEqual(mock.await_args_list[0][1]["timeout"], 60)
+        self.assertEqual(
+            self.Deployment.get_info(), json.loads(manifest.read_bytes())
+        )
+        asyncio.run(self.Deployment.aremove())
+        self.assertEqual(None, self.Deployment.get_info())
@@ -0,0 +1,82 @@
+"""Test of the definition discovery"""
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from eb7_sls_helper.src import discovery
+from eb7_sls_helper.src.discovery import DefinitionIndex
+from eb7_sls_helper.src.gh_action_interface import discover_file
+
+
+class DefinitionIndexTestCase(unittest.TestCase):
+    """Testing DefinitionIndex."""
+
+    def setUp(self):
+        """Sets up an index of a small monorepo."""
+        self.index = DefinitionIndex(
+            [
+                "serverless.yml",
+                "services/a/serverless.yml",
+                "services/b/serverless.yml",
+                "./services/b/nested/serverless.yml",
+            ],
+            "serverless.yml",
+        )
+
+    def test_discover(self):
+        """Asserts that changes map to the closest definition."""
+        changes = [
+            "services/b/nested/handler.py",
+            "services/a/lib/deep/util.py",
+            "services/a/serverless.yml",
+            "services/b/handler.py",
+            "README.md",
+            "services/c/handler.py",
+        ]
+        self.assertEqual(
+            self.index.discover(changes),
+            [
+                "serverless.yml",
+                "services/a/serverless.yml",
+                "services/b/nested/serverless.yml",
+                "services/b/serverless.yml",
+            ],
+        )
+
+    def test_no_root_definition(self):
+        """Asserts that unmatched changes are ignored."""
+        index = DefinitionIndex(["a/serverless.yml"], "serverless.yml")
+        self.assertEqual(index.discover(["b/c.py", "c.py"]), [])
+
+    def test_memoized(self):
+        """Asserts that ancestors are only visited once."""
+        self.index.find("services/a/x/y/z.py")
+        with patch.object(self.index, "_dirs", set()):
+            self.assertEqual(
+                self.index.find("services/a/x/other.py"),
+                "services/a/serverless.yml",
+            )
+
+    @patch.object(discovery, "_git_ls_files", return_value=None)
+    def test_scan_fallback(self, mock):
+        """Asserts that the tree is scanned without git."""
+        with tempfile.TemporaryDirectory() as tmp:
+            for directory in ("a", "a/b", "node_modules/x"):
+                Path(tmp, directory).mkdir(parents=True)
+                Path(tmp, directory, "serverless.yml").touch()
+            index = DefinitionIndex.build("serverless.yml", tmp)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(
+            index.discover(["a/b/c/d.py", "node_modules/x/y.js"]),
+            ["a/b/serverless.yml"],
+        )
+
+    def test_discover_file(self):
+        """Asserts that the repository's own definitions are found."""
+        self.assertEqual(
+            discover_file(
+                ["eb7_sls_helper/test/handler.py", "README.md"],
+                "serverless.yml",
+            ),
+            ["eb7_sls_helper/test/serverless.yml"],
+        )
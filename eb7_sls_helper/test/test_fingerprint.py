@@ -0,0 +1,125 @@
+"""Test of deploy fingerprints and state stores"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+from eb7_sls_helper.src.fingerprint import (
+    LocalStateStore,
+    S3StateStore,
+    deploy_fingerprint,
+    state_store_from_url,
+)
+
+DEFINITION = """service: a
+provider:
+  name: aws
+  runtime: python3.8
+  environment:
+    TOKEN: ${env:FINGERPRINT_TEST_TOKEN}
+package:
+  patterns:
+    - ../../libs/shared/**
+"""
+
+
+class FakeS3Client(object):
+    """In-memory stand-in for the get_object/put_object S3 API."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):  # noqa: N803 # boto3 signature
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):  # noqa: N803
+        self.objects[(Bucket, Key)] = Body
+
+
+class FingerprintTestCase(unittest.TestCase):
+    """Testing deploy_fingerprint."""
+
+    def setUp(self):
+        """Writes a service depending on a shared library."""
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        files = {
+            "services/a/serverless.yml": DEFINITION,
+            "services/a/handler.py": "def hello(): pass\n",
+            "services/a/.serverless/state.json": "{}",
+            "services/a/node_modules/x/index.js": "",
+            "services/a/.requirements.zip": "",
+            "services/a/.coverage": "",
+            "services/a/reports/junit.xml": "",
+            "libs/shared/util.py": "X = 1\n",
+            "libs/other/util.py": "Y = 1\n",
+        }
+        for name, content in files.items():
+            Path(self.root, name).parent.mkdir(parents=True, exist_ok=True)
+            Path(self.root, name).write_text(content)
+
+    def fingerprint(self, stage="dev"):
+        """Fingerprint of the test service."""
+        return deploy_fingerprint(
+            "services/a/serverless.yml", stage, "eu-central-1", self.root
+        )
+
+    def test_stable(self):
+        """Asserts that unrelated changes keep the fingerprint."""
+        before = self.fingerprint()
+        Path(self.root, "libs/other/util.py").write_text("Y = 2\n")
+        Path(self.root, "services/a/.serverless/state.json").write_text("[]")
+        for name in ("node_modules/x/index.js", ".coverage", "reports/junit.xml"):
+            Path(self.root, "services/a", name).write_text("changed")
+        Path(self.root, "services/a/.pytest_cache").mkdir()
+        Path(self.root, "services/a/.pytest_cache/README.md").write_text("")
+        self.assertEqual(self.fingerprint(), before)
+
+    def test_changes(self):
+        """Asserts that inputs of the deployment change the fingerprint."""
+        before = self.fingerprint()
+        self.assertNotEqual(self.fingerprint("prod"), before)
+        with patch.dict(os.environ, {"FINGERPRINT_TEST_TOKEN": "x"}):
+            self.assertNotEqual(self.fingerprint(), before)
+        Path(self.root, "libs/shared/util.py").write_text("X = 2\n")
+        changed_shared = self.fingerprint()
+        self.assertNotEqual(changed_shared, before)
+        Path(self.root, "services/a/handler.py").write_text("")
+        self.assertNotEqual(self.fingerprint(), changed_shared)
+
+
+class StateStoreTestCase(unittest.TestCase):
+    """Testing the state stores."""
+
+    state = {"fingerprint": "abc", "manifest": {"dev": {}}}
+
+    def test_local(self):
+        """Asserts that the local store round-trips state."""
+        with tempfile.TemporaryDirectory() as tmp:
+            store = state_store_from_url(tmp)
+            self.assertIsInstance(store, LocalStateStore)
+            self.assertIsNone(store.get("a/dev/eu-central-1"))
+            store.put("a/dev/eu-central-1", self.state)
+            self.assertEqual(store.get("a/dev/eu-central-1"), self.state)
+
+    def test_s3(self):
+        """Asserts that the S3 store round-trips state."""
+        client = FakeS3Client()
+        store = S3StateStore("bucket", "/state/", client=client)
+        self.assertIsNone(store.get("a/dev/eu-central-1"))
+        store.put("a/dev/eu-central-1", self.state)
+        self.assertEqual(
+            json.loads(client.objects[("bucket", "state/a/dev/eu-central-1.json")]),
+            self.state,
+        )
+        self.assertEqual(store.get("a/dev/eu-central-1"), self.state)
+
+    def test_disabled(self):
+        """Asserts that an empty url disables the store."""
+        self.assertIsNone(state_store_from_url(""))
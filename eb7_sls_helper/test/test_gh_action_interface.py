@@ -1,8 +1,18 @@
 """Test of the GH Action Interface"""
 import unittest
 from eb7_sls_helper.src import gh_action_interface
+from eb7_sls_helper.src.newman import NewmanResult
+from eb7_sls_helper.src.utils import runner
+from eb7_sls_helper.src.utils.redact import Redactor
 from unittest.mock import patch
+from contextlib import ExitStack
+import io
 import os
+import tempfile
+import time
+
+REDACT = "eb7_sls_helper.src.utils.redact"
+RUNNER = "eb7_sls_helper.src.utils.runner"
 
 
 def mock_subprocess(*args, **kwargs):
@@ -21,7 +31,7 @@ def mock_subprocess(*args, **kwargs):
             valid_cmds = [
                 config,
             ]
-            if any(x in valid_cmds for x in args):
+            if " ".join(args[0]) in valid_cmds:
                 self._code = 0
             else:
                 self._code = 1
@@ -85,3 +95,198 @@ class DeploymentTestCase(unittest.TestCase):
         os.environ["INPUT_AWS_KEY"] = "KEY"
         os.environ["INPUT_AWS_SECRET"] = "SECRET"
         gh_action_interface.set_profile()
+
+    @patch("subprocess.Popen")
+    def test_aws_secret_redacted(self, popen):
+        """Test the AWS secret input is redacted from commands and output."""
+        secret = "wJalrXUtnFEMI/K7MDENG/bPxRfiCYEXAMPLEKEY"
+        popen.return_value.stdout = io.BytesIO(f"secret: {secret}".encode())
+        popen.return_value.wait.return_value = 0
+        redactor = Redactor()
+        with ExitStack() as stack:
+            stack.enter_context(
+                patch.dict(os.environ, {"INPUT_AWS_SECRET": secret})
+            )
+            stack.enter_context(patch(f"{REDACT}.redactor", redactor))
+            stack.enter_context(patch(f"{RUNNER}.redactor", redactor))
+            gh_action_interface.register_secrets(
+                gh_action_interface.get_args()
+            )
+            argv = ["sls", "config", "credentials", "--secret", secret]
+            self.assertNotIn(secret, runner.format_cmd(argv))
+            result = runner.stream_command(argv)
+        self.assertEqual(result.output, b"secret: ***")
+
+    @patch("eb7_sls_helper.src.gh_action_interface.deploy_service")
+    @patch("eb7_sls_helper.src.gh_action_interface.set_profile")
+    def test_deploy_collects_failures(self, profile_mock, service_mock):
+        def deploy_service(service, inputs, state, artifacts):
+            if service == "b/serverless.yml":
+                raise RuntimeError("Execution of sls deploy failed")
+            return {"service": service, "stage": "dev", "endpoints": {}}
+
+        service_mock.side_effect = deploy_service
+        inputs = {
+            "stage": "dev",
+            "profile": "default",
+            "max_parallel": 2,
+            "sls_workers": 0,
+            "deploy_state": "",
+            "artifact_cache": "",
+            "resume": "",
+            "state_endpoint_url": "",
+        }
+        sls = ["a/serverless.yml", "b/serverless.yml", "c/serverless.yml"]
+        deployments, failures = gh_action_interface.deploy(sls, inputs, {})
+        self.assertEqual(service_mock.call_count, 3)
+        self.assertEqual(
+            sorted(x["service"] for x in deployments),
+            ["a/serverless.yml", "c/serverless.yml"],
+        )
+        self.assertEqual(
+            failures, {"b/serverless.yml": "Execution of sls deploy failed"}
+        )
+
+    @patch("eb7_sls_helper.src.gh_action_interface.close_clients")
+    @patch("eb7_sls_helper.src.gh_action_interface.close_warm_pool")
+    @patch("eb7_sls_helper.src.gh_action_interface.DeployGraph.build")
+    @patch("eb7_sls_helper.src.gh_action_interface.set_profile")
+    def test_deploy_closes_on_error(
+        self, profile_mock, build_mock, pool_mock, clients_mock
+    ):
+        build_mock.side_effect = OSError("Too many open files")
+        inputs = {
+            "stage": "dev",
+            "max_parallel": 2,
+            "sls_workers": 0,
+            "deploy_state": "",
+            "artifact_cache": "",
+            "resume": "",
+            "state_endpoint_url": "",
+        }
+        with self.assertRaises(OSError):
+            gh_action_interface.deploy(["a/serverless.yml"], inputs, {})
+        pool_mock.assert_called_once()
+        clients_mock.assert_called_once()
+
+    @patch("eb7_sls_helper.src.gh_action_interface.deploy_service")
+    @patch("eb7_sls_helper.src.gh_action_interface.set_profile")
+    def test_deploy_resume(self, profile_mock, service_mock):
+        failing = {"b/serverless.yml"}
+
+        def deploy_service(service, inputs, state, artifacts):
+            if service in failing:
+                raise RuntimeError("Execution of sls deploy failed")
+            return {"service": service, "stage": "dev", "endpoints": {}}
+
+        service_mock.side_effect = deploy_service
+        inputs = {
+            "stage": "dev",
+            "profile": "default",
+            "max_parallel": 2,
+            "sls_workers": 0,
+            "deploy_state": "",
+            "artifact_cache": "",
+            "resume": "true",
+            "state_endpoint_url": "",
+            "regions": "eu-central-1",
+        }
+        sls = ["a/serverless.yml", "b/serverless.yml", "c/serverless.yml"]
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"INPUT_CACHE_DIR": tmp, "GITHUB_SHA": "abc"}
+            with patch.dict(os.environ, env):
+                deployments, failures = gh_action_interface.deploy(
+                    sls, inputs, {}
+                )
+                self.assertEqual(list(failures), ["b/serverless.yml"])
+                failing.clear()
+                service_mock.reset_mock()
+                deployments, failures = gh_action_interface.deploy(
+                    sls, inputs, {}
+                )
+        self.assertEqual(failures, {})
+        self.assertEqual(
+            [x[0][0] for x in service_mock.call_args_list],
+            ["b/serverless.yml"],
+        )
+        self.assertEqual(
+            sorted(x["service"] for x in deployments),
+            ["a/serverless.yml", "b/serverless.yml", "c/serverless.yml"],
+        )
+
+    @patch("builtins.print")
+    @patch("eb7_sls_helper.src.gh_action_interface.set_output")
+    @patch("eb7_sls_helper.src.gh_action_interface.test_service")
+    @patch("eb7_sls_helper.src.gh_action_interface.set_profile")
+    def test_test_runs_all_suites(
+        self, profile_mock, service_mock, output_mock, print_mock
+    ):
+        def test_service(service, inputs, cache):
+            if service == "a/serverless.yml":
+                time.sleep(0.1)  # finishes last
+                return NewmanResult("cmd", "a passed", b"", 0)
+            if service == "b/serverless.yml":
+                raise KeyError("No API key named dev-b")
+            return NewmanResult("cmd", "c failed", b"", 1)
+
+        service_mock.side_effect = test_service
+        inputs = {
+            "stage": "dev",
+            "profile": "default",
+            "max_parallel": 3,
+            "postman_cache": "",
+        }
+        sls = ["a/serverless.yml", "b/serverless.yml", "c/serverless.yml"]
+        with self.assertRaises(SystemExit):
+            gh_action_interface.test(sls, inputs, {})
+        self.assertEqual(service_mock.call_count, 3)
+        message = output_mock.call_args_list[0][0][1]
+        self.assertEqual(
+            message,
+            "Service: `a/serverless.yml`\na passed\n"
+            + "Service: `b/serverless.yml`\n'No API key named dev-b'\n"
+            + "Service: `c/serverless.yml`\nc failed\n"
+            + "The following services failed their tests:\n"
+            + "`b/serverless.yml`\n`c/serverless.yml`\n",
+        )
+
+    @patch("builtins.print")
+    @patch("eb7_sls_helper.src.gh_action_interface.set_output")
+    @patch("eb7_sls_helper.src.gh_action_interface.stream_command")
+    def test_run_tox_keeps_all_reports(
+        self, stream_mock, output_mock, print_mock
+    ):
+        def stream_command(argv, cwd, env, sinks):
+            for sink in sinks:
+                sink(f"log of {cwd}")
+            return_code = 1 if str(cwd) == "b" else 0
+            return "tox", b"", b"", return_code
+
+        stream_mock.side_effect = stream_command
+        inputs = {"tox_parallel": 2, "tox_env_cache": ""}
+        with self.assertRaises(SystemExit):
+            gh_action_interface.run_tox(["a/sls.yml", "b/sls.yml"], inputs, {})
+        cwds = sorted(str(x[1]["cwd"]) for x in stream_mock.call_args_list)
+        self.assertEqual(cwds, ["a", "b"])
+        message = output_mock.call_args[0][1]
+        self.assertLess(message.index("log of a"), message.index("log of b"))
+        self.assertTrue(
+            message.endswith(
+                "The following services failed their tests:\n`b/sls.yml`\n"
+            )
+        )
+
+    def test_parse_regions(self):
+        parse = gh_action_interface.parse_regions
+        self.assertEqual(parse(""), ["eu-central-1"])
+        self.assertEqual(
+            parse("eu-central-1, us-east-1,eu-central-1"),
+            ["eu-central-1", "us-east-1"],
+        )
+
+    @patch("os.cpu_count", return_value=4)
+    def test_tox_workers(self, cpu_mock):
+        self.assertEqual(gh_action_interface.tox_workers(0, 10), 4)
+        self.assertEqual(gh_action_interface.tox_workers(8, 10), 4)
+        self.assertEqual(gh_action_interface.tox_workers(2, 10), 2)
+        self.assertEqual(gh_action_interface.tox_workers(0, 3), 3)
@@ -0,0 +1,128 @@
+"""Test of the change impact graph"""
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from eb7_sls_helper.src import impact
+from eb7_sls_helper.src.discovery import DefinitionIndex
+from eb7_sls_helper.src.impact import ImpactGraph
+
+SERVICE_A = """service: a
+provider:
+  name: aws
+  runtime: python3.8
+package:
+  patterns:
+    - '!node_modules/**'
+    - ../../libs/shared/**
+    - 42
+    - Ref: Unresolved
+functions:
+  hello:
+    handler: ../../handlers/common/handler.hello
+custom:
+  config: ${file(../../config/${opt:stage}.yml):settings}
+"""
+
+SERVICE_B = """service: b
+provider:
+  name: aws
+  runtime: python3.8
+layers:
+  deps:
+    path: ../../layers/deps
+custom:
+  pythonRequirements:
+    fileName: ../../requirements/b.txt
+"""
+
+FILES = {
+    "services/a/serverless.yml": SERVICE_A,
+    "services/a/requirements.txt": "boto3\n-e ../../libs/common\n",
+    "services/b/serverless.yml": SERVICE_B,
+    "requirements/b.txt": "pyyaml\n-r base.txt\n",
+    "requirements/base.txt": "requests\n",
+    "libs/common/requirements.txt": "-e ../core\n",
+    "services/c/serverless.yml": "service: c\nprovider:\n  name: aws\n",
+}
+
+
+class ImpactGraphTestCase(unittest.TestCase):
+    """Testing ImpactGraph."""
+
+    def setUp(self):
+        """Writes a small monorepo."""
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for name, content in FILES.items():
+            Path(self.root, name).parent.mkdir(parents=True, exist_ok=True)
+            Path(self.root, name).write_text(content)
+        self.index = DefinitionIndex(
+            [x for x in FILES if x.endswith("serverless.yml")],
+            "serverless.yml",
+        )
+        self.cache = Path(self.root, "cache", "impact_graph.json")
+
+    def build(self):
+        """Builds the graph of the monorepo."""
+        return ImpactGraph.build(self.index.definitions, self.cache, self.root)
+
+    def test_dependencies(self):
+        """Asserts that dependencies outside the service are extracted.
+
+        Package patterns that are not strings are ignored.
+        """
+        graph = self.build()
+        self.assertEqual(
+            graph.dependencies["services/a/serverless.yml"],
+            [
+                "config/*.yml",
+                "handlers/common",
+                "libs/common",
+                "libs/core",
+                "libs/shared/**",
+            ],
+        )
+        self.assertEqual(
+            graph.dependencies["services/b/serverless.yml"],
+            [
+                "layers/deps",
+                "requirements/b.txt",
+                "requirements/base.txt",
+            ],
+        )
+        self.assertEqual(graph.dependencies["services/c/serverless.yml"], [])
+
+    def test_affected(self):
+        """Asserts that shared changes select exactly their dependents."""
+        graph = self.build()
+        cases = {
+            "libs/shared/util.py": ["services/a/serverless.yml"],
+            "libs/core/x/y.py": ["services/a/serverless.yml"],
+            "requirements/base.txt": ["services/b/serverless.yml"],
+            "layers/deps/python/lib.py": ["services/b/serverless.yml"],
+            "services/c/handler.py": ["services/c/serverless.yml"],
+            "config/prod.yml": ["services/a/serverless.yml"],
+            "libs/other/util.py": [],
+            "README.md": [],
+        }
+        for changed, expected in cases.items():
+            self.assertEqual(graph.affected([changed], self.index), expected)
+
+    def test_cache(self):
+        """Asserts that only changed services are extracted again."""
+        self.build()
+        Path(self.root, "requirements/base.txt").write_text("-e ../libs/x\n")
+        with patch.object(
+            impact, "_Extractor", wraps=impact._Extractor  # noqa: WPS437
+        ) as mock:
+            graph = self.build()
+        self.assertEqual(
+            [x[0][0] for x in mock.call_args_list],
+            ["services/b/serverless.yml"],
+        )
+        self.assertEqual(
+            graph.affected(["libs/x/y.py"], self.index),
+            ["services/b/serverless.yml"],
+        )
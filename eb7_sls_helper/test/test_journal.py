@@ -0,0 +1,102 @@
+"""Test of the deploy run journal"""
+import tempfile
+import unittest
+from pathlib import Path
+
+from eb7_sls_helper.src.fingerprint import LocalStateStore
+from eb7_sls_helper.src.journal import RunJournal
+
+
+class RunJournalTestCase(unittest.TestCase):
+    """Testing RunJournal."""
+
+    def setUp(self):
+        """Creates a journal in a temporary directory."""
+        self.temp = tempfile.TemporaryDirectory()
+        self.journal = RunJournal.for_run(Path(self.temp.name), "abc", "dev")
+        self.deployment = {
+            "service": "users",
+            "stage": "dev",
+            "endpoints": {"GET": ["www.url.com/a"]},
+        }
+
+    def tearDown(self):
+        """Removes the journal."""
+        self.temp.cleanup()
+
+    def test_empty(self):
+        """Asserts that a missing journal has no completed services."""
+        self.assertEqual(self.journal.completed(), {})
+
+    def test_completed(self):
+        """Asserts that successes are read back and failures are not."""
+        self.journal.record("a/serverless.yml", self.deployment)
+        self.journal.record("b/serverless.yml", error="deploy failed")
+        journal = RunJournal.for_run(Path(self.temp.name), "abc", "dev")
+        self.assertEqual(
+            journal.completed(), {"a/serverless.yml": self.deployment}
+        )
+
+    def test_last_record_wins(self):
+        """Asserts that a later failure replaces an earlier success."""
+        self.journal.record("a/serverless.yml", self.deployment)
+        self.journal.record("a/serverless.yml", error="deploy failed")
+        self.assertEqual(self.journal.completed(), {})
+        self.journal.record("a/serverless.yml", self.deployment)
+        self.assertEqual(list(self.journal.completed()), ["a/serverless.yml"])
+
+    def test_damaged_line(self):
+        """Asserts that a line cut off by a crash is skipped."""
+        self.journal.record("a/serverless.yml", self.deployment)
+        with open(self.journal.path, "a") as file:
+            file.write('{"service": "b/serverless.yml", "succ')
+        with self.assertLogs("eb7_sls_helper.src.journal", "WARNING"):
+            completed = self.journal.completed()
+        self.assertEqual(list(completed), ["a/serverless.yml"])
+
+    def test_keys(self):
+        """Asserts that commits, stages and regions have own journals."""
+        directory = Path(self.temp.name)
+        self.journal.record("a/serverless.yml", self.deployment)
+        runs = (
+            ("abc", "prod", ()),
+            ("def", "dev", ()),
+            ("abc", "dev", ("us-east-1",)),
+        )
+        for commit, stage, regions in runs:
+            journal = RunJournal.for_run(directory, commit, stage, regions)
+            self.assertEqual(journal.completed(), {})
+        journal = RunJournal.for_run(
+            directory, "../x", "a/b", ["../y"], profile="../z"
+        )
+        self.assertEqual(journal.path.parents[3], directory)
+
+    def test_profiles(self):
+        """Asserts that profiles do not share a journal."""
+        store = LocalStateStore(Path(self.temp.name, "state"))
+        for journal_store in (None, store):
+            journal = RunJournal.for_run(
+                Path(self.temp.name), "abc", "dev", (), journal_store, "a"
+            )
+            journal.record("a/serverless.yml", self.deployment)
+            other = RunJournal.for_run(
+                Path(self.temp.name), "abc", "dev", (), journal_store, "b"
+            )
+            self.assertEqual(other.completed(), {})
+
+    def test_store(self):
+        """Asserts that a journal in a state store is read back."""
+        store = LocalStateStore(Path(self.temp.name, "state"))
+        regions = ["us-east-1", "eu-central-1"]
+        journal = RunJournal.for_run(
+            Path(self.temp.name), "abc", "dev", regions, store
+        )
+        journal.record("a/serverless.yml", self.deployment)
+        journal.record("b/serverless.yml", error="deploy failed")
+        self.assertFalse(journal.path.exists())
+        journal = RunJournal.for_run(
+            Path("/nonexistent"), "abc", "dev", regions[::-1], store
+        )
+        self.assertEqual(
+            journal.completed(), {"a/serverless.yml": self.deployment}
+        )
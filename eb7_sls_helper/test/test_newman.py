@@ -0,0 +1,92 @@
+"""Test of the newman helpers"""
+import datetime
+import unittest
+from unittest.mock import patch
+import boto3
+from botocore.stub import Stubber
+from eb7_sls_helper.src.newman import ApiKeyResolver
+from eb7_sls_helper.src.utils import clients
+
+
+def api_key(name, value, enabled=True, day=1):
+    """API key item as returned by get_api_keys."""
+    return {
+        "id": value,
+        "name": name,
+        "value": value,
+        "enabled": enabled,
+        "createdDate": datetime.datetime(2020, 1, day),
+    }
+
+
+class ApiKeyResolverTestCase(unittest.TestCase):
+    """Testing ApiKeyResolver against a stubbed API Gateway."""
+
+    def setUp(self):
+        """Stubs two pages of API keys."""
+        self.client = boto3.client(
+            "apigateway",
+            region_name="eu-central-1",
+            aws_access_key_id="testing",
+            aws_secret_access_key="testing",  # noqa: S106 # stub only
+        )
+        self.stubber = Stubber(self.client)
+        self.stubber.add_response(
+            "get_api_keys",
+            {
+                "items": [
+                    api_key("dev-service-extra", "extra"),
+                    api_key("dev-service", "old", day=1),
+                ],
+                "position": "page2",
+            },
+            {"includeValues": True},
+        )
+        self.stubber.add_response(
+            "get_api_keys",
+            {
+                "items": [
+                    api_key("dev-service", "new", day=2),
+                    api_key("dev-service", "disabled", enabled=False, day=3),
+                    api_key("dev-other", "other"),
+                ]
+            },
+            {"includeValues": True, "position": "page2"},
+        )
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        patcher = patch.object(
+            clients.client_pool, "client", return_value=self.client
+        )
+        self.pool_client = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("eb7_sls_helper.src.newman.add_secrets")
+        self.add_secrets = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_exact_match(self):
+        """Asserts that keys sharing a prefix are told apart."""
+        resolver = ApiKeyResolver()
+        self.assertEqual(resolver.resolve("dev-service", "default"), "new")
+        self.assertEqual(
+            resolver.resolve("dev-service-extra", "default"), "extra"
+        )
+        self.assertEqual(resolver.resolve("dev-other", "default"), "other")
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(
+            [x[0] for x in self.add_secrets.call_args_list],
+            [("new",), ("extra",), ("other",)],
+        )
+
+    def test_missing(self):
+        """Asserts that unknown names raise KeyError."""
+        with self.assertRaises(KeyError):
+            ApiKeyResolver().resolve("prod-service", "default")
+
+    def test_clear(self):
+        """Asserts that clear drops the index."""
+        resolver = ApiKeyResolver()
+        resolver.resolve("dev-service", "default")
+        resolver.clear()
+        with self.assertRaises(Exception):
+            resolver.resolve("dev-service", "default")  # no more stubs
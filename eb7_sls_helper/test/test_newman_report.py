@@ -0,0 +1,110 @@
+"""Test of the newman report parser"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from eb7_sls_helper.src.newman_report import (
+    LatencyStats,
+    load_report,
+    parse_report,
+)
+
+
+def execution(name, method, response_time, errors=(), passed=("ok",)):
+    """Entry of run.executions as written by the JSON reporter."""
+    assertions = [{"assertion": x} for x in passed]
+    assertions += [
+        {"assertion": x, "error": {"name": "AssertionError", "message": m}}
+        for x, m in errors
+    ]
+    return {
+        "item": {"name": name},
+        "request": {
+            "method": method,
+            "url": {
+                "protocol": "https",
+                "host": ["api", "example", "com"],
+                "path": ["dev", name],
+            },
+        },
+        "response": {"code": 200, "responseTime": response_time},
+        "assertions": assertions,
+    }
+
+
+REPORT = {
+    "collection": {"info": {"name": "my-service"}},
+    "run": {
+        "timings": {"started": 1000, "completed": 1600},
+        "executions": [
+            execution("users", "GET", 100),
+            execution("users", "GET", 300),
+            execution(
+                "orders",
+                "POST",
+                50,
+                errors=[("Status code is 201", "expected 500 to equal 201")],
+            ),
+            {
+                "item": {"name": "health"},
+                "request": {"method": "GET", "url": "https://x/health"},
+                "requestError": {"message": "ECONNREFUSED"},
+            },
+        ],
+    },
+}
+
+
+class NewmanReportTestCase(unittest.TestCase):
+    """Testing the parsed newman report."""
+
+    def setUp(self):
+        """Parses the example report."""
+        self.report = parse_report(REPORT)
+
+    def test_results(self):
+        """Test requests, assertions and failures."""
+        self.assertEqual(self.report.collection, "my-service")
+        self.assertEqual(self.report.duration, 600.0)
+        self.assertEqual(len(self.report.requests), 4)
+        self.assertEqual(
+            self.report.requests[0].url, "https://api.example.com/dev/users"
+        )
+        self.assertEqual(self.report.assertion_count, 4)
+        self.assertEqual(self.report.failed_assertion_count, 1)
+        failed = [x.name for x in self.report.failures]
+        self.assertEqual(failed, ["orders", "health"])
+
+    def test_latency(self):
+        """Test latency statistics per request."""
+        latency = self.report.latency()
+        self.assertEqual(
+            latency["GET users"],
+            LatencyStats(2, 100.0, 200.0, 100.0, 300.0, 300.0),
+        )
+        self.assertEqual(latency["POST orders"].samples, 1)
+        self.assertNotIn("GET health", latency)
+
+    def test_summary(self):
+        """Test the compact summary."""
+        summary = self.report.summary()
+        self.assertTrue(
+            summary.startswith("4 requests, 2 failed; 4 assertions, 1 failed\n")
+        )
+        self.assertIn(
+            "  - Status code is 201: expected 500 to equal 201", summary
+        )
+        self.assertIn("  - ECONNREFUSED", summary)
+        self.assertIn("| `GET users` | 2 | 200 | 300 | 300 |", summary)
+        json.dumps(self.report.to_dict())
+
+    def test_load_report(self):
+        """Test reading missing, broken and valid report files."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "newman.json"
+            self.assertIsNone(load_report(path))
+            path.write_text("{")
+            self.assertIsNone(load_report(path))
+            path.write_text(json.dumps(REPORT))
+            self.assertEqual(load_report(path), self.report)
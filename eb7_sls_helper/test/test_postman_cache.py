@@ -0,0 +1,98 @@
+"""Test of the Postman cache"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from eb7_sls_helper.src.postman_cache import POSTMAN_API, PostmanCache
+
+
+class FakePostman(object):
+    """Serves collections and listings, recording every request."""
+
+    def __init__(self):
+        """Constructor of FakePostman."""
+        self.requests = []
+        self.updated_at = "2020-01-01T00:00:00.000Z"
+        self.down = False
+
+    def __call__(self, url, headers):
+        """Fetch function passed to PostmanCache."""
+        self.requests.append((url, dict(headers)))
+        if self.down:
+            raise OSError("429 Too Many Requests")
+        if url == f"{POSTMAN_API}/collections":
+            items = [{"id": "c1", "uid": "1-c1", "updatedAt": self.updated_at}]
+            return 200, json.dumps({"collections": items}).encode(), {}
+        if url == "https://example.com/env.json":
+            if headers.get("If-None-Match") == '"v1"':
+                return 304, b"", {}
+            return 200, b'{"name": "dev"}', {"ETag": '"v1"'}
+        body = {"collection": {"info": {"name": self.updated_at}}}
+        return 200, json.dumps(body).encode(), {}
+
+
+class PostmanCacheTestCase(unittest.TestCase):
+    """Testing PostmanCache."""
+
+    def setUp(self):
+        """Creates an empty cache."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.postman = FakePostman()
+
+    def tearDown(self):
+        """Removes the cache."""
+        self.directory.cleanup()
+
+    def cache(self, offline=False):
+        """Cache of a new run."""
+        return PostmanCache(Path(self.directory.name), offline, self.postman)
+
+    def test_version_revalidation(self):
+        """Test collections are downloaded only if their version changed."""
+        path = self.cache().collection("c1", "key")
+        with open(path) as file:
+            document = json.load(file)
+        self.assertEqual(document, {"info": {"name": self.postman.updated_at}})
+        self.assertEqual(
+            self.postman.requests[1],
+            (f"{POSTMAN_API}/collections/c1", {"X-Api-Key": "key"}),
+        )
+        self.postman.requests.clear()
+        self.assertEqual(self.cache().collection("c1", "key"), path)
+        self.assertEqual(
+            [x[0] for x in self.postman.requests],
+            [f"{POSTMAN_API}/collections"],
+        )
+        self.postman.updated_at = "2020-02-01T00:00:00.000Z"
+        self.cache().collection("c1", "key")
+        with open(path) as file:
+            document = json.load(file)
+        self.assertEqual(document["info"]["name"], self.postman.updated_at)
+
+    def test_etag_revalidation(self):
+        """Test other URLs are revalidated with conditional requests."""
+        url = "https://example.com/env.json"
+        path = self.cache().environment(url)
+        self.assertEqual(self.cache().environment(url), path)
+        self.assertEqual(self.postman.requests[1][1], {"If-None-Match": '"v1"'})
+
+    def test_offline(self):
+        """Test offline mode and fallback to cached copies."""
+        with self.assertRaises(RuntimeError):
+            self.cache(offline=True).collection("c1")
+        path = self.cache().collection("c1", "key")
+        self.postman.requests.clear()
+        self.assertEqual(self.cache(offline=True).collection("c1"), path)
+        self.assertEqual(self.postman.requests, [])
+        self.postman.down = True
+        self.assertEqual(self.cache().collection("c1", "key"), path)
+        with self.assertRaises(OSError):
+            self.cache().collection("c2", "key")
+
+    def test_local_file(self):
+        """Test local files are used as they are."""
+        path = str(Path(self.directory.name) / "collection.json")
+        Path(path).write_text("{}")
+        self.assertEqual(self.cache().collection(path), path)
+        self.assertEqual(self.postman.requests, [])
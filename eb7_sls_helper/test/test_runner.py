@@ -0,0 +1,132 @@
+"""Test of the command runner"""
+import asyncio
+import os
+import shlex
+import subprocess  # noqa: S404 # Use of subprocess required
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from eb7_sls_helper.src.utils.runner import (
+    FileSink,
+    arun_command,
+    filtered_sink,
+    run_command,
+    stream_command,
+)
+
+
+class RunnerTestCase(unittest.TestCase):
+    """Testing run_command."""
+
+    def test_result(self):
+        """Asserts that output and return code are captured."""
+        cmd, output, error, return_code = run_command(
+            [sys.executable, "-c", "print('ok')"]
+        )
+        self.assertEqual(output.strip(), b"ok")
+        self.assertEqual(return_code, 0)
+        self.assertEqual(shlex.split(cmd)[1:], ["-c", "print('ok')"])
+
+    def test_check(self):
+        """Asserts that failing commands raise if check is set."""
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_command([sys.executable, "-c", "exit(3)"], check=True)
+        result = run_command([sys.executable, "-c", "exit(3)"])
+        self.assertEqual(result.return_code, 3)
+
+    def test_isolated_cwd_and_env(self):
+        """Asserts that concurrent commands keep their own cwd and env."""
+        cwd = os.getcwd()
+        script = "import os; print(os.getcwd(), os.environ['RUNNER_TEST'])"
+        with tempfile.TemporaryDirectory() as tmp:
+            dirs = []
+            for i in range(8):
+                Path(tmp, str(i)).mkdir()
+                dirs.append(Path(tmp, str(i)).resolve())
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(
+                    pool.map(
+                        lambda i: run_command(
+                            [sys.executable, "-c", script],
+                            cwd=dirs[i],
+                            env={"RUNNER_TEST": str(i)},
+                        ),
+                        range(8),
+                    )
+                )
+        for i, result in enumerate(results):
+            self.assertEqual(
+                result.output.decode().split(), [str(dirs[i]), str(i)]
+            )
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertNotIn("RUNNER_TEST", os.environ)
+
+
+class AsyncRunnerTestCase(unittest.TestCase):
+    """Testing arun_command."""
+
+    def test_gather(self):
+        """Asserts that commands run concurrently on one event loop."""
+
+        async def run_all():
+            return await asyncio.gather(
+                *(
+                    arun_command([sys.executable, "-c", f"print({i})"])
+                    for i in range(4)
+                )
+            )
+
+        results = asyncio.run(run_all())
+        self.assertEqual(
+            [r.output.strip() for r in results], [b"0", b"1", b"2", b"3"]
+        )
+        self.assertTrue(all(r.return_code == 0 for r in results))
+
+    def test_timeout(self):
+        """Asserts that timed out commands are killed and raise."""
+        argv = [sys.executable, "-c", "import time; time.sleep(30)"]
+        with self.assertRaises(subprocess.TimeoutExpired):
+            asyncio.run(arun_command(argv, timeout=0.2))
+
+    def test_check(self):
+        """Asserts that failing commands raise if check is set."""
+        with self.assertRaises(subprocess.CalledProcessError):
+            asyncio.run(
+                arun_command([sys.executable, "-c", "exit(3)"], check=True)
+            )
+
+
+class StreamRunnerTestCase(unittest.TestCase):
+    """Testing stream_command and sinks."""
+
+    script = "import sys\nfor i in range(5): print(i, flush=True)\nsys.exit(1)"
+
+    def test_sinks_and_tail(self):
+        """Asserts that sinks see every line and only the tail is kept."""
+        lines = []
+        result = stream_command(
+            [sys.executable, "-c", self.script],
+            sinks=[lines.append, filtered_sink(lines.append, str.upper)],
+            tail_lines=2,
+        )
+        self.assertEqual(lines[::2], ["0", "1", "2", "3", "4"])
+        self.assertEqual(result.output, b"3\n4\n")
+        self.assertEqual(result.return_code, 1)
+
+    def test_check(self):
+        """Asserts that the tail is attached to the raised error."""
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            stream_command(
+                [sys.executable, "-c", self.script], check=True, tail_lines=1
+            )
+        self.assertEqual(context.exception.output, b"4\n")
+
+    def test_file_sink(self):
+        """Asserts that the file sink writes every line."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "out.log")
+            with FileSink(path) as sink:
+                stream_command([sys.executable, "-c", self.script], sinks=[sink])
+            self.assertEqual(path.read_text(), "0\n1\n2\n3\n4\n")
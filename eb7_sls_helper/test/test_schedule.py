@@ -0,0 +1,159 @@
+"""Test of the dependency-ordered deploy scheduler"""
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from eb7_sls_helper.src.schedule import DeployGraph, UpstreamFailed
+
+DEFINITIONS = {
+    "users/serverless.yml": """
+service: users
+provider:
+  name: aws
+  runtime: python3.8
+resources:
+  Outputs:
+    PoolId:
+      Value: !Ref UserPool
+      Export:
+        Name: ${self:service}-${sls:stage}-PoolId
+""",
+    "orders/serverless.yml": """
+service: orders
+provider:
+  name: aws
+  runtime: python3.8
+  environment:
+    POOL: ${cf:users-${opt:stage, 'dev'}.PoolId}
+""",
+    "billing/serverless.yml": """
+service: billing
+provider:
+  name: aws
+  runtime: python3.8
+  stackName: billing-stack-${sls:stage}
+resources:
+  Resources:
+    Queue:
+      Properties:
+        Pool: !ImportValue users-${sls:stage}-PoolId
+        Other:
+          Fn::ImportValue: external-export
+""",
+    "reports/serverless.yml": """
+service: reports
+provider:
+  name: aws
+  runtime: python3.8
+  environment:
+    ORDERS: ${output:orders.ServiceEndpoint}
+    BILLING: ${cf(eu-west-1):billing-stack-${sls:stage}.QueueUrl}
+    OTHER: ${cf:someone-else-dev.Url}
+""",
+    "standalone/serverless.yml": """
+service: standalone
+provider:
+  name: aws
+  runtime: python3.8
+""",
+}
+
+
+class DeployGraphTestCase(unittest.TestCase):
+    """Testing DeployGraph."""
+
+    def setUp(self):
+        """Writes the definitions."""
+        self.temp = tempfile.TemporaryDirectory()
+        for name, text in DEFINITIONS.items():
+            path = Path(self.temp.name, name)
+            path.parent.mkdir()
+            path.write_text(text)
+        self.graph = DeployGraph.build(
+            sorted(DEFINITIONS), "dev", root=self.temp.name
+        )
+
+    def tearDown(self):
+        """Removes the definitions."""
+        self.temp.cleanup()
+
+    def test_upstreams(self):
+        """Asserts that all kinds of cross-stack references are found."""
+        self.assertEqual(
+            self.graph.upstreams,
+            {
+                "users/serverless.yml": set(),
+                "orders/serverless.yml": {"users/serverless.yml"},
+                "billing/serverless.yml": {"users/serverless.yml"},
+                "reports/serverless.yml": {
+                    "orders/serverless.yml",
+                    "billing/serverless.yml",
+                },
+                "standalone/serverless.yml": set(),
+            },
+        )
+
+    def test_waves(self):
+        """Asserts that every service comes after its upstreams."""
+        self.assertEqual(
+            self.graph.waves(),
+            [
+                ["standalone/serverless.yml", "users/serverless.yml"],
+                ["billing/serverless.yml", "orders/serverless.yml"],
+                ["reports/serverless.yml"],
+            ],
+        )
+
+    def test_missing_definition(self):
+        """Asserts that unreadable definitions have no dependencies."""
+        graph = DeployGraph.build(["missing/serverless.yml"], "dev")
+        self.assertEqual(graph.upstreams, {"missing/serverless.yml": set()})
+
+    def test_run_order(self):
+        """Asserts that services start as soon as their upstreams are done."""
+        events = []
+        standalone_done = threading.Event()
+
+        def task(definition):
+            service = definition.split("/")[0]
+            if service == "users":
+                # Its dependents wait, the independent service does not
+                standalone_done.wait(5)
+            events.append(service)
+            if service == "standalone":
+                standalone_done.set()
+            return service
+
+        results = {
+            definition: future.result()
+            for definition, future in self.graph.run(task, 4)
+        }
+        self.assertEqual(len(results), 5)
+        self.assertEqual(events[:2], ["standalone", "users"])
+        self.assertEqual(events[-1], "reports")
+
+    def test_run_failure(self):
+        """Asserts that only services depending on a failure are skipped."""
+
+        def task(definition):
+            if definition.startswith("billing"):
+                raise RuntimeError("Execution of sls deploy failed")
+            return definition
+
+        errors = {}
+        for definition, future in self.graph.run(task, 2):
+            errors[definition] = future.exception()
+        self.assertIsNone(errors["orders/serverless.yml"])
+        self.assertIsNone(errors["standalone/serverless.yml"])
+        self.assertIsInstance(errors["billing/serverless.yml"], RuntimeError)
+        self.assertIsInstance(errors["reports/serverless.yml"], UpstreamFailed)
+        self.assertIn("billing", str(errors["reports/serverless.yml"]))
+
+    def test_run_cycle(self):
+        """Asserts that services on a cycle are still deployed."""
+        graph = DeployGraph({"a": {"b"}, "b": {"a"}, "c": {"a"}})
+        self.assertEqual(graph.waves(), [["a", "b", "c"]])
+        with self.assertLogs("eb7_sls_helper.src.schedule", "WARNING"):
+            done = [x for x, future in graph.run(str.upper, 2)]
+        self.assertEqual(sorted(done), ["a", "b", "c"])
@@ -0,0 +1,65 @@
+"""Test of the shared tox environments"""
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from eb7_sls_helper.src.utils.tox_env import ToxEnvCache, env_key
+
+TOX_INI = """[tox]
+skipsdist = True
+
+[testenv]
+deps =
+    -r{toxinidir}/requirements.txt
+    pytest
+"""
+
+
+class ToxEnvTestCase(unittest.TestCase):
+    """Testing env keys and work directories."""
+
+    def setUp(self):
+        """Creates two services with the same dependencies."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+        for name in ("a", "b"):
+            (self.root / name).mkdir()
+            (self.root / name / "tox.ini").write_text(TOX_INI)
+            (self.root / name / "requirements.txt").write_text("boto3\n")
+            (self.root / name / "handler.py").write_text(f"# {name}\n")
+
+    def tearDown(self):
+        """Removes the services."""
+        self.directory.cleanup()
+
+    def test_env_key(self):
+        """Test only tox.ini and requirements decide the key."""
+        self.assertEqual(env_key(self.root / "a"), env_key(self.root / "b"))
+        (self.root / "b" / "requirements.txt").write_text("boto3\npyyaml\n")
+        self.assertNotEqual(env_key(self.root / "a"), env_key(self.root / "b"))
+
+    def test_workdir_is_shared_and_serialized(self):
+        """Test services with one key share a work dir, one at a time."""
+        cache = ToxEnvCache(self.root / "cache")
+        workdirs = []
+        active = []
+        overlaps = []
+
+        def run(name):
+            with cache.workdir(self.root / name) as workdir:
+                active.append(name)
+                workdirs.append(workdir)
+                overlaps.append(len(active) > 1)
+                time.sleep(0.05)
+                active.remove(name)
+
+        threads = [threading.Thread(target=run, args=(x,)) for x in "ab"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(workdirs)), 1)
+        self.assertEqual(overlaps, [False, False])
+        self.assertIn("PIP_CACHE_DIR", cache.environment())
@@ -4,9 +4,19 @@ PX-1086:
 - Adds test that access tokens are not leaked when the output from subprocess is logged.
 - The original string's access token was modified, so it's fine to commit it to repo.
 """
+import random
 import unittest
 
-from eb7_sls_helper.src.utils.tox_formatter import format_tox_output
+from eb7_sls_helper.src.utils.tox_formatter import (
+    SECTIONS,
+    ToxLogFormatter,
+    ToxLogParser,
+    colorize_line,
+    format_logs,
+    format_tox_output,
+    sanitize_str,
+    split_logs,
+)
 
 
 class FormatterTestCase(unittest.TestCase):
@@ -27,3 +37,150 @@ class FormatterTestCase(unittest.TestCase):
         self.assertEqual(logged_output.find(token_to_remove), -1)
         # Assert we still have some testing info.
         self.assertIn("1 passed in 3.61s", logged_output)
+
+
+LOG = """py38 installdeps: pytest
+WARNING: The directory '/github/home/.cache/pip' is not writable
+Successfully installed pytest-6.1.2
+============================= test session starts ==============
+test_handler.py::test_status PASSED [ 50%]
+test_handler.py::test_error FAILED [100%]
+----------- coverage: platform linux, python 3.8.6-final-0 -----
+handler.py 21 7 67% 40-62
+_________________________ summary ___________________________
+ py38: commands failed
+"""
+
+
+class SinglePassFormatterTestCase(unittest.TestCase):
+    """Test cases for the single-pass formatter."""
+
+    def test_sections(self):
+        """Test lines are split into sections and colorized."""
+        sections = split_logs(LOG)
+        self.assertTrue(sections["general"].startswith("py38 installdeps"))
+        self.assertTrue(sections["tests"].startswith("====="))
+        self.assertTrue(sections["coverage"].endswith("40-62"))
+        self.assertTrue(sections["final"].endswith("\n py38: commands failed"))
+        formatted = format_logs(LOG)
+        self.assertIn("! WARNING: The directory", formatted)
+        self.assertIn("+ Successfully installed", formatted)
+        self.assertIn("- test_handler.py::test_error FAILED", formatted)
+        self.assertIn("```\n----------- coverage", formatted)
+        self.assertIn("\nhandler.py 21 7 67% 40-62\n", formatted)
+
+    def test_keyword_priority(self):
+        """Test success wins over warnings and errors."""
+        self.assertEqual(colorize_line("error: 0 failed"), "- error: 0 failed")
+        self.assertEqual(colorize_line("Warning: error"), "! Warning: error")
+        self.assertEqual(
+            colorize_line("errors fixed, passed"), "+ errors fixed, passed"
+        )
+        self.assertEqual(colorize_line("nothing"), "nothing")
+
+    def test_streaming(self):
+        """Test feeding lines gives the same result as the whole log."""
+        formatter = ToxLogFormatter()
+        for line in LOG.splitlines():
+            formatter.feed(line)
+        self.assertEqual(formatter.format(), format_logs(LOG))
+
+
+MULTI_ENV_LOG = """py38 create: /service/.tox/py38
+py38 installdeps: pytest
+py38 run-test: commands[0] | pytest
+============================= test session starts ==============
+test_handler.py::test_status PASSED [100%]
+============================== 1 passed in 0.10s ===============
+py39 create: /service/.tox/py39
+py39 installdeps: pytest
+py39 run-test: commands[0] | pytest
+============================= test session starts ==============
+test_handler.py::test_status FAILED [100%]
+----------- coverage: platform linux, python 3.9.1-final-0 -----
+handler.py 21 7 67% 40-62
+_________________________ summary ___________________________
+  py38: commands succeeded
+ERROR:   py39: commands failed
+"""
+
+FUZZ_LINES = [
+    "py38 create: /service/.tox/py38",
+    "py39: commands[0]> pytest",
+    "============================= test session starts ==============",
+    "----------- coverage: platform linux -----",
+    "_________________________ summary ___________________________",
+    "  py38: OK (1.00=setup[0.50]+cmd[0.50] seconds)",
+    "test_handler.py::test_status PASSED",
+    "WARNING: something",
+    "",
+    "=",
+    "--",
+    "_ summary",
+    "py38",
+    "Cloning https://0123abcd@github.com/org/repo.git",
+]
+
+
+class SectionParserTestCase(unittest.TestCase):
+    """Test cases for the tox log state machine."""
+
+    def test_multiple_envs(self):
+        """Test every env gets its own installation and test blocks."""
+        formatted = format_logs(MULTI_ENV_LOG)
+        for env in ("py38", "py39"):
+            summary = f"<summary>Installation packages ({env})</summary>"
+            self.assertIn(summary, formatted)
+        self.assertEqual(formatted.count("test session starts"), 2)
+        self.assertLess(formatted.index("(py38)"), formatted.index("(py39)"))
+        sections = split_logs(MULTI_ENV_LOG)
+        self.assertIn("py39 installdeps: pytest", sections["general"])
+        self.assertNotIn("py39", sections["coverage"])
+
+    def test_missing_sections(self):
+        """Test logs without test, coverage or summary markers."""
+        self.assertEqual(split_logs("")["general"], "")
+        sections = split_logs("ERROR: tox.ini not found\n")
+        self.assertEqual(sections["general"], "ERROR: tox.ini not found")
+        formatted = format_logs("ERROR: tox.ini not found\n")
+        self.assertIn("- ERROR: tox.ini not found", formatted)
+        sections = split_logs(LOG.replace("coverage:", "no cov"))
+        self.assertEqual(sections["coverage"], "")
+        self.assertIn("handler.py 21 7", sections["tests"])
+
+    def test_tox4_summary(self):
+        """Test tox 4 summaries without banner."""
+        text = "py38: commands[0]> pytest\n  py38: OK (1.00 seconds)\n"
+        sections = split_logs(text)
+        self.assertEqual(sections["final"], "  py38: OK (1.00 seconds)")
+
+    def test_real_log(self):
+        """Test the example log of a tox run."""
+        with open("eb7_sls_helper/test/log_example.txt", "r") as fp:
+            text = fp.read().replace("\\n", "\n")
+        sections = split_logs(text)
+        self.assertIn("Successfully installed boto3", sections["general"])
+        self.assertIn("PASSED [100%]", sections["tests"])
+        self.assertIn("TOTAL 21 7 67%", sections["coverage"])
+        self.assertIn("congratulations :)", sections["final"])
+
+    def test_fuzz(self):
+        """Test random logs are split without losing or reordering lines."""
+        rng = random.Random(20)
+        for _ in range(300):
+            size = rng.randint(0, 40)
+            lines = [rng.choice(FUZZ_LINES) for _ in range(size)]
+            text = "\n".join(lines)
+            parser = ToxLogParser()
+            for line in lines:
+                env, section = parser.feed(line)
+                self.assertIn(section, SECTIONS)
+            formatter = ToxLogFormatter()
+            for line in lines:
+                formatter.feed(line)
+            formatted = formatter.format()
+            self.assertNotIn("0123abcd", formatted)
+            position = 0
+            for line in lines:
+                position = formatted.index(sanitize_str(line), position)
+            self.assertEqual(sorted(split_logs(text)), sorted(SECTIONS))
@@ -0,0 +1,143 @@
+"""Test of the pool of warm serverless processes"""
+import json
+import os
+import shutil
+import subprocess  # noqa: S404 # Use of subprocess required
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from eb7_sls_helper.src.utils.warm_pool import WarmPool, WarmPoolUnavailable
+
+# Stands in for sls_warm.js: prints READY, runs one job and echoes it
+FAKE_WARM = """
+import json, os, sys
+print("EB7_SLS_READY", flush=True)
+job = json.loads(sys.stdin.read())
+os.chdir(job["cwd"])
+print(json.dumps([job["argv"], os.getcwd(), job["env"]]))
+sys.exit(int(job["env"].get("EXIT_CODE", "0")))
+"""
+
+# Package with the layout of the serverless framework
+FAKE_SERVERLESS_BIN = """
+process.stdout.write(JSON.stringify([process.argv.slice(2), process.cwd(),
+  process.env.STAGE]) + "\\n");
+process.exitCode = 0;
+"""
+
+
+class WarmPoolTestCase(unittest.TestCase):
+    """Testing WarmPool with a fake warm process."""
+
+    def setUp(self):
+        """Writes the fake warm process."""
+        self.temp = tempfile.TemporaryDirectory()
+        self.script = Path(self.temp.name, "warm.py")
+        self.script.write_text(FAKE_WARM)
+        self.pool = WarmPool(1, node=sys.executable, script=self.script)
+
+    def tearDown(self):
+        """Stops remaining processes."""
+        self.pool.close()
+        self.temp.cleanup()
+
+    def test_run(self):
+        """Asserts that the job runs with its argv, cwd and env."""
+        self.pool.configure(2)
+        lines = []
+        cmd, output, error, return_code = self.pool.run(
+            ["sls", "deploy", "--stage", "dev"],
+            cwd=self.temp.name,
+            env={"AWS_REGION": "eu-west-1"},
+            sinks=[lines.append],
+        )
+        argv, cwd, env = json.loads(output)
+        self.assertEqual(argv, ["deploy", "--stage", "dev"])
+        self.assertEqual(Path(cwd), Path(self.temp.name).resolve())
+        self.assertEqual(env, {"AWS_REGION": "eu-west-1"})
+        self.assertEqual(return_code, 0)
+        self.assertEqual(cmd, "sls deploy --stage dev")
+        self.assertEqual(len(lines), 1)
+
+    def test_replaces_used_processes(self):
+        """Asserts that every command gets a fresh process."""
+        for _ in range(3):
+            result = self.pool.run(["sls", "info"], cwd=self.temp.name)
+            self.assertEqual(json.loads(result.output)[0], ["info"])
+        self.assertEqual(len(self.pool._spares), 1)
+
+    def test_check(self):
+        """Asserts that failing commands raise if check is set."""
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.pool.run(["sls"], env={"EXIT_CODE": "3"}, check=True)
+        result = self.pool.run(["sls"], env={"EXIT_CODE": "3"})
+        self.assertEqual(result.return_code, 3)
+
+    def test_unavailable(self):
+        """Asserts that the pool disables itself if it cannot start."""
+        self.script.write_text("print('EB7_SLS_UNAVAILABLE missing')")
+        pool = WarmPool(1, node=sys.executable, script=self.script)
+        with self.assertRaises(WarmPoolUnavailable):
+            pool.run(["sls", "deploy"])
+        self.assertFalse(pool.enabled)
+        with self.assertRaises(WarmPoolUnavailable):
+            pool.run(["sls", "deploy"])
+
+    def test_missing_node(self):
+        """Asserts that a missing executable disables the pool."""
+        pool = WarmPool(node=str(Path(self.temp.name, "missing")))
+        pool.configure(1)
+        self.assertFalse(pool.enabled)
+
+    def test_other_commands(self):
+        """Asserts that only sls commands are run in the pool."""
+        with self.assertRaises(WarmPoolUnavailable):
+            self.pool.run(["tox"])
+        self.assertTrue(self.pool.enabled)
+
+
+@unittest.skipUnless(shutil.which("node"), "requires node")
+class WarmScriptTestCase(unittest.TestCase):
+    """Testing sls_warm.js with a fake serverless package."""
+
+    def setUp(self):
+        """Installs the fake package into a temporary node_modules."""
+        self.temp = tempfile.TemporaryDirectory()
+        self.modules = Path(self.temp.name, "node_modules")
+        package = self.modules / "serverless"
+        (package / "bin").mkdir(parents=True)
+        (package / "bin" / "sls.js").write_text(FAKE_SERVERLESS_BIN)
+        manifest = {"name": "serverless", "bin": {"sls": "bin/sls.js"}}
+        (package / "package.json").write_text(json.dumps(manifest))
+        self.service = Path(self.temp.name, "service")
+        self.service.mkdir()
+
+    def tearDown(self):
+        """Removes the fake package."""
+        self.temp.cleanup()
+
+    def test_runs_serverless(self):
+        """Asserts that sls runs in the warm process like a subprocess."""
+        pool = WarmPool(1)
+        with patch.dict(os.environ, {"NODE_PATH": str(self.modules)}):
+            result = pool.run(
+                ["sls", "deploy"], cwd=self.service, env={"STAGE": "dev"}
+            )
+        pool.close()
+        argv, cwd, stage = json.loads(result.output)
+        self.assertEqual(argv, ["deploy"])
+        self.assertEqual(Path(cwd), self.service.resolve())
+        self.assertEqual(stage, "dev")
+        self.assertEqual(result.return_code, 0)
+
+    def test_missing_serverless(self):
+        """Asserts that the pool falls back without the framework."""
+        pool = WarmPool(1)
+        with tempfile.TemporaryDirectory() as empty:
+            with patch.dict(os.environ, {"NODE_PATH": empty}):
+                with self.assertRaises(WarmPoolUnavailable):
+                    pool.run(["sls", "deploy"], cwd=self.service)
+        self.assertFalse(pool.enabled)